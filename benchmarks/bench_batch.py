@@ -0,0 +1,56 @@
+""" Benchmarks of writing batches of submission scripts """
+
+import pytest
+
+from divvy import ComputingConfiguration
+from benchmarks.conftest import FULL_BATCH_SIZES, make_pool, make_template
+
+BATCH_SIZES = [1, 100, 1000] + [
+    pytest.param(n, marks=pytest.mark.full) for n in FULL_BATCH_SIZES
+]
+
+
+def _jobs(folder, n_jobs):
+    return [
+        (folder.join("job{}.sub".format(i)).strpath, {"code": "run {}".format(i)})
+        for i in range(n_jobs)
+    ]
+
+
+@pytest.fixture
+def batch_dcc(config_factory):
+    pool = make_pool(10)
+    return ComputingConfiguration(
+        filepath=config_factory(10, 10, make_template(1024, pool))
+    )
+
+
+@pytest.mark.benchmark(group="write_scripts")
+@pytest.mark.parametrize("n_jobs", BATCH_SIZES)
+def bench_write_scripts(benchmark, batch_dcc, tmpdir, n_jobs):
+    jobs = _jobs(tmpdir, n_jobs)
+    rounds = 3 if n_jobs >= 1000 else 10
+    paths = benchmark.pedantic(batch_dcc.write_scripts, args=(jobs,), rounds=rounds)
+    assert len(paths) == n_jobs
+
+
+@pytest.mark.benchmark(group="write_scripts-threads")
+@pytest.mark.parametrize("n_jobs", [1000] + BATCH_SIZES[3:])
+def bench_write_scripts_threads(benchmark, batch_dcc, tmpdir, n_jobs):
+    jobs = _jobs(tmpdir, n_jobs)
+    paths = benchmark.pedantic(
+        batch_dcc.write_scripts, args=(jobs,), kwargs={"workers": 4}, rounds=3
+    )
+    assert len(paths) == n_jobs
+
+
+@pytest.mark.benchmark(group="write_script-loop")
+@pytest.mark.parametrize("n_jobs", [1, 100, 1000])
+def bench_write_script_loop(benchmark, batch_dcc, tmpdir, n_jobs):
+    """The one-call-per-script baseline that write_scripts is compared with"""
+    jobs = _jobs(tmpdir, n_jobs)
+
+    def write_each():
+        return [batch_dcc.write_script(path, extra) for path, extra in jobs]
+
+    assert len(benchmark.pedantic(write_each, rounds=3)) == n_jobs
@@ -0,0 +1,57 @@
+""" Benchmarks of the command-line interface """
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from divvy.compute import main
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cli_env(config_factory):
+    env = dict(os.environ, DIVCFG=config_factory(10, 10))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO, env.get("PYTHONPATH")]))
+    return env
+
+
+def _run(args, env):
+    subprocess.run(
+        [sys.executable, "-m", "divvy"] + args,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@pytest.mark.benchmark(group="cli-cold-start")
+def bench_cli_version(benchmark, cli_env):
+    """Interpreter start-up and import of the command-line interface"""
+    benchmark.pedantic(_run, args=(["--version"], cli_env), rounds=10)
+
+
+@pytest.mark.benchmark(group="cli-cold-start")
+def bench_cli_write(benchmark, cli_env, tmpdir):
+    """A whole `divvy write` run, from a new interpreter"""
+    args = ["write", "-o", tmpdir.join("job.sub").strpath, "-c", "code=ls"]
+    benchmark.pedantic(_run, args=(args, cli_env), rounds=10)
+    assert tmpdir.join("job.sub").check()
+
+
+@pytest.mark.benchmark(group="cli-main")
+def bench_cli_main(benchmark, cli_env, monkeypatch, tmpdir):
+    """`divvy write` through `divvy.compute.main`, in this interpreter"""
+    monkeypatch.setenv("DIVCFG", cli_env["DIVCFG"])
+    argv = ["divvy", "write", "-o", tmpdir.join("job.sub").strpath, "-c", "code=ls"]
+
+    def run_main():
+        monkeypatch.setattr(sys, "argv", argv)
+        try:
+            main()
+        except SystemExit as e:
+            assert not e.code
+
+    benchmark(run_main)
@@ -0,0 +1,42 @@
+""" Benchmarks of configuration loading and package activation """
+
+import pytest
+
+from divvy import ComputingConfiguration
+from divvy.const import CONFIG_CACHE_DIR_VARNAME
+
+PACKAGES = [10, 100, 1000]
+ADAPTERS = [10, 100]
+
+
+@pytest.mark.benchmark(group="load")
+@pytest.mark.parametrize("n_adapters", ADAPTERS)
+@pytest.mark.parametrize("n_packages", PACKAGES)
+def bench_load(benchmark, config_factory, n_packages, n_adapters):
+    path = config_factory(n_packages, n_adapters)
+    dcc = benchmark(ComputingConfiguration, filepath=path, use_cache=False)
+    assert len(dcc.list_compute_packages()) == n_packages + 1
+
+
+@pytest.mark.benchmark(group="load-cached")
+@pytest.mark.parametrize("n_packages", PACKAGES)
+def bench_load_cached(benchmark, config_factory, monkeypatch, tmpdir, n_packages):
+    monkeypatch.setenv(CONFIG_CACHE_DIR_VARNAME, tmpdir.join("cache").strpath)
+    path = config_factory(n_packages, 10)
+    ComputingConfiguration(filepath=path, use_cache=True)
+    dcc = benchmark(ComputingConfiguration, filepath=path, use_cache=True)
+    assert len(dcc.list_compute_packages()) == n_packages + 1
+
+
+@pytest.mark.benchmark(group="activate")
+@pytest.mark.parametrize("n_packages", PACKAGES)
+def bench_activate_package(benchmark, config_factory, n_packages):
+    dcc = ComputingConfiguration(filepath=config_factory(n_packages, 10))
+    names = ["pkg{}".format(i) for i in range(n_packages)]
+
+    def activate_all():
+        for name in names:
+            dcc.activate_package(name)
+
+    benchmark(activate_all)
+    assert dcc.compute.partition == "standard"
@@ -0,0 +1,62 @@
+""" Benchmarks of template rendering and single script writing """
+
+import pytest
+
+from divvy import ComputingConfiguration, SubmissionTemplate, write_submit_script
+from benchmarks.conftest import make_pool, make_template
+
+TEMPLATE_SIZES = [1024, 32 * 1024, 1024 * 1024]
+POOL_SIZES = [10, 1000, 10000]
+
+
+@pytest.mark.benchmark(group="render")
+@pytest.mark.parametrize("n_keys", POOL_SIZES)
+@pytest.mark.parametrize("size", TEMPLATE_SIZES)
+def bench_render(benchmark, size, n_keys):
+    pool = make_pool(n_keys)
+    template = SubmissionTemplate(make_template(size, pool))
+    content = benchmark(template.render, pool)
+    assert "{VAR0}" not in content
+
+
+@pytest.mark.benchmark(group="compile")
+@pytest.mark.parametrize("size", TEMPLATE_SIZES)
+def bench_compile(benchmark, size):
+    content = make_template(size, make_pool(100))
+    template = benchmark(SubmissionTemplate, content)
+    assert template.slot_names
+
+
+@pytest.mark.benchmark(group="write_submit_script")
+@pytest.mark.parametrize("size", TEMPLATE_SIZES)
+def bench_write_submit_script(benchmark, tmpdir, size):
+    pool = make_pool(100)
+    template = SubmissionTemplate(make_template(size, pool))
+    path = tmpdir.join("job.sub").strpath
+    assert benchmark(write_submit_script, path, template, pool) == path
+
+
+@pytest.mark.benchmark(group="write_script")
+@pytest.mark.parametrize("n_keys", POOL_SIZES)
+@pytest.mark.parametrize("size", TEMPLATE_SIZES)
+def bench_write_script(benchmark, config_factory, tmpdir, size, n_keys):
+    pool = make_pool(n_keys)
+    dcc = ComputingConfiguration(
+        filepath=config_factory(10, 10, make_template(size, pool))
+    )
+    path = tmpdir.join("job.sub").strpath
+    extra_vars = [{"compute": {"var0": "adapted"}}, pool]
+    assert benchmark(dcc.write_script, path, extra_vars) == path
+
+
+@pytest.mark.benchmark(group="render_columns")
+@pytest.mark.parametrize("n_rows", [1000, pytest.param(100000, marks=pytest.mark.full)])
+def bench_render_columns(benchmark, n_rows):
+    np = pytest.importorskip("numpy")
+    from divvy.columnar import render_columns
+
+    pool = make_pool(10)
+    template = SubmissionTemplate(make_template(1024, pool))
+    table = {name: np.arange(n_rows) for name in list(pool)[:5]}
+    table["code"] = np.array(["run {}".format(i) for i in range(n_rows)])
+    assert len(benchmark(render_columns, template, table, pool)) == n_rows
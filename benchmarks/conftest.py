@@ -0,0 +1,112 @@
+""" Synthetic configurations, templates and variables for the benchmarks """
+
+import os
+import random
+import string
+
+import pytest
+
+# Sizes only measured with --full, as they take minutes rather than seconds
+FULL_BATCH_SIZES = [10000, 100000]
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--full",
+        action="store_true",
+        default=False,
+        help="Also run the largest, slowest benchmark sizes",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--full"):
+        return
+    skip = pytest.mark.skip(reason="only measured with --full")
+    for item in items:
+        if "full" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "full: slow benchmark, run with --full")
+
+
+def make_pool(n_keys, seed=0):
+    """
+    Variables pool with the given number of keys.
+
+    :param int n_keys: number of variables
+    :param int seed: random seed, for reproducible values
+    :return dict[str, str]: variable name to value
+    """
+    rng = random.Random(seed)
+    return {
+        "var{}".format(i): "".join(rng.choice(string.ascii_letters) for _ in range(12))
+        for i in range(n_keys)
+    }
+
+
+def make_template(size, pool, slot_every=64):
+    """
+    Submission template of about the given size, with a slot for a pool
+    variable every `slot_every` characters.
+
+    :param int size: template size in bytes
+    :param Mapping pool: variables whose names are used for the slots
+    :param int slot_every: characters per slot
+    :return str: template content
+    """
+    names = [k.upper() for k in pool] or ["CODE"]
+    lines = ["#!/bin/bash"]
+    total = len(lines[0])
+    i = 0
+    while total < size:
+        line = "#SBATCH --opt{}={{{}}} {}".format(
+            i, names[i % len(names)], "x" * max(0, slot_every - 24)
+        )
+        lines.append(line)
+        total += len(line) + 1
+        i += 1
+    lines.append("{CODE}")
+    return "\n".join(lines) + "\n"
+
+
+def make_config(folder, n_packages, n_adapters, template="#!/bin/bash\n{CODE}\n"):
+    """
+    Write a divvy configuration file with many packages and adapters.
+
+    :param str folder: folder to write the configuration and template to
+    :param int n_packages: number of compute packages, besides 'default'
+    :param int n_adapters: number of adapters
+    :param str template: content of the submission template all packages use
+    :return str: path to the configuration file
+    """
+    with open(os.path.join(folder, "bench.sub"), "w") as f:
+        f.write(template)
+    lines = ["adapters:"]
+    lines += ["  VAR{0}: compute.var{0}".format(i) for i in range(n_adapters)]
+    lines.append("compute_packages:")
+    for name in ["default"] + ["pkg{}".format(i) for i in range(n_packages)]:
+        lines += [
+            "  {}:".format(name),
+            "    submission_template: bench.sub",
+            "    submission_command: sh",
+            "    partition: standard",
+            "    mem: 4G",
+        ]
+    path = os.path.join(folder, "divvy_config.yaml")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+@pytest.fixture
+def config_factory(tmpdir):
+    """Make synthetic configuration files in a temporary folder"""
+
+    def factory(n_packages, n_adapters, template="#!/bin/bash\n{CODE}\n"):
+        folder = tmpdir.mkdir("cfg{}_{}".format(n_packages, n_adapters))
+        return make_config(folder.strpath, n_packages, n_adapters, template)
+
+    return factory
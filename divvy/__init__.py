@@ -5,16 +5,105 @@ will provide a logging infrastructure for all of the project's modules.
 Individual modules and classes may provide separate configuration on a more
 local level, but this will at least provide a foundation.
 
+The public classes and functions are imported from their modules on first
+access, rather than with the package, so that e.g. the command-line interface
+only pays for the imports it uses. Python versions without module-level
+__getattr__ (PEP 562, before 3.7) import them with the package instead.
+
 """
 
-import logmuse
+import logging
+import sys
+from importlib import import_module
+
 from ._version import __version__
-from .compute import ComputingConfiguration, select_divvy_config
 from .const import *
-from .utils import write_submit_script
+from .exceptions import *
+
+# Public name to the module that provides it
+_LAZY_ATTRS = {
+    "AdapterPlan": ".adapters",
+    "BundleWriter": ".writer",
+    "CacheInfo": ".template",
+    "ComputingConfiguration": ".compute",
+    "ConfigCache": ".config_cache",
+    "ConfigRegistry": ".registry",
+    "ConfigResolver": ".compose",
+    "DivvyServer": ".server",
+    "JobLedger": ".ledger",
+    "PackageReport": ".lint",
+    "RenderManifest": ".manifest",
+    "ScriptWriter": ".writer",
+    "SubmissionJournal": ".throttle",
+    "SubmissionResult": ".submission",
+    "SubmissionTemplate": ".template",
+    "SubmissionThrottle": ".throttle",
+    "TemplateCache": ".template",
+    "VariableScope": ".template",
+    "select_divvy_config": ".compute",
+    "iter_variable_groups": ".inputs",
+    "pack_jobs": ".packing",
+    "parse_job_id": ".submission",
+    "submit_scripts": ".submission",
+    "write_submit_script": ".utils",
+}
+
+__classes__ = [
+    "AdapterPlan",
+    "BundleWriter",
+    "CacheInfo",
+    "ComputingConfiguration",
+    "ConfigCache",
+    "ConfigRegistry",
+    "ConfigResolver",
+    "DivvyServer",
+    "JobLedger",
+    "PackageReport",
+    "RenderManifest",
+    "ScriptWriter",
+    "SubmissionJournal",
+    "SubmissionResult",
+    "SubmissionTemplate",
+    "SubmissionThrottle",
+    "TemplateCache",
+    "VariableScope",
+]
+__functions__ = [
+    "select_divvy_config",
+    "iter_variable_groups",
+    "pack_jobs",
+    "parse_job_id",
+    "submit_scripts",
+]
+__all__ = __classes__ + __functions__ + ["write_submit_script"]
+
+_logger_initialized = False
+
+
+def __getattr__(name):
+    global _logger_initialized
+    try:
+        module_name = _LAZY_ATTRS[name]
+    except KeyError:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    if not _logger_initialized:
+        # unless e.g. the command-line interface has set it up already
+        if not logging.getLogger(__name__).handlers:
+            import logmuse
+
+            logmuse.init_logger("divvy")
+        _logger_initialized = True
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
 
-__classes__ = ["ComputingConfiguration"]
-__functions__ = ["select_divvy_config"]
-__all__ = __classes__ + __functions__ + [write_submit_script.__name__]
 
-logmuse.init_logger("divvy")
+if sys.version_info < (3, 7):
+    # No module __getattr__ before PEP 562, so resolve every name up front.
+    for _name in _LAZY_ATTRS:
+        __getattr__(_name)
+    del _name
@@ -0,0 +1,115 @@
+""" Adapter resolution for populating submission templates """
+
+import logging
+from collections import OrderedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["AdapterPlan"]
+
+
+class AdapterPlan(object):
+    """
+    Adapters compiled for repeated resolution against extra variables.
+
+    An adapter maps a template variable name to a dot-separated path, the
+    first element of which is a namespace, e.g. `MEM: compute.mem`. The paths
+    are split once here and the adapters are indexed by namespace, so that
+    resolving them for a job only matches each namespace against the
+    variable groups once.
+
+    :param Mapping[str, str] adapters: template variable name to path in the
+        extra variables, as in the 'adapters' section of divvy configuration
+    """
+
+    def __init__(self, adapters=None):
+        self._adapters = []
+        self._by_namespace = OrderedDict()
+        for name, path in (adapters or {}).items():
+            split_path = tuple(path.split("."))
+            self._adapters.append((name, split_path[0], split_path))
+            self._by_namespace.setdefault(split_path[0], []).append((name, split_path))
+
+    def __bool__(self):
+        return bool(self._adapters)
+
+    __nonzero__ = __bool__
+
+    def __len__(self):
+        return len(self._adapters)
+
+    def __repr__(self):
+        return "{}({})".format(
+            self.__class__.__name__,
+            ", ".join("{}={}".format(n, ".".join(p)) for n, _, p in self._adapters),
+        )
+
+    @property
+    def names(self):
+        """
+        Template variables the adapters fill.
+
+        :return list[str]: variable names, in adapter order
+        """
+        return [name for name, _, _ in self._adapters]
+
+    @property
+    def namespaces(self):
+        """
+        Namespaces the adapters source values from.
+
+        :return list[str]: namespaces, in order of first appearance
+        """
+        return list(self._by_namespace.keys())
+
+    def resolve(self, extra_vars):
+        """
+        Resolve the adapters against groups of extra variables.
+
+        A group is claimed by a namespace if the namespace occurs in the
+        group's first key. For each adapter the value is taken from the first
+        claimed group that defines the adapter's path.
+
+        :param Sequence[Mapping] extra_vars: groups of variables, highest
+            priority first
+        :return (list[(str, object)], set[str]): adapted name-value pairs, in
+            adapter order, and the namespaces that claimed any group
+        """
+        first_keys = [next(iter(ev)) if len(ev) > 0 else None for ev in extra_vars]
+        claims = {}
+        for namespace in self._by_namespace:
+            groups = [
+                ev
+                for ev, k in zip(extra_vars, first_keys)
+                if k is not None and namespace in k
+            ]
+            if groups:
+                claims[namespace] = groups
+        adapted = []
+        for name, namespace, split_path in self._adapters:
+            for group in claims.get(namespace, ()):
+                value = _get_from_dict(group, split_path)
+                if value is not None:
+                    adapted.append((name, value))
+                    _LOGGER.debug(
+                        "adapted {}: ({}={})".format(name, ".".join(split_path), value)
+                    )
+                    break
+        return adapted, set(claims)
+
+
+def _get_from_dict(map, attrs):
+    """
+    Get value from a possibly mapping using a list of its attributes
+
+    :param collections.Mapping map: mapping to retrieve values from
+    :param Iterable[str] attrs: a list of attributes
+    :return: value found in the the requested attribute or
+        None if one of the keys does not exist
+    """
+    for a in attrs:
+        try:
+            map = map[a]
+        except KeyError:
+            return None
+    return map
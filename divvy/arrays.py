@@ -0,0 +1,149 @@
+""" Array job scripts: many tasks submitted with one scheduler call """
+
+import logging
+import os
+import re
+from collections import namedtuple
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["ArrayScheduler", "ARRAY_SCHEDULERS", "get_array_scheduler"]
+
+ArrayScheduler = namedtuple(
+    "ArrayScheduler", ["name", "directive_prefix", "array_directive", "task_id_var"]
+)
+
+# Keyed by submission command; array_directive is formatted with the number
+# of tasks and the job name
+ARRAY_SCHEDULERS = {
+    "sbatch": ArrayScheduler(
+        "slurm", "#SBATCH", "#SBATCH --array=1-{n}", "SLURM_ARRAY_TASK_ID"
+    ),
+    "qsub": ArrayScheduler("sge", "#$", "#$ -t 1-{n}", "SGE_TASK_ID"),
+    "bsub": ArrayScheduler("lsf", "#BSUB", "#BSUB -J {name}[1-{n}]", "LSB_JOBINDEX"),
+}
+
+# Prefix of the shell variables that hold the per-task values
+TASK_VAR_PREFIX = "DIVVY_"
+
+_MARKER = "\x00{}\x00"
+_MARKER_REGEX = re.compile("\x00([^\x00]*)\x00")
+
+
+def get_array_scheduler(submission_command):
+    """
+    Determine the array job flavor for a submission command.
+
+    :param str submission_command: command that submits job scripts
+    :return ArrayScheduler: array job specification for the scheduler
+    :raise ValueError: if the command is not a known scheduler
+    """
+    program = os.path.basename(submission_command.split()[0])
+    try:
+        return ARRAY_SCHEDULERS[program]
+    except KeyError:
+        raise ValueError(
+            "Array jobs need a scheduler submission command ({}), not: '{}'".format(
+                ", ".join(ARRAY_SCHEDULERS), submission_command
+            )
+        )
+
+
+def render_array_script(template, task_values, scheduler, params_path, job_name):
+    """
+    Render an array job script and the per-task parameter lines.
+
+    Slots that are filled the same way for every task are rendered in the
+    script as usual. Slots that differ between tasks become shell variables,
+    set from the task's line of the parameter file, and a slot that makes up
+    a whole line is run with eval, as it holds a command, e.g. {CODE}.
+
+    :param divvy.SubmissionTemplate template: compiled template
+    :param list[dict[str, str]] task_values: text for each filled slot, per
+        task, as given by `SubmissionTemplate.values`
+    :param ArrayScheduler scheduler: array job flavor
+    :param str params_path: path the script reads the parameter file from
+    :param str job_name: array job name, for schedulers that need one
+    :return (str, list[str]): script content and parameter file lines
+    :raise ValueError: if a slot that differs between tasks is used in a
+        scheduler directive line
+    """
+    if not task_values:
+        raise ValueError("An array job needs at least one task")
+    first = task_values[0]
+    varying = [
+        n
+        for n in template.slot_names
+        if any(tv.get(n) != first.get(n) for tv in task_values[1:])
+    ]
+    fixed = {n: v for n, v in first.items() if n not in varying}
+    fixed.update({n: _MARKER.format(n) for n in varying})
+    lines = template.fill(fixed).split("\n")
+    for i, line in enumerate(lines):
+        if "\x00" not in line:
+            continue
+        if line.lstrip().startswith(scheduler.directive_prefix):
+            raise ValueError(
+                "Scheduler directives can't vary between array tasks: {}".format(
+                    ", ".join(_MARKER_REGEX.findall(line))
+                )
+            )
+        stripped = line.strip()
+        match = _MARKER_REGEX.match(stripped)
+        if match and match.end() == len(stripped):
+            lines[i] = line.replace(
+                stripped, 'eval "${}"'.format(_task_var(match.group(1)))
+            )
+        else:
+            lines[i] = _MARKER_REGEX.sub(
+                lambda m: "${{{}}}".format(_task_var(m.group(1))), line
+            )
+    header_end = _directives_end(lines, scheduler.directive_prefix)
+    lines[header_end:header_end] = [
+        scheduler.array_directive.format(n=len(task_values), name=job_name),
+        "# Per-task variables, from the parameter file line for this task",
+        'eval "$(sed -n "${{{}}}p" {})"'.format(
+            scheduler.task_id_var, _ansi_quote(params_path)
+        ),
+    ]
+    params = [
+        " ".join(
+            "{}={}".format(_task_var(n), _ansi_quote(tv.get(n, "{" + n + "}")))
+            for n in varying
+        )
+        for tv in task_values
+    ]
+    return "\n".join(lines), params
+
+
+def _task_var(slot_name):
+    return TASK_VAR_PREFIX + re.sub(r"\W", "_", slot_name)
+
+
+def _directives_end(lines, directive_prefix):
+    """Index after the script's scheduler directives, or after the shebang."""
+    end = 1 if lines and lines[0].startswith("#!") else 0
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(directive_prefix):
+            end = i + 1
+        elif stripped and not stripped.startswith("#"):
+            break
+    return end
+
+
+def _ansi_quote(text):
+    """Quote text as a single bash word that fits on a single line."""
+    escaped = []
+    for c in text:
+        if c in "\\'":
+            escaped.append("\\" + c)
+        elif c == "\n":
+            escaped.append("\\n")
+        elif c == "\t":
+            escaped.append("\\t")
+        elif ord(c) < 32 or ord(c) == 127:
+            escaped.append("\\x{:02x}".format(ord(c)))
+        else:
+            escaped.append(c)
+    return "$'" + "".join(escaped) + "'"
@@ -0,0 +1,137 @@
+""" Bulk rendering of submission templates for columnar job tables """
+
+import logging
+from collections.abc import Mapping
+
+from .template import slot_text
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["render_columns", "table_columns"]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Rendering columnar job tables requires numpy")
+    return numpy
+
+
+def table_columns(table):
+    """
+    Get the columns of a job table, as arrays of the same length.
+
+    :param Mapping[str, Sequence] | pandas.DataFrame table: one column per
+        template variable, e.g. a dict of numpy arrays or lists
+    :return (dict[str, numpy.ndarray], int): column arrays by name, and the
+        number of rows
+    :raise ValueError: if the columns are of different lengths
+    """
+    np = _numpy()
+    if isinstance(table, Mapping):
+        names = list(table.keys())
+    elif hasattr(table, "columns"):
+        # pandas.DataFrame, or anything else that's indexed by column name
+        names = list(table.columns)
+    else:
+        raise TypeError(
+            "A job table is a mapping of columns or a DataFrame, not: {}".format(
+                type(table).__name__
+            )
+        )
+    columns = {}
+    for name in names:
+        column = table[name]
+        columns[name] = _as_array(np, getattr(column, "values", column))
+    lengths = {len(c) for c in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(
+            "Job table columns are of different lengths: {}".format(
+                ", ".join("{} ({})".format(n, len(c)) for n, c in columns.items())
+            )
+        )
+    return columns, lengths.pop() if lengths else 0
+
+
+def render_columns(template, table, data=None):
+    """
+    Populate a template once per row of a job table, in bulk.
+
+    The template's literal segments, and the slots that are filled the same
+    way for every row, are joined once; then each remaining slot's column is
+    converted to text and concatenated with the segments as a whole array.
+    Per row, the result is the same as rendering the template with the row's
+    values layered over the shared data, except that values are always put
+    in as they are, even one that completes another placeholder.
+
+    :param divvy.SubmissionTemplate template: compiled template
+    :param Mapping[str, Sequence] | pandas.DataFrame table: one column per
+        template variable; column names are matched case-insensitively, like
+        variable names, and take precedence over the shared data
+    :param Mapping data: a "pool" of variables shared by all rows
+    :return list[str]: rendered content for each row, in order
+    """
+    np = _numpy()
+    columns, n_rows = table_columns(table)
+    by_slot = {}
+    for name, column in columns.items():
+        by_slot.setdefault(str(name).upper(), column)
+    shared = template.values(data or {})
+    # Literal text between the slots that vary by row, with the other slots
+    # filled in, or left in place if nothing fills them.
+    segments = [""]
+    varying = []
+    for part, name in template.iter_parts():
+        if name is not None and name in by_slot:
+            varying.append(by_slot[name])
+            segments.append("")
+        else:
+            segments[-1] += shared.get(name, part) if name is not None else part
+    _LOGGER.debug(
+        "Rendering {} rows with {} varying slots".format(n_rows, len(varying))
+    )
+    pieces = [segments[0]]
+    for column, literal in zip(varying, segments[1:]):
+        pieces.append(_as_text(np, column))
+        if literal:
+            pieces.append(literal)
+    # Concatenate neighbours pairwise, so that each character is copied
+    # about log2(len(pieces)) times rather than once per varying slot
+    while len(pieces) > 1:
+        merged = [a + b for a, b in zip(pieces[::2], pieces[1::2])]
+        if len(pieces) % 2:
+            merged.append(pieces[-1])
+        pieces = merged
+    if isinstance(pieces[0], str):
+        return [pieces[0]] * n_rows
+    return pieces[0].tolist()
+
+
+def _as_array(np, column):
+    """Array of a column's values. A sequence of values that aren't all
+    strings, all integers or all floats (or bools) is kept as an object
+    array, so that e.g. the integers of a mixed column aren't made floats."""
+    if isinstance(column, np.ndarray):
+        return column
+    values = list(column)
+    types = {type(v) for v in values}
+    if len(types) == 1 and types.pop() in (str, int, float, bool):
+        return np.asarray(values)
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _as_text(np, column):
+    """Text of each value of a column, as rendering the value on its own
+    would give, in an object array so that concatenation makes plain Python
+    strings."""
+    if column.dtype.kind == "O":
+        text = np.empty(len(column), dtype=object)
+        text[:] = [slot_text(v) for v in column]
+        return text
+    if column.dtype.kind != "U":
+        column = column.astype(str)
+    return column.astype(object)
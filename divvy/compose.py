@@ -0,0 +1,282 @@
+""" Composition of divvy configurations from shared files and packages """
+
+import logging
+import os
+import threading
+
+import yacman
+from ubiquerg import expandpath
+
+from . import profiling
+from .config_cache import _plain, _signature
+from .exceptions import ConfigCompositionError
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["ConfigResolver", "default_resolver"]
+
+EXTENDS_KEY = "extends"
+INCLUDE_KEY = "include"
+_COMPOSE_KEYS = (EXTENDS_KEY, INCLUDE_KEY)
+
+
+class ConfigResolver(object):
+    """
+    Resolver of divvy configuration files composed from others.
+
+    A configuration file may name other configuration files to build on, in
+    its root 'extends' or 'include' entries; those of 'extends' come first,
+    then those of 'include', each merged over the ones before it and the file
+    itself merged over all of them. Mappings, such as 'compute_packages' and
+    'adapters', are merged key by key, so a file can change a single setting
+    of a package it gets from another. A compute package may likewise name
+    other packages of the merged configuration in its own 'extends' entry,
+    and files with package settings in its 'include' entry.
+
+    Each file is parsed once, and each configuration resolved once, for as
+    long as none of the files it's made of change, so configurations that
+    share base files don't parse them again. Relative paths, to other files
+    or to submission templates, are relative to the file they're given in;
+    those of the configuration file that's resolved are kept as they are.
+    Resolution is thread-safe.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._resolved = {}
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return "{}(files={}, configs={})".format(
+            self.__class__.__name__, len(self._files), len(self._resolved)
+        )
+
+    def clear(self):
+        """Forget the files parsed and the configurations resolved."""
+        with self._lock:
+            self._files.clear()
+            self._resolved.clear()
+
+    def resolve(self, filepath):
+        """
+        Resolve a configuration file, with the files it extends or includes
+        and the packages its packages extend.
+
+        :param str filepath: path to the configuration file
+        :return (dict, list[(str, (int, int))]): the resolved configuration,
+            which the caller may change, and the path, modification time and
+            size of each file it's made of
+        :raise divvy.ConfigCompositionError: if files or packages extend
+            each other in a cycle, or a file or package they name is missing
+        """
+        path = os.path.abspath(expandpath(filepath))
+        with self._lock:
+            memo = self._resolved.get(path)
+            if memo is not None and all(_signature(p) == sig for p, sig in memo[0]):
+                profiling.count("config_compose.hits")
+                return _plain(memo[1]), list(memo[0])
+            with profiling.phase("config.compose"):
+                sources = {}
+                entries = self._compose(path, [], sources, rebase=False)
+                self._resolve_packages(entries.get("compute_packages"), sources)
+            sources = sorted(sources.items())
+            self._resolved[path] = (sources, entries)
+            return _plain(entries), list(sources)
+
+    def compose(self, filepath):
+        """
+        Merge a configuration file with those it extends or includes, but
+        leave its packages' own 'extends' and 'include' entries for
+        `resolve_packages`, e.g. to resolve them with the packages of another
+        configuration.
+
+        :param str filepath: path to the configuration file
+        :return dict: the merged configuration, with absolute paths in the
+            packages' 'include' entries
+        :raise divvy.ConfigCompositionError: if files extend each other in a
+            cycle, or a file they name is missing
+        """
+        path = os.path.abspath(expandpath(filepath))
+        with self._lock:
+            return self._compose(path, [], {}, rebase=False)
+
+    def resolve_packages(self, packages):
+        """
+        Resolve the 'extends' and 'include' entries of compute packages.
+
+        :param dict[str, dict] packages: settings of each package, which are
+            resolved in place
+        :return dict[str, dict]: resolved settings of the packages that had
+            'extends' or 'include' entries
+        :raise divvy.ConfigCompositionError: if packages extend each other in
+            a cycle, or a package or file they name is missing
+        """
+        with self._lock:
+            return self._resolve_packages(packages, {})
+
+    def _compose(self, path, stack, sources, rebase):
+        if path in stack:
+            raise ConfigCompositionError(
+                "Configuration files extend each other in a cycle: {}".format(
+                    " -> ".join(stack[stack.index(path) :] + [path])
+                )
+            )
+        data = self._load(path, stack[-1] if stack else None, sources)
+        if not isinstance(data, dict):
+            raise ConfigCompositionError(
+                "Configuration file is not a mapping: {}".format(path)
+            )
+        folder = os.path.dirname(path)
+        for package in (data.get("compute_packages") or {}).values():
+            if not isinstance(package, dict):
+                continue
+            if INCLUDE_KEY in package:
+                package[INCLUDE_KEY] = [
+                    _relative_to(folder, p)
+                    for p in _names(package[INCLUDE_KEY], INCLUDE_KEY, path)
+                ]
+            if rebase:
+                _rebase_template(package, folder)
+        bases = [
+            _relative_to(folder, p)
+            for key in _COMPOSE_KEYS
+            for p in _names(data.pop(key, None), key, path)
+        ]
+        if not bases:
+            return data
+        merged = {}
+        for base in bases:
+            _merge(merged, self._compose(base, stack + [path], sources, rebase=True))
+        _merge(merged, data)
+        return merged
+
+    def _resolve_packages(self, packages, sources):
+        if not packages:
+            return {}
+        pending = [name for name, package in packages.items() if _composed(package)]
+        resolved = {}
+
+        def resolve(name, stack):
+            if name in resolved:
+                return resolved[name]
+            if name in stack:
+                raise ConfigCompositionError(
+                    "Compute packages extend each other in a cycle: {}".format(
+                        " -> ".join(stack[stack.index(name) :] + [name])
+                    )
+                )
+            package = packages.get(name)
+            if package is None:
+                raise ConfigCompositionError(
+                    "Compute package '{}' extends unknown package '{}'".format(
+                        stack[-1], name
+                    )
+                )
+            if not _composed(package):
+                return package
+            merged = {}
+            for parent in _names(package.get(EXTENDS_KEY), EXTENDS_KEY, name):
+                _merge(merged, resolve(parent, stack + [name]))
+            for path in _names(package.get(INCLUDE_KEY), INCLUDE_KEY, name):
+                _merge(merged, self._load_settings(path, name, sources))
+            _merge(merged, {k: v for k, v in package.items() if k not in _COMPOSE_KEYS})
+            resolved[name] = merged
+            return merged
+
+        for name in pending:
+            resolve(name, [])
+        packages.update(resolved)
+        if resolved:
+            _LOGGER.debug(
+                "Resolved compute packages: {}".format(", ".join(sorted(resolved)))
+            )
+        return {name: _plain(p) for name, p in resolved.items()}
+
+    def _load_settings(self, path, package, sources):
+        """Load a file with settings for a package."""
+        data = self._load(path, "package '{}'".format(package), sources)
+        if not isinstance(data, dict):
+            raise ConfigCompositionError(
+                "Package settings file is not a mapping: {}".format(path)
+            )
+        if any(k in data for k in _COMPOSE_KEYS):
+            raise ConfigCompositionError(
+                "Package settings file can't extend or include others: "
+                "{}".format(path)
+            )
+        _rebase_template(data, os.path.dirname(path))
+        return data
+
+    def _load(self, path, named_by, sources):
+        """
+        Parse a file, or get it as parsed before if it hasn't changed.
+
+        :return object: a copy of the file's contents, which the caller may
+            change
+        """
+        signature = _signature(path)
+        if signature is None:
+            raise ConfigCompositionError(
+                "Can't find '{}'{}".format(
+                    path, ", named by {}".format(named_by) if named_by else ""
+                )
+            )
+        memo = self._files.get(path)
+        if memo is None or memo[0] != signature:
+            _LOGGER.debug("Parsing configuration file: {}".format(path))
+            profiling.count("config_compose.files_parsed")
+            memo = self._files[path] = (signature, yacman.load_yaml(path) or {})
+        sources[path] = signature
+        return _plain(memo[1])
+
+
+def _composed(package):
+    """Whether package settings extend or include others."""
+    return isinstance(package, dict) and any(k in package for k in _COMPOSE_KEYS)
+
+
+def _names(value, key, owner):
+    """Normalize the value of an 'extends' or 'include' entry to a list."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value):
+        return list(value)
+    raise ConfigCompositionError(
+        "'{}' of {} must be a name or a list of names: {!r}".format(key, owner, value)
+    )
+
+
+def _relative_to(folder, path):
+    path = expandpath(path)
+    return os.path.normpath(path if os.path.isabs(path) else os.path.join(folder, path))
+
+
+def _rebase_template(package, folder):
+    template = package.get("submission_template")
+    if isinstance(template, str) and not os.path.isabs(expandpath(template)):
+        package["submission_template"] = os.path.join(folder, template)
+
+
+def _merge(base, over):
+    """Merge a mapping into another in place, nested mappings key by key."""
+    for key, value in over.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+_DEFAULT_RESOLVER = ConfigResolver()
+
+
+def default_resolver():
+    """
+    Get the resolver that configurations are loaded with, shared by all of
+    them in this process.
+
+    :return ConfigResolver: the shared resolver
+    """
+    return _DEFAULT_RESOLVER
@@ -1,15 +1,13 @@
-""" Computing configuration representation """
+"""Computing configuration representation"""
 
 import logging
 import logmuse
 import os
 import sys
-import shutil
-import yaml
-from yaml import SafeLoader
-from distutils.dir_util import copy_tree
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
 
-from ubiquerg import is_writable, VersionInHelpParser
+from ubiquerg import expandpath, is_writable, VersionInHelpParser
 import yacman
 
 from .const import (
@@ -18,12 +16,35 @@ from .const import (
     NEW_COMPUTE_KEY,
     DEFAULT_CONFIG_FILEPATH,
     DEFAULT_CONFIG_SCHEMA,
+    JOBS_FORMATS,
+    LEDGER_PATH_VARNAME,
+    LEDGER_VARNAME,
+    POOL_BACKENDS,
+    PROFILE_FORMATS,
+    PROFILE_VARNAME,
+    SOCKET_VARNAME,
+    STREAM_FORMATS,
 )
-from .utils import write_submit_script
-from . import __version__
+from . import profiling
+from .adapters import AdapterPlan
+from .compose import _merge, default_resolver
+from .config_cache import ConfigCache, _plain, config_cache_enabled
+from .exceptions import MissingVariablesError, ScriptWriteError, ServerError
+from .template import SubmissionTemplate, TemplateCache, VariableScope
+from .utils import copy_tree, write_file, write_submit_script
+from ._version import __version__
+
+# Submission, worker pool, array, input streaming and ledger support is
+# imported where it's used, to keep the command-line interface quick to start.
 
 _LOGGER = logging.getLogger(__name__)
 
+# Entries from which the state used for rendering scripts is derived
+_RENDER_STATE_KEYS = ("adapters", "compute", "compute_packages")
+
+# Jobs with unfilled placeholders that are logged when a batch is checked
+_MAX_REPORTED_JOBS = 20
+
 
 class ComputingConfiguration(yacman.YacAttMap):
     """
@@ -38,20 +59,43 @@ class ComputingConfiguration(yacman.YacAttMap):
     :param str | Iterable[(str, object)] | Mapping[str, object] entries: config
         Collection of key-value pairs.
     :param str filepath: YAML file specifying computing package data. (the
-        `DIVCFG` file)
+        `DIVCFG` file); it may extend or include other configuration files,
+        and its packages other packages, see `divvy.ConfigResolver`
+    :param bool use_cache: whether to use the persistent cache of validated
+        configuration files, which skips parsing and validating an unchanged
+        file; by default, it's used if the `DIVVY_CONFIG_CACHE` environment
+        variable is set to a true value. Only applies when just a filepath
+        is given.
+    :param divvy.TemplateCache template_cache: cache of compiled submission
+        templates, e.g. one shared with other configurations; each
+        configuration has its own by default
     """
 
-    def __init__(self, entries=None, filepath=None):
+    def __init__(
+        self, entries=None, filepath=None, use_cache=None, template_cache=None
+    ):
         if not entries and not filepath:
             # Handle the case of an empty one, when we'll use the default
             filepath = select_divvy_config(None)
 
-        super(ComputingConfiguration, self).__init__(
-            entries=entries,
-            filepath=filepath,
-            schema_source=DEFAULT_CONFIG_SCHEMA,
-            write_validate=True,
-        )
+        if use_cache is None:
+            use_cache = config_cache_enabled()
+        sources = []
+        with profiling.phase("config.load"):
+            if use_cache and filepath and not entries:
+                sources = self._init_cached(filepath)
+            else:
+                if filepath:
+                    file_entries, sources = default_resolver().resolve(filepath)
+                    file_entries.update(entries or {})
+                    entries = file_entries
+                super(ComputingConfiguration, self).__init__(
+                    entries=entries,
+                    schema_source=DEFAULT_CONFIG_SCHEMA,
+                    write_validate=True,
+                )
+                if filepath:
+                    self._set_file_path(filepath)
 
         if not hasattr(self, "compute_packages"):
             raise Exception(
@@ -61,6 +105,16 @@ class ComputingConfiguration(yacman.YacAttMap):
             # We require that compute_packages be present, even if empty
             self.compute_packages = {}
 
+        # Templates are cached per configuration object, outside of the
+        # mapping data so that they're never written out with the config.
+        if template_cache is None:
+            template_cache = TemplateCache()
+        setattr(self["__internal"], "template_cache", template_cache)
+        setattr(self["__internal"], "adapter_plan", None)
+        setattr(self["__internal"], "package_snapshots", None)
+        setattr(self["__internal"], "active_package", None)
+        setattr(self["__internal"], "sources", sources)
+
         # Initialize default compute settings.
         _LOGGER.debug("Establishing project compute settings")
         self.compute = None
@@ -68,7 +122,79 @@ class ComputingConfiguration(yacman.YacAttMap):
         self.activate_package(DEFAULT_COMPUTE_RESOURCES_NAME)
         self.config_file = self["__internal"].file_path
 
+    def _init_cached(self, filepath):
+        """
+        Initialize from the persistent configuration cache, or from the file,
+        caching its validated contents.
+
+        :param str filepath: YAML file specifying computing package data
+        :return list[(str, (int, int))]: path, modification time and size of
+            each file the configuration is made of
+        """
+        filepath = os.path.abspath(expandpath(filepath))
+        cache = ConfigCache()
+        fingerprint = cache.fingerprint(filepath, DEFAULT_CONFIG_SCHEMA)
+        cached = cache.load(filepath, fingerprint)
+        profiling.count(
+            "config_cache.misses" if cached is None else "config_cache.hits"
+        )
+        if cached is None:
+            entries, sources = default_resolver().resolve(filepath)
+            super(ComputingConfiguration, self).__init__(
+                entries=entries,
+                schema_source=DEFAULT_CONFIG_SCHEMA,
+                write_validate=True,
+            )
+            self._set_file_path(filepath)
+            cache.store(
+                filepath,
+                fingerprint,
+                self,
+                getattr(self["__internal"], yacman.SCHEMA_KEY),
+                sources,
+            )
+            return sources
+        entries, schema, sources = cached
+        super(ComputingConfiguration, self).__init__(
+            entries=entries, write_validate=True
+        )
+        self._set_file_path(filepath)
+        setattr(self["__internal"], yacman.SCHEMA_KEY, schema)
+        return sources
+
+    def _set_file_path(self, filepath):
+        """
+        Set what reading the configuration from a file would have set.
+
+        :param str filepath: path to the configuration file
+        """
+        internal = self["__internal"]
+        setattr(internal, yacman.WAIT_MAX_KEY, yacman.DEFAULT_WAIT_TIME)
+        setattr(internal, yacman.FILEPATH_KEY, os.path.abspath(expandpath(filepath)))
+        setattr(internal, yacman.RO_KEY, True)
+
+    def __setitem__(self, key, value, finalize=True):
+        super(ComputingConfiguration, self).__setitem__(key, value, finalize)
+        if key in _RENDER_STATE_KEYS:
+            self._invalidate_render_state(packages=key != "compute")
+
+    def _invalidate_render_state(self, packages=False):
+        """
+        Drop state derived from the active settings, e.g. adapters plan.
+
+        :param bool packages: whether to also drop the package snapshots,
+            which are derived from the packages and the root adapters
+        """
+        internal = getattr(self, "__internal", None)
+        if internal is not None:
+            internal.adapter_plan = None
+            internal.active_package = None
+            if packages:
+                internal.package_snapshots = None
+
     def write(self, filename=None):
+        import shutil
+
         super(ComputingConfiguration, self).write(filepath=filename, exclude_case=True)
         filename = filename or getattr(self, yacman.FILEPATH_KEY)
         filedir = os.path.dirname(filename)
@@ -106,8 +232,34 @@ class ComputingConfiguration(yacman.YacAttMap):
 
         :return str: submission script content template for current state
         """
-        with open(self.compute.submission_template, "r") as f:
-            return f.read()
+        return self._compiled_template().content
+
+    def _compiled_template(self):
+        """
+        Get the currently active submission template, compiled.
+
+        :return divvy.SubmissionTemplate: compiled template for current state
+        """
+        return self["__internal"].template_cache.get(self.compute.submission_template)
+
+    def config_sources(self):
+        """
+        Get the files the configuration was loaded from.
+
+        :return list[(str, (int, int))]: path, modification time and size of
+            each file, when it was read: the configuration file and those it
+            extends or includes
+        """
+        return list(self["__internal"].sources)
+
+    def template_cache_info(self):
+        """
+        Report usage of this configuration's submission template cache.
+
+        :return divvy.CacheInfo: hit and miss counts, size limit and
+            current size of the template cache
+        """
+        return self["__internal"].template_cache.info()
 
     @property
     def templates_folder(self):
@@ -124,68 +276,129 @@ class ComputingConfiguration(yacman.YacAttMap):
         """
         Activates a compute package.
 
-        This copies the computing attributes from the configuration file into
-        the `compute` attribute, where the class stores current compute
-        settings.
+        This sets the `compute` attribute, where the class stores current
+        compute settings, to a copy of the package's resolved settings: the
+        settings of a previously active package don't carry over, and changes
+        to the active settings don't reach the package, so they're gone when
+        it's activated again or rendered with `render`. To change a package
+        itself, change `compute_packages`, in place or not.
+
+        A package is resolved (its template path made absolute, and its
+        adapters plan built) once, and again only if it or the root adapters
+        changed since, so each activation costs a comparison of the package
+        with the one it was resolved from, and a copy of its settings.
 
         :param str package_name: name for non-resource compute bundle,
             the name of a subsection in an environment configuration file
         :return bool: success flag for attempt to establish compute settings
         """
-
-        # Hope that environment & environment compute are present.
         act_msg = "Activating compute package '{}'".format(package_name)
         if package_name == "default":
             _LOGGER.debug(act_msg)
         else:
             _LOGGER.info(act_msg)
 
-        if (
-            package_name
-            and self.compute_packages
-            and package_name in self.compute_packages
-        ):
-            # Augment compute, creating it if needed.
-            if self.compute is None:
-                _LOGGER.debug("Creating Project compute")
-                self.compute = yacman.YacAttMap()
-                _LOGGER.debug(
-                    "Adding entries for package_name '{}'".format(package_name)
+        snapshot = self._package_snapshot(package_name)
+        if snapshot is None:
+            # Scenario in which environment and environment compute are
+            # both present--but don't evaluate to True--is fairly harmless.
+            _LOGGER.debug(
+                "Can't activate package '{}'. compute_packages: {}".format(
+                    package_name, ", ".join(self._package_snapshots())
                 )
+            )
+            return False
+        compute = yacman.YacAttMap()
+        compute.add_entries(snapshot.compute)
+        self.compute = compute
+        self["__internal"].adapter_plan = snapshot.adapter_plan
+        self["__internal"].active_package = package_name
+        profiling.count("packages.activated")
+        return True
 
-            self.compute.add_entries(self.compute_packages[package_name])
-
-            # Ensure submission template is absolute. This *used to be* handled
-            # at update (so the paths were stored as absolutes in the packages),
-            # but now, it makes more sense to do it here so we can piggyback on
-            # the default update() method and not even have to do that.
-            if not os.path.isabs(self.compute.submission_template):
-                try:
-                    self.compute.submission_template = os.path.join(
-                        os.path.dirname(self["__internal"].file_path),
-                        self.compute.submission_template,
-                    )
-                except AttributeError as e:
-                    # Environment and environment compute should at least have been
-                    # set as null-valued attributes, so execution here is an error.
-                    _LOGGER.error(str(e))
+    def _package_snapshots(self):
+        """
+        Get the resolved settings of each compute package, building them
+        if the packages changed since they were last built.
 
-            _LOGGER.debug(
-                "Submit template set to: {}".format(self.compute.submission_template)
-            )
+        :return dict[str, PackageSnapshot]: snapshot by package name
+        """
+        internal = self["__internal"]
+        if internal.package_snapshots is None:
+            with profiling.phase("packages.resolve"):
+                internal.package_snapshots = {
+                    name: self._build_snapshot(name, package)
+                    for name, package in (self.compute_packages or {}).items()
+                }
+        return internal.package_snapshots
+
+    def _package_snapshot(self, name):
+        """
+        Get the resolved settings of a compute package, resolving them again
+        if the package or the root adapters were changed in place since.
 
-            return True
+        :param str name: name of the package
+        :return PackageSnapshot | NoneType: the resolved settings, or None if
+            there's no such package
+        """
+        package = (self.compute_packages or {}).get(name)
+        if package is None:
+            return None
+        snapshots = self._package_snapshots()
+        snapshot = snapshots.get(name)
+        if snapshot is None or snapshot.source != self._snapshot_source(package):
+            snapshot = self._build_snapshot(name, package)
+            # A new mapping, for threads that read the current one meanwhile
+            snapshots = dict(snapshots)
+            snapshots[name] = snapshot
+            self["__internal"].package_snapshots = snapshots
+        return snapshot
+
+    def _snapshot_source(self, package):
+        return _plain(package), _plain(self.get("adapters"))
+
+    def _build_snapshot(self, name, package):
+        """
+        Resolve the settings of a compute package.
 
-        else:
-            # Scenario in which environment and environment compute are
-            # both present--but don't evaluate to True--is fairly harmless.
-            _LOGGER.debug(
-                "Can't activate package. compute_packages = {}".format(
-                    self.compute_packages
+        :param str name: name of the package
+        :param Mapping package: the package's section of the configuration
+        :return PackageSnapshot: the resolved settings
+        """
+        compute = yacman.YacAttMap()
+        compute.add_entries(package)
+
+        # Ensure submission template is absolute. This *used to be* handled
+        # at update (so the paths were stored as absolutes in the packages),
+        # but now, it makes more sense to do it here so we can piggyback on
+        # the default update() method and not even have to do that.
+        if not os.path.isabs(compute.submission_template):
+            try:
+                compute.submission_template = os.path.join(
+                    os.path.dirname(self["__internal"].file_path),
+                    compute.submission_template,
                 )
-            )
+            except AttributeError as e:
+                # Environment and environment compute should at least have been
+                # set as null-valued attributes, so execution here is an error.
+                _LOGGER.error(str(e))
 
-        return False
+        _LOGGER.debug(
+            "Submit template for '{}' set to: {}".format(
+                name, compute.submission_template
+            )
+        )
+        adapters = yacman.YacAttMap()
+        if self.get("adapters") is not None:
+            adapters.update(self.adapters)
+        if "adapters" in compute:
+            adapters.update(compute.adapters)
+        return PackageSnapshot(
+            name,
+            MappingProxyType(compute.to_dict()),
+            AdapterPlan(adapters),
+            self._snapshot_source(package),
+        )
 
     def clean_start(self, package_name):
         """
@@ -205,6 +418,30 @@ class ComputingConfiguration(yacman.YacAttMap):
         """
         return self.compute
 
+    def get_active_package_name(self):
+        """
+        Returns the name of the currently active compute package
+
+        :return str | NoneType: name of the package last activated, or None
+            if the active settings were set otherwise since
+        """
+        return getattr(self["__internal"], "active_package", None)
+
+    def check_packages(self, packages=None, extra_vars=None):
+        """
+        Check that the placeholders of packages' submission templates can
+        all be filled, by package settings, adapters or given variables.
+
+        :param Iterable[str] packages: names of the packages to check; all of
+            them by default
+        :param Iterable[Mapping] | Mapping extra_vars: variables that will be
+            given for every job
+        :return list[divvy.PackageReport]: outcome for each package
+        """
+        from .lint import lint_packages
+
+        return lint_packages(self, packages, extra_vars)
+
     def list_compute_packages(self):
         """
         Returns a list of available compute packages.
@@ -230,10 +467,21 @@ class ComputingConfiguration(yacman.YacAttMap):
         overwrite) existing compute packages with existing values. It does not
         affect any currently active settings.
 
+        The file may extend or include others, and its packages may extend
+        any package of the updated configuration. Packages are resolved as
+        they are added, so packages that extended a package before the update
+        keep the settings they got from it.
+
         :param str config_file: path to file with new divvy configuration data
         """
-        entries = yacman.load_yaml(config_file)
+        resolver = default_resolver()
+        entries = resolver.compose(config_file)
+        packages = _plain(self.compute_packages or {})
+        _merge(packages, entries.pop("compute_packages", None) or {})
+        resolver.resolve_packages(packages)
         self.update(entries)
+        self.compute_packages = packages
+        self._invalidate_render_state(packages=True)
         return True
 
     def get_adapters(self):
@@ -256,7 +504,38 @@ class ComputingConfiguration(yacman.YacAttMap):
             _LOGGER.debug("No adapters determined in divvy configuration file.")
         return adapters
 
-    def submit(self, output_path, extra_vars=None):
+    def get_adapter_plan(self):
+        """
+        Get current adapters, compiled for resolution against extra variables.
+
+        The plan is built from `get_adapters` and reused until the adapters
+        may have changed, i.e. a package is activated, packages are updated
+        or any of the 'adapters', 'compute' or 'compute_packages' entries is
+        replaced. In-place edits of those sections are not tracked.
+
+        :return divvy.AdapterPlan: current adapters resolution plan
+        """
+        internal = self["__internal"]
+        if getattr(internal, "adapter_plan", None) is None:
+            internal.adapter_plan = AdapterPlan(self.get_adapters())
+        return internal.adapter_plan
+
+    def submit(self, output_path, extra_vars=None, ledger=None, throttle=None):
+        """
+        Write a submission script and submit it with the active package's
+        submission command.
+
+        :param str output_path: Path to file to write as submission script; a
+            temporary file is used if not provided
+        :param Iterable[Mapping] extra_vars: A list of Dict objects with
+            key-value pairs with which to populate template fields
+        :param bool | divvy.JobLedger ledger: whether to record the
+            submission in the job ledger; see `submit_scripts`
+        :param divvy.SubmissionThrottle throttle: limits on the submission
+            rate and on the scheduler's queue, retries and journal to submit
+            with; see `submit_scripts`
+        :return divvy.SubmissionResult: outcome of the submission
+        """
         if not output_path:
             import tempfile
 
@@ -264,14 +543,97 @@ class ComputingConfiguration(yacman.YacAttMap):
                 _LOGGER.info(
                     "No file provided; using temp file: '{}'".format(temp.name)
                 )
-                self.submit(temp.name, extra_vars)
+                return self.submit(temp.name, extra_vars, ledger, throttle)
         else:
-            script = self.write_script(output_path, extra_vars)
-            submission_command = "{} {}".format(self.compute.submission_command, script)
-            _LOGGER.info(submission_command)
-            os.system(submission_command)
+            script, values = self._write_script(output_path, extra_vars)
+            return self.submit_scripts(
+                [script], throttle=throttle, ledger=ledger, variables={script: [values]}
+            )[0]
+
+    def submit_scripts(
+        self, scripts, max_in_flight=None, throttle=None, ledger=None, variables=None
+    ):
+        """
+        Submit written scripts concurrently with the active package's
+        submission command.
+
+        The submission command is run without a shell, once per script, with
+        at most `max_in_flight` runs at once; a local command, which runs the
+        script itself, runs one script at a time, with its output going
+        straight to this process's output. The submissions are recorded in
+        the job ledger, along with the active package and the job IDs, if
+        the `DIVVY_LEDGER` environment variable is set to a true value, or a
+        ledger is given.
+
+        :param Iterable[str] scripts: paths to the scripts to submit
+        :param int max_in_flight: maximum number of submission commands to
+            run at once
+        :param divvy.SubmissionThrottle throttle: limits on the submission
+            rate and on the scheduler's queue, retries and journal to submit
+            with, in which case `max_in_flight` is the throttle's
+        :param bool | divvy.JobLedger ledger: whether to record the
+            submissions in the job ledger, or the ledger to record them in;
+            by default, whether the ledger environment variable is set
+        :param Mapping[str, Sequence[Mapping[str, str]]] variables: resolved
+            variables each script was written with, by script path, for the
+            ledger to record a digest of; see `JobLedger.record`
+        :return list[divvy.SubmissionResult]: outcome for each script, in order
+        """
+        submission_command = self.compute.submission_command
+        with profiling.phase("submit.batch"):
+            if throttle is not None:
+                results = throttle.submit(submission_command, scripts)
+            else:
+                from .submission import submit_scripts
+
+                results = submit_scripts(
+                    submission_command, scripts, max_in_flight=max_in_flight
+                )
+        if ledger is None:
+            from .ledger import ledger_enabled
+
+            ledger = ledger_enabled()
+        if ledger:
+            self._record_submissions(results, ledger, variables)
+        return results
 
-    def write_script(self, output_path, extra_vars=None):
+    def _record_submissions(self, results, ledger, variables=None):
+        """
+        Record submissions with the active package in the job ledger.
+
+        :param list[divvy.SubmissionResult] results: outcome of each
+            submission
+        :param bool | divvy.JobLedger ledger: ledger, or True for the default
+        :param Mapping[str, Sequence[Mapping[str, str]]] variables: resolved
+            variables of each script, by path
+        """
+        import sqlite3
+
+        from .ledger import JobLedger
+        from .submission import scheduler_name
+
+        owned = not isinstance(ledger, JobLedger)
+        if owned:
+            ledger = JobLedger()
+        try:
+            with profiling.phase("ledger.record"):
+                ledger.record(
+                    results,
+                    config=self.config_file,
+                    package=self.get_active_package_name(),
+                    scheduler=scheduler_name(self.compute.submission_command),
+                    variables=variables,
+                )
+        except sqlite3.Error as e:
+            # the jobs were submitted all the same
+            _LOGGER.warning(
+                "Could not record submissions in {}: {}".format(ledger.path, e)
+            )
+        finally:
+            if owned:
+                ledger.close()
+
+    def write_script(self, output_path, extra_vars=None, incremental=False):
         """
         Given currently active settings, populate the active template to write a
          submission script. Additionally use the current adapters to adjust
@@ -281,64 +643,606 @@ class ComputingConfiguration(yacman.YacAttMap):
         :param Iterable[Mapping] extra_vars: A list of Dict objects with
             key-value pairs with which to populate template fields. These will
             override any values in the currently active compute package.
+        :param bool | divvy.RenderManifest incremental: whether to leave the
+            script untouched if it was written from the same template and
+            values before; see `write_scripts`
         :return str: Path to the submission script file
         """
+        if incremental and output_path:
+            return self.write_scripts(
+                [(output_path, extra_vars)], incremental=incremental
+            )[0]
+        return self._write_script(output_path, extra_vars)[0]
 
-        def _get_from_dict(map, attrs):
-            """
-            Get value from a possibly mapping using a list of its attributes
-
-            :param collections.Mapping map: mapping to retrieve values from
-            :param Iterable[str] attrs: a list of attributes
-            :return: value found in the the requested attribute or
-                None if one of the keys does not exist
-            """
-            for a in attrs:
-                try:
-                    map = map[a]
-                except KeyError:
-                    return None
-            return map
-
-        from copy import deepcopy
+    def _write_script(self, output_path, extra_vars):
+        """
+        Write a submission script with the active settings.
 
-        variables = deepcopy(self.compute)
+        :param str output_path: Path to file to write as submission script
+        :param Iterable[Mapping] extra_vars: extra variables, as accepted by
+            `write_script`
+        :return (str, dict[str, str]): path to the submission script file,
+            and the text of each slot filled in it
+        """
         _LOGGER.debug("Extra vars: {}".format(extra_vars))
-        if extra_vars:
-            if not isinstance(extra_vars, list):
-                extra_vars = [extra_vars]
-            adapters = self.get_adapters()
-            exclude = set()
-            if adapters:
-                # apply adapted values first and keep track of
-                # which of extra_vars were used
-                for n, v in adapters.items():
-                    split_v = v.split(".")
-                    namespace = split_v[0]
-                    for extra_var in reversed(extra_vars):
-                        if (
-                            len(extra_var) > 0
-                            and namespace in list(extra_var.keys())[0]
-                        ):
-                            exclude.add(namespace)
-                            var = _get_from_dict(extra_var, split_v)
-                            if var is not None:
-                                variables[n] = var
-                                _LOGGER.debug(
-                                    "adapted {}: ({}={})".format(
-                                        n, ".".join(split_v), var
-                                    )
-                                )
-            for extra_var in reversed(extra_vars):
-                # then update variables with the rest of the extra_vars
-                if len(extra_var) > 0 and list(extra_var.keys())[0] not in exclude:
-                    variables.update(extra_var)
+        variables = _populate_variables(
+            self._compute_values(),
+            self.get_adapter_plan() if extra_vars else None,
+            extra_vars,
+        )
         _LOGGER.debug(
             "Submission template: {}".format(self.compute.submission_template)
         )
         if output_path:
             _LOGGER.info("Writing script to {}".format(os.path.abspath(output_path)))
-        return write_submit_script(output_path, self.template(), variables)
+        template = self._compiled_template()
+        path = write_submit_script(output_path, template, variables)
+        return path, template.values(variables)
+
+    def write_scripts(
+        self,
+        jobs,
+        lazy=False,
+        workers=None,
+        backend="thread",
+        incremental=False,
+        check=False,
+        writer=None,
+    ):
+        """
+        Given currently active settings, populate the active template to write
+         many submission scripts.
+
+        The active compute package, the adapters and the compiled template
+        are resolved once for the whole batch, rather than once per script,
+        so the settings must not be changed while the batch is being written.
+        With multiple workers, scripts are rendered and written in a thread or
+        process pool, still in order of the jobs, and a failure of any job
+        does not stop the others; all failures are reported together once
+        the batch is done.
+
+        In incremental mode, a manifest in each output folder records a
+        digest of the template and the values each script was written from,
+        and a script is left untouched if the digest is the same and the file
+        hasn't changed since it was written. The numbers of scripts written
+        and skipped are logged, and kept by the manifest.
+
+        With `check`, every job's variables are checked against the
+        template's placeholders before any script is written, and the batch
+        fails if any job would leave one unfilled.
+
+        Scripts are written through a `ScriptWriter`, which checks each
+        output folder once per batch; pass a writer to buffer scripts and
+        write them folder by folder, or to write them atomically, or a
+        `BundleWriter` to write them all into a single bundle file. A given
+        writer is flushed once the batch is written, but not closed.
+
+        :param Iterable[(str, Iterable[Mapping] | Mapping)] jobs: pairs of
+            output path and extra variables for each script to write, the
+            latter as accepted by `write_script`
+        :param bool lazy: whether to return a generator that writes each
+            script as it is consumed, rather than writing all of them up front
+        :param int workers: number of pool workers to write scripts with;
+            scripts are written one by one, in this process, by default
+        :param str backend: kind of pool to use with multiple workers,
+            'thread' or 'process'; for the latter, extra variables must be
+            picklable
+        :param bool | divvy.RenderManifest incremental: whether to only write
+            scripts whose inputs changed; pass a manifest to read the numbers
+            of scripts written and skipped from it afterwards
+        :param bool check: whether to check all the jobs for unfilled
+            placeholders first
+        :param divvy.ScriptWriter | divvy.BundleWriter writer: writer of the
+            scripts; for incremental writing or the process backend, it must
+            write each script right away
+        :return list[str] | Generator[str]: paths to the submission script
+            files, including those left untouched, or their names in the
+            bundle
+        :raise divvy.ScriptWriteError: if any script could not be written
+            with multiple workers
+        :raise divvy.MissingVariablesError: if checking finds jobs that would
+            leave placeholders unfilled, with the placeholders of each
+        :raise ValueError: for incremental writing with the process backend,
+            whose workers can't share the manifest, or for incremental writing
+            or the process backend with a writer that holds scripts back
+        """
+        from .writer import ScriptWriter
+
+        _LOGGER.debug(
+            "Submission template: {}".format(self.compute.submission_template)
+        )
+        manifest = None
+        if incremental:
+            from .manifest import RenderManifest
+
+            if isinstance(incremental, RenderManifest):
+                manifest = incremental
+            else:
+                manifest = RenderManifest()
+        parallel = workers is not None and workers > 1
+        if manifest is not None and parallel and backend == "process":
+            raise ValueError("Incremental writing needs the thread backend")
+        if writer is None:
+            writer = ScriptWriter()
+        elif writer.buffered and (
+            manifest is not None or (parallel and backend == "process")
+        ):
+            raise ValueError(
+                "Incremental writing and the process backend need a writer "
+                "that writes each script right away"
+            )
+        render = self._script_renderer(manifest, writer)
+        if check:
+            jobs = list(jobs)
+            render.check(jobs)
+        if parallel:
+            scripts = _write_parallel(render, jobs, workers, backend)
+        else:
+            scripts = _write_serial(render, jobs)
+        if manifest is not None:
+            scripts = _save_manifest(scripts, manifest)
+        elif writer.buffered:
+            scripts = _flush_writer(scripts, writer)
+        return scripts if lazy else list(scripts)
+
+    def stream_scripts(
+        self,
+        groups,
+        path_pattern,
+        extra_vars=None,
+        workers=None,
+        backend="thread",
+        incremental=False,
+        writer=None,
+        check=False,
+    ):
+        """
+        Given currently active settings, write a submission script for each
+         group of variables from a stream, e.g. each row of a sample sheet.
+
+        Groups are consumed as scripts are written, so a stream of any length
+        is processed in constant memory, given the returned generator is
+        consumed without keeping the paths. For the same reason, `check`
+        checks each job just before its script is written, rather than all of
+        them first: writing stops at the first job that would leave a
+        placeholder unfilled, and scripts before it are kept.
+
+        :param Iterable[Mapping] groups: variables for each script, with
+            precedence over `extra_vars`; see `divvy.iter_variable_groups`
+        :param str path_pattern: output path for each script, which is
+            populated with the script's variables like a template, e.g.
+            'submission/{JOBNAME}.sub'
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by
+            all the scripts
+        :param int workers: number of pool workers to write scripts with
+        :param str backend: kind of pool to use with multiple workers
+        :param bool | divvy.RenderManifest incremental: whether to only write
+            scripts whose inputs changed; see `write_scripts`
+        :param divvy.ScriptWriter | divvy.BundleWriter writer: writer of the
+            scripts; see `write_scripts`
+        :param bool check: whether to check each job for unfilled
+            placeholders before writing its script
+        :return Generator[str]: paths to the submission script files
+        :raise divvy.MissingVariablesError: if checking finds a job that would
+            leave placeholders unfilled
+        """
+        pattern = SubmissionTemplate(path_pattern)
+        shared = _as_groups(extra_vars)
+        jobs = ((pattern, [group] + shared) for group in groups)
+        if check:
+            jobs = _checked_jobs(self._script_renderer(), jobs)
+        return self.write_scripts(
+            jobs,
+            lazy=True,
+            workers=workers,
+            backend=backend,
+            incremental=incremental,
+            writer=writer,
+        )
+
+    def render_columns(self, table, extra_vars=None):
+        """
+        Given currently active settings, render the active template once per
+         row of a columnar job table, in bulk.
+
+        Rather than rendering row by row, each column is converted to text
+        and concatenated with the template's literal segments as a whole
+        array, which requires numpy.
+
+        :param Mapping[str, Sequence] | pandas.DataFrame table: one column per
+            template variable, e.g. a dict of numpy arrays; column values take
+            precedence over `extra_vars` and the active package
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by
+            all the rows, as accepted by `write_script`
+        :return list[str]: rendered script content for each row
+        """
+        from .columnar import render_columns
+
+        render = self._script_renderer()
+        with profiling.phase("render.columns"):
+            return render_columns(render.template, table, render.variables(extra_vars))
+
+    def write_columns(self, path_pattern, table, extra_vars=None, writer=None):
+        """
+        Given currently active settings, write a submission script for each
+         row of a columnar job table, rendered in bulk.
+
+        :param str path_pattern: output path for each script, which is
+            populated with the row's variables like a template, e.g.
+            'submission/{JOBNAME}.sub'
+        :param Mapping[str, Sequence] | pandas.DataFrame table: one column per
+            template variable, e.g. a dict of numpy arrays; see
+            `render_columns`
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by
+            all the rows
+        :param divvy.ScriptWriter | divvy.BundleWriter writer: writer of the
+            scripts, which is flushed once they are written; see
+            `write_scripts`
+        :return list[str]: paths to the submission script files, or their
+            names in the bundle
+        :raise ValueError: if the path pattern gives the same path for
+            several rows
+        """
+        from .columnar import render_columns
+        from .writer import ScriptWriter
+
+        render = self._script_renderer()
+        variables = render.variables(extra_vars)
+        with profiling.phase("render.columns"):
+            paths = render_columns(SubmissionTemplate(path_pattern), table, variables)
+            if len(set(paths)) < len(paths):
+                raise ValueError(
+                    "Output path pattern gives the same path for several rows: "
+                    "{}".format(path_pattern)
+                )
+            contents = render_columns(render.template, table, variables)
+        writer = writer or ScriptWriter()
+        paths = [write_file(p, c, writer) for p, c in zip(paths, contents)]
+        writer.flush()
+        _LOGGER.info("Wrote {} submission scripts".format(len(paths)))
+        return paths
+
+    def write_array_script(self, output_path, tasks, extra_vars=None, params_path=None):
+        """
+        Given currently active settings, write a single array job script for
+         many tasks, and a parameter file with one line per task.
+
+        Values that are the same for all the tasks are rendered in the script
+        as usual, while those that differ are set, for each task, from its
+        line of the parameter file, selected with the scheduler's array task
+        ID. Values that differ between tasks can't be used in scheduler
+        directives, so e.g. the job name should be given in `extra_vars`.
+
+        :param str output_path: Path to file to write as array job script
+        :param Iterable[Iterable[Mapping] | Mapping] tasks: extra variables
+            for each task, as accepted by `write_script`
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by all
+            the tasks, with lower precedence than the tasks' own
+        :param str params_path: Path to the parameter file to write; by
+            default, the script path with a '.params' suffix
+        :return str: Path to the array job script file
+        """
+        return self._write_array_script(output_path, tasks, extra_vars, params_path)[0]
+
+    def _write_array_script(self, output_path, tasks, extra_vars, params_path):
+        """
+        Write an array job script and its parameter file.
+
+        :return (str, list[dict[str, str]]): path to the array job script
+            file, and the text of each slot filled for each task
+        """
+        from .arrays import get_array_scheduler, render_array_script
+
+        scheduler = get_array_scheduler(self.compute.submission_command)
+        render = _ScriptRenderer(
+            self._compute_values(), self.get_adapter_plan(), self._compiled_template()
+        )
+        shared = render.variables(extra_vars)
+        extra_vars = _as_groups(extra_vars)
+        task_values = [
+            render.template.values(render.variables(_as_groups(t) + extra_vars))
+            for t in tasks
+        ]
+        params_path = os.path.abspath(params_path or output_path + ".params")
+        content, params = render_array_script(
+            render.template,
+            task_values,
+            scheduler,
+            params_path,
+            next(
+                (str(v) for k, v in shared.items() if str(k).upper() == "JOBNAME"),
+                "divvy",
+            ),
+        )
+        write_file(params_path, "\n".join(params) + "\n")
+        _LOGGER.info(
+            "Writing {} array script for {} tasks to {}".format(
+                scheduler.name, len(task_values), os.path.abspath(output_path)
+            )
+        )
+        return write_file(output_path, content), task_values
+
+    def submit_array(
+        self, output_path, tasks, extra_vars=None, params_path=None, ledger=None
+    ):
+        """
+        Write an array job script for many tasks, and submit it once.
+
+        :param str output_path: Path to file to write as array job script
+        :param Iterable[Iterable[Mapping] | Mapping] tasks: extra variables
+            for each task, as accepted by `write_script`
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by all
+            the tasks, with lower precedence than the tasks' own
+        :param str params_path: Path to the parameter file to write
+        :param bool | divvy.JobLedger ledger: whether to record the
+            submission in the job ledger; see `submit_scripts`
+        :return divvy.SubmissionResult: outcome of the submission
+        """
+        script, task_values = self._write_array_script(
+            output_path, tasks, extra_vars, params_path
+        )
+        return self.submit_scripts(
+            [script], ledger=ledger, variables={script: task_values}
+        )[0]
+
+    def write_packed_scripts(
+        self,
+        path_pattern,
+        jobs,
+        extra_vars=None,
+        max_cores=None,
+        max_mem=None,
+        max_time=None,
+    ):
+        """
+        Given currently active settings, pack many small jobs into a few
+         larger allocations, and write one script per allocation that runs
+         its jobs side by side.
+
+        Each job's CORES, MEM and TIME are read from its variables, as they
+        would fill its own script; a job without cores takes one, and one
+        without memory or time takes none. An allocation is given the sum of
+        its jobs' cores and memory, and the longest of their times, within
+        the packing limits, which default to the active package's
+        'max_cores', 'max_mem' and 'max_time' settings. Jobs run their CODE
+        in the background of the allocation's script, with their output sent
+        to their own LOGFILE if it differs from the allocation's.
+
+        :param str path_pattern: output path for each allocation's script,
+            populated with the allocation's variables like a template, where
+            {PACK} is the allocation's number, e.g. 'submission/pack_{PACK}.sub'
+        :param Iterable[Iterable[Mapping] | Mapping] jobs: extra variables
+            for each job, as accepted by `write_script`
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by all
+            the jobs and allocations, with lower precedence than the jobs' own
+        :param int max_cores: most cores of an allocation
+        :param str max_mem: most memory of an allocation, e.g. '64G'
+        :param str max_time: longest time of an allocation, e.g. '04:00:00'
+        :return list[str]: paths to the allocations' script files
+        :raise ValueError: if a job has no CODE or needs more than an
+            allocation can have, if the template has no line with only {CODE}
+            on it, or if the path pattern gives the same path for several
+            allocations
+        """
+        return list(
+            self._write_packed_scripts(
+                path_pattern, jobs, extra_vars, max_cores, max_mem, max_time
+            )
+        )
+
+    def _write_packed_scripts(
+        self, path_pattern, jobs, extra_vars, max_cores, max_mem, max_time
+    ):
+        """
+        Pack jobs into allocations, and write each allocation's script.
+
+        :return dict[str, list[dict[str, str]]]: the text of each slot filled
+            for the allocation, and the command and log file of each of its
+            jobs, by path of each allocation's script file, in order
+        """
+        from .packing import (
+            Resources,
+            format_mem,
+            format_time,
+            pack_jobs,
+            parse_mem,
+            parse_time,
+            render_wrapper,
+        )
+
+        render = self._script_renderer()
+        shared_groups = _as_groups(extra_vars)
+        shared = _upper_pool(render.variables(extra_vars))
+        limits = Resources(
+            _packing_limit(max_cores, self.compute.get("max_cores"), int),
+            _packing_limit(max_mem, self.compute.get("max_mem"), parse_mem),
+            _packing_limit(max_time, self.compute.get("max_time"), parse_time),
+        )
+        members = []
+        demands = []
+        for i, job in enumerate(jobs):
+            pool = _upper_pool(render.variables(_as_groups(job) + shared_groups))
+            if "CODE" not in pool:
+                raise ValueError("Packed job {} has no command (CODE)".format(i))
+            logfile = pool.get("LOGFILE")
+            members.append(
+                (
+                    str(pool["CODE"]),
+                    logfile if logfile != shared.get("LOGFILE") else None,
+                )
+            )
+            demands.append(
+                Resources(
+                    int(pool.get("CORES", 1)),
+                    parse_mem(pool["MEM"]) if "MEM" in pool else 0,
+                    parse_time(pool["TIME"]) if "TIME" in pool else 0,
+                )
+            )
+        with profiling.phase("pack"):
+            bins = pack_jobs(demands, limits)
+        pattern = SubmissionTemplate(path_pattern)
+        job_name = str(shared.get("JOBNAME", "divvy"))
+        scripts = []
+        for n, indices in enumerate(bins, 1):
+            needs = [demands[i] for i in indices]
+            values = {
+                "PACK": str(n),
+                "JOBNAME": "{}_pack{}".format(job_name, n),
+                "CORES": str(sum(d.cores for d in needs)),
+            }
+            if any(d.mem for d in needs):
+                values["MEM"] = format_mem(sum(d.mem for d in needs))
+            if any(d.time for d in needs):
+                values["TIME"] = format_time(max(d.time for d in needs))
+            variables = VariableScope(values, shared)
+            with profiling.phase("render"):
+                filled = render.template.values(variables)
+                content = render_wrapper(
+                    render.template, filled, [members[i] for i in indices]
+                )
+            job_values = [
+                {"CODE": code, "LOGFILE": logfile or ""}
+                for code, logfile in (members[i] for i in indices)
+            ]
+            scripts.append((pattern.render(variables), content, [filled] + job_values))
+        paths = [path for path, _, _ in scripts]
+        if len(set(paths)) < len(paths):
+            raise ValueError(
+                "Output path pattern gives the same path for several "
+                "allocations: {}".format(path_pattern)
+            )
+        written = OrderedDict()
+        for path, content, groups in scripts:
+            written[write_file(path, content)] = groups
+        _LOGGER.info(
+            "Packed {} jobs into {} allocations".format(len(members), len(paths))
+        )
+        return written
+
+    def submit_packed(
+        self,
+        path_pattern,
+        jobs,
+        extra_vars=None,
+        max_cores=None,
+        max_mem=None,
+        max_time=None,
+        throttle=None,
+        ledger=None,
+    ):
+        """
+        Pack many small jobs into a few larger allocations, and submit each
+        allocation's script.
+
+        :param str path_pattern: output path for each allocation's script;
+            see `write_packed_scripts`
+        :param Iterable[Iterable[Mapping] | Mapping] jobs: extra variables
+            for each job, as accepted by `write_script`
+        :param Iterable[Mapping] | Mapping extra_vars: variables shared by all
+            the jobs and allocations
+        :param int max_cores: most cores of an allocation
+        :param str max_mem: most memory of an allocation
+        :param str max_time: longest time of an allocation
+        :param divvy.SubmissionThrottle throttle: limits to submit with; see
+            `submit_scripts`
+        :param bool | divvy.JobLedger ledger: whether to record the
+            submissions in the job ledger; see `submit_scripts`
+        :return list[divvy.SubmissionResult]: outcome for each allocation
+        """
+        written = self._write_packed_scripts(
+            path_pattern, jobs, extra_vars, max_cores, max_mem, max_time
+        )
+        return self.submit_scripts(
+            list(written), throttle=throttle, ledger=ledger, variables=written
+        )
+
+    def render(self, package, extra_vars=None):
+        """
+        Render a compute package's submission template, without activating
+        the package.
+
+        Unlike `activate_package` and `write_script`, this leaves the active
+        settings alone, and changes nothing else on the configuration either:
+        the package's settings and adapters are read from its snapshot, and
+        its template from the template cache. So any number of threads can
+        render with one configuration at once, with different packages and
+        variables, as long as none of them changes the configuration, e.g.
+        with `update_packages`, at the same time.
+
+        :param str package: name of the compute package to render
+        :param Iterable[Mapping] | Mapping extra_vars: groups of key-value
+            pairs with which to populate template fields; they override the
+            package's values, and the first group wins
+        :return str: the rendered submission script
+        :raise ValueError: if there's no such compute package
+        """
+        render = self._package_renderer(package)
+        variables = render.variables(extra_vars)
+        with profiling.phase("render"):
+            return render.template.render(variables)
+
+    def _package_renderer(self, package, manifest=None, writer=None):
+        """
+        Capture a compute package's settings for writing scripts, without
+        activating it.
+
+        :param str package: name of the compute package
+        :param divvy.RenderManifest manifest: record of written scripts, to
+            only write those whose inputs changed
+        :param divvy.ScriptWriter | divvy.BundleWriter writer: writer of the
+            scripts
+        :return _ScriptRenderer: writer of scripts with the package's values,
+            adapters and compiled template
+        :raise ValueError: if there's no such compute package
+        """
+        # Snapshots are built into a new mapping and then stored, so threads
+        # that race to build them each get a complete set
+        snapshot = self._package_snapshot(package)
+        if snapshot is None:
+            raise ValueError(
+                "Unknown compute package '{}'; choose from: {}".format(
+                    package, ", ".join(sorted(self._package_snapshots()))
+                )
+            )
+        return _ScriptRenderer(
+            dict(snapshot.compute.items()),
+            snapshot.adapter_plan,
+            self["__internal"].template_cache.get(
+                snapshot.compute["submission_template"]
+            ),
+            manifest,
+            writer,
+        )
+
+    def _script_renderer(self, manifest=None, writer=None):
+        """
+        Capture the active settings for writing scripts.
+
+        :param divvy.RenderManifest manifest: record of written scripts, to
+            only write those whose inputs changed
+        :param divvy.ScriptWriter | divvy.BundleWriter writer: writer of the
+            scripts
+        :return _ScriptRenderer: writer of scripts with the active package
+            values, adapters and compiled template
+        """
+        return _ScriptRenderer(
+            self._compute_values(),
+            self.get_adapter_plan(),
+            self._compiled_template(),
+            manifest,
+            writer,
+        )
+
+    def _compute_values(self):
+        """
+        Get a snapshot of the active compute package values, for rendering.
+
+        This is a shallow copy with values as stored, i.e. without path
+        expansion, just like they would be found in a deep copy.
+
+        :return dict: active compute package values
+        """
+        return dict(self.compute.items()) if self.compute is not None else {}
 
     def _handle_missing_env_attrs(self, config_file, when_missing):
         """Default environment settings aren't required; warn, though."""
@@ -358,6 +1262,226 @@ class ComputingConfiguration(yacman.YacAttMap):
             when_missing(message)
 
 
+class PackageSnapshot(
+    namedtuple("PackageSnapshot", ["name", "compute", "adapter_plan", "source"])
+):
+    """
+    Settings of a compute package, resolved once for any number of
+    activations.
+
+    :param str name: name of the package
+    :param Mapping compute: the package's settings, with an absolute
+        submission template path, read-only
+    :param divvy.AdapterPlan adapter_plan: the root adapters, merged with the
+        package's own
+    :param (dict, dict) source: plain copies of the package and of the root
+        adapters it was resolved from
+    """
+
+    __slots__ = ()
+
+
+class _ScriptRenderer(object):
+    """
+    Writes scripts with the state resolved from the settings active at
+    creation. Instances are picklable, so they can be sent to pool workers.
+    """
+
+    def __init__(self, compute, adapters, template, manifest=None, writer=None):
+        self.compute = compute
+        self.adapters = adapters
+        self.template = template
+        self.manifest = manifest
+        self.writer = writer
+
+    def variables(self, extra_vars):
+        return _populate_variables(self.compute, self.adapters, extra_vars)
+
+    def check(self, jobs):
+        """
+        Check that each job fills all the template's placeholders.
+
+        :param Sequence[(str, Iterable[Mapping] | Mapping)] jobs: pairs of
+            output path and extra variables
+        :raise divvy.MissingVariablesError: if any job would leave
+            placeholders unfilled
+        """
+        missing = []
+        with profiling.phase("check"):
+            for i, (output_path, extra_vars) in enumerate(jobs):
+                variables = self.variables(extra_vars)
+                names = self.template.missing(variables)
+                if names:
+                    if isinstance(output_path, SubmissionTemplate):
+                        output_path = output_path.render(variables)
+                    missing.append((output_path or "job {}".format(i + 1), names))
+        if missing:
+            for label, names in missing[:_MAX_REPORTED_JOBS]:
+                _LOGGER.error("{}: unfilled {}".format(label, ", ".join(names)))
+            if len(missing) > _MAX_REPORTED_JOBS:
+                _LOGGER.error(
+                    "... and {} more jobs".format(len(missing) - _MAX_REPORTED_JOBS)
+                )
+            raise MissingVariablesError(missing, len(jobs))
+
+    def __call__(self, output_path, extra_vars):
+        return self.write(output_path, self.variables(extra_vars))
+
+    def write(self, output_path, variables):
+        """
+        Write a script with resolved variables.
+
+        :param str | divvy.SubmissionTemplate output_path: path to the
+            script, or a template of it to fill with the variables
+        :param Mapping variables: resolved variables
+        :return str: path to the script
+        """
+        if isinstance(output_path, SubmissionTemplate):
+            output_path = output_path.render(variables)
+        if output_path and self.manifest is not None:
+            digest = self.manifest.digest(
+                self.template, self.template.values(variables)
+            )
+            if self.manifest.unchanged(output_path, digest):
+                _LOGGER.debug("Unchanged script: {}".format(output_path))
+                return output_path
+        if output_path:
+            _LOGGER.debug("Writing script to {}".format(os.path.abspath(output_path)))
+        path = write_submit_script(output_path, self.template, variables, self.writer)
+        if output_path and self.manifest is not None:
+            self.manifest.record(path, digest)
+        return path
+
+
+def _write_serial(render, jobs):
+    count = 0
+    for output_path, extra_vars in jobs:
+        yield render(output_path, extra_vars)
+        count += 1
+    _LOGGER.info("Wrote {} submission scripts".format(count))
+
+
+def _flush_writer(scripts, writer):
+    """Pass the scripts of a batch through, then flush the writer."""
+    try:
+        for script in scripts:
+            yield script
+    finally:
+        writer.flush()
+
+
+def _save_manifest(scripts, manifest):
+    """Pass the scripts of a batch through, then save the manifest."""
+    try:
+        for script in scripts:
+            yield script
+    finally:
+        manifest.save()
+    _LOGGER.info(
+        "Incremental writing: {} scripts written, {} unchanged scripts "
+        "skipped".format(manifest.written, manifest.skipped)
+    )
+
+
+def _write_parallel(render, jobs, workers, backend):
+    from .parallel import imap_ordered
+
+    errors = []
+    count = 0
+    for (output_path, _), path, e in imap_ordered(render, jobs, workers, backend):
+        count += 1
+        if e is not None:
+            _LOGGER.error("Failed to write script {}: {}".format(output_path, e))
+            errors.append((output_path, e))
+        else:
+            yield path
+    _LOGGER.info(
+        "Wrote {} submission scripts with {} {} workers".format(
+            count - len(errors), workers, backend
+        )
+    )
+    if errors:
+        raise ScriptWriteError(errors, count)
+
+
+def _checked_jobs(render, jobs):
+    """
+    Check each job for unfilled placeholders as it's consumed.
+
+    :param _ScriptRenderer render: renderer with the template to check against
+    :param Iterable[(str, Iterable[Mapping] | Mapping)] jobs: pairs of output
+        path and extra variables
+    :return Generator[(str, Iterable[Mapping] | Mapping)]: the jobs
+    :raise divvy.MissingVariablesError: at the first job that would leave
+        placeholders unfilled, out of the jobs consumed so far
+    """
+    for count, job in enumerate(jobs, 1):
+        try:
+            render.check([job])
+        except MissingVariablesError as e:
+            raise MissingVariablesError(e.missing, count)
+        yield job
+
+
+def _as_groups(extra_vars):
+    """
+    Normalize extra variables to a list of groups.
+
+    :param Iterable[Mapping] | Mapping extra_vars: a group or list of groups
+    :return list[Mapping]: groups of variables
+    """
+    if not extra_vars:
+        return []
+    return extra_vars if isinstance(extra_vars, list) else [extra_vars]
+
+
+def _upper_pool(variables):
+    """
+    Index variables by uppercased name, as template slots see them.
+
+    :param Mapping variables: a "pool" of variables
+    :return dict: value for each uppercased name; the first of several names
+        that uppercase the same way wins
+    """
+    pool = {}
+    for k, v in variables.items():
+        pool.setdefault(str(k).upper(), v)
+    return pool
+
+
+def _packing_limit(value, setting, parse):
+    """Read a packing limit, given or from a package setting, if any."""
+    value = setting if value is None else value
+    return None if value is None or value == "" else parse(value)
+
+
+def _populate_variables(compute, adapters, extra_vars):
+    """
+    Layer the adapted and the extra variables over compute package values.
+
+    Nothing is copied: the values are looked up, in order of precedence, in
+    the extra variables groups that were not claimed by any adapter (first
+    group first), then in the adapted values and finally in the package.
+
+    :param Mapping compute: compute package values
+    :param divvy.AdapterPlan adapters: adapters to source values from
+        extra_vars with
+    :param Iterable[Mapping] | Mapping extra_vars: groups of key-value pairs
+        which override values in the compute package; the first group wins
+    :return divvy.VariableScope: read-only view of the variables
+    """
+    extra_vars = _as_groups(extra_vars)
+    if not extra_vars:
+        return VariableScope(compute)
+    with profiling.phase("adapters.resolve"):
+        adapted, exclude = adapters.resolve(extra_vars) if adapters else ([], set())
+    layers = [ev for ev in extra_vars if len(ev) > 0 and next(iter(ev)) not in exclude]
+    # apply adapted values first, so that any extra_vars override them
+    layers.append(dict(adapted))
+    layers.append(compute)
+    return VariableScope(*layers)
+
+
 def select_divvy_config(filepath):
     """
     Selects the divvy config file path to load.
@@ -433,6 +1557,20 @@ def build_argparser():
         version=__version__,
     )
 
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report the time spent in each phase of the run, and event "
+        "counts, at exit; the same as setting ${}".format(PROFILE_VARNAME),
+    )
+
+    parser.add_argument(
+        "--profile-format",
+        choices=PROFILE_FORMATS,
+        default=None,
+        help="Format of the --profile report; implies --profile",
+    )
+
     subparsers = parser.add_subparsers(dest="command")
 
     def add_subparser(cmd, description):
@@ -443,6 +1581,10 @@ def build_argparser():
         "list": "List available compute packages",
         "write": "Write a job script",
         "submit": "Write and then submit a job script",
+        "serve": "Keep configurations loaded and serve write and submit "
+        "requests on a local socket",
+        "jobs": "List submitted job scripts, from the job ledger",
+        "check": "Check that compute packages' templates can be filled",
     }
 
     sps = {}
@@ -452,13 +1594,61 @@ def build_argparser():
         #     "config", nargs="?", default=None,
         #     help="Divvy configuration file.")
 
-    for sp in [sps["list"], sps["write"], sps["submit"]]:
+    for sp in [sps["list"], sps["write"], sps["submit"], sps["check"]]:
         sp.add_argument(
             "config", nargs="?", default=None, help="Divvy configuration file."
         )
 
+    sps["check"].add_argument(
+        "-p",
+        "--package",
+        nargs="+",
+        default=None,
+        help="Compute packages to check; all of them by default",
+    )
+
+    sps["check"].add_argument(
+        "-c",
+        "--compute",
+        nargs="+",
+        default=None,
+        help="Extra key=value variable pairs that will be given for every job",
+    )
+
     sps["init"].add_argument("config", default=None, help="Divvy configuration file.")
 
+    sps["serve"].add_argument(
+        "config",
+        nargs="*",
+        default=None,
+        help="Divvy configuration files to load up front; the first one is "
+        "used by requests that don't name one.",
+    )
+
+    sps["serve"].add_argument(
+        "--max-configs",
+        type=int,
+        default=None,
+        help="Most configurations to keep loaded; the least recently used "
+        "ones are dropped",
+    )
+
+    sps["serve"].add_argument(
+        "--max-memory",
+        default=None,
+        help="Most memory the loaded configurations may take, e.g. 256M; the "
+        "least recently used ones are dropped",
+    )
+
+    for sp in [sps["write"], sps["submit"], sps["serve"]]:
+        sp.add_argument(
+            "--socket",
+            default=None,
+            help="Path to the socket of a divvy server; for write and submit, "
+            "the server renders single job scripts instead of this process. "
+            "Defaults to ${} for write and submit".format(SOCKET_VARNAME),
+        )
+
     for sp in [sps["write"], sps["submit"]]:
         sp.add_argument(
             "-s",
@@ -489,9 +1679,306 @@ def build_argparser():
             "-o", "--outfile", required=False, default=None, help="Output filepath"
         )
 
+        sp.add_argument(
+            "-a",
+            "--array",
+            default=None,
+            help="JSON Lines, CSV, TSV or YAML file with a group of variables "
+            "for each task of an array job",
+        )
+
+        sp.add_argument(
+            "--pack",
+            default=None,
+            help="JSON Lines, CSV, TSV or YAML file with a group of variables "
+            "for each small job to pack into larger allocations, one job "
+            "script each. The output filepath is then a pattern, e.g. "
+            "'pack_{PACK}.sub'",
+        )
+
+        sp.add_argument(
+            "--max-cores",
+            type=int,
+            default=None,
+            help="Most cores of a --pack allocation; defaults to the "
+            "package's max_cores",
+        )
+
+        sp.add_argument(
+            "--max-mem",
+            default=None,
+            help="Most memory of a --pack allocation, e.g. 64G; defaults to "
+            "the package's max_mem",
+        )
+
+        sp.add_argument(
+            "--max-time",
+            default=None,
+            help="Longest time of a --pack allocation, e.g. 04:00:00; "
+            "defaults to the package's max_time",
+        )
+
+    sps["submit"].add_argument(
+        "--ledger",
+        default=None,
+        help="Job ledger file to record the submissions in; they're recorded "
+        "in ${} if ${} is set".format(LEDGER_PATH_VARNAME, LEDGER_VARNAME),
+    )
+
+    sps["jobs"].add_argument(
+        "--ledger",
+        default=None,
+        help="Job ledger file to read; defaults to ${}, or the ledger in the "
+        "user's data folder".format(LEDGER_PATH_VARNAME),
+    )
+
+    sps["jobs"].add_argument(
+        "-p", "--package", default=None, help="Only jobs of this compute package"
+    )
+
+    sps["jobs"].add_argument("--job-id", default=None, help="Only the job with this ID")
+
+    sps["jobs"].add_argument(
+        "--script", default=None, help="Only jobs whose script path contains this"
+    )
+
+    sps["jobs"].add_argument(
+        "--since",
+        default=None,
+        help="Only jobs submitted since a time ago, e.g. 12h or 7d, or a date, "
+        "e.g. 2024-05-01",
+    )
+
+    sps["jobs"].add_argument(
+        "--failed",
+        action="store_true",
+        help="Only jobs whose submission failed",
+    )
+
+    sps["jobs"].add_argument(
+        "-n", "--limit", type=int, default=50, help="Most jobs to list; 0 for all"
+    )
+
+    sps["jobs"].add_argument(
+        "--format",
+        choices=JOBS_FORMATS,
+        default=JOBS_FORMATS[0],
+        help="Output format",
+    )
+
+    sps["submit"].add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Most submissions per second",
+    )
+
+    sps["submit"].add_argument(
+        "--max-queued",
+        type=int,
+        default=None,
+        help="Most of your jobs in the scheduler's queue; submissions wait "
+        "for room, as counted with squeue for sbatch",
+    )
+
+    sps["submit"].add_argument(
+        "--retries",
+        type=int,
+        default=None,
+        help="Times to retry a submission that fails temporarily, with "
+        "exponential backoff (default: 3 with --pack, or with any of these "
+        "throttling options; otherwise 0)",
+    )
+
+    sps["submit"].add_argument(
+        "--journal",
+        default=None,
+        help="File to record submissions in; running again with the same "
+        "journal skips the scripts that were submitted already",
+    )
+
+    sps["write"].add_argument(
+        "--stream",
+        default=None,
+        help="JSON Lines, CSV, TSV or YAML file with a group of variables for "
+        "each job script, read one at a time; '-' reads standard input, as "
+        "JSON Lines unless --stream-format is given. "
+        "The output filepath is then a pattern, e.g. '{JOBNAME}.sub'",
+    )
+
+    sps["write"].add_argument(
+        "--stream-format",
+        choices=sorted(set(STREAM_FORMATS.values())),
+        default=None,
+        help="Format of the --stream file, by default guessed from its extension",
+    )
+
+    sps["write"].add_argument(
+        "--check",
+        action="store_true",
+        help="Check that every job fills all the template's placeholders "
+        "before writing any job script",
+    )
+
+    sps["write"].add_argument(
+        "--incremental",
+        action="store_true",
+        help="Leave job scripts untouched if they were written from the same "
+        "template and variables before",
+    )
+
+    sps["write"].add_argument(
+        "--atomic",
+        action="store_true",
+        help="Write each job script to a temporary file and rename it, so "
+        "that no script is ever seen half written",
+    )
+
+    sps["write"].add_argument(
+        "--fsync",
+        action="store_true",
+        help="Flush job scripts, and the folders they're written to, to disk",
+    )
+
+    sps["write"].add_argument(
+        "--bundle",
+        default=None,
+        help="Write the job scripts into this single .tar, .tar.gz, .tgz, "
+        ".tar.bz2, .tar.xz or .jsonl bundle file instead of separate files, "
+        "named by their output filepaths",
+    )
+
+    sps["write"].add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of workers to write --stream job scripts with",
+    )
+
+    sps["write"].add_argument(
+        "--backend",
+        choices=POOL_BACKENDS,
+        default="thread",
+        help="Kind of worker pool to use with multiple jobs",
+    )
+
     return parser
 
 
+def _cli_writer(parser, args):
+    """
+    Make the writer of job scripts that `divvy write` options ask for.
+
+    :param argparse.ArgumentParser parser: parser to report bad options with
+    :param argparse.Namespace args: parsed command-line arguments
+    :return divvy.ScriptWriter | divvy.BundleWriter | NoneType: writer, or
+        None for the default one
+    """
+    from .writer import BundleWriter, ScriptWriter
+
+    if args.bundle:
+        if not args.outfile:
+            parser.error("Bundling needs an output filepath (-o)")
+        if args.incremental or args.backend == "process" and args.jobs:
+            parser.error(
+                "A bundle can't be written incrementally, nor with the "
+                "process backend"
+            )
+        try:
+            return BundleWriter(args.bundle, fsync=args.fsync)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.atomic or args.fsync:
+        return ScriptWriter(atomic=args.atomic, fsync=args.fsync)
+    return None
+
+
+_THROTTLE_OPTIONS = ("rate", "max_queued", "retries", "journal")
+
+
+def _cli_throttle(args):
+    """
+    Make the submission throttle that `divvy submit` options ask for.
+
+    :param argparse.Namespace args: parsed command-line arguments
+    :return divvy.SubmissionThrottle | NoneType: throttle, or None if no
+        throttling option was given and nothing is packed
+    """
+    if not args.pack and all(getattr(args, o, None) is None for o in _THROTTLE_OPTIONS):
+        return None
+    from .throttle import SubmissionThrottle
+
+    return SubmissionThrottle(
+        rate=args.rate,
+        max_queued=args.max_queued,
+        retries=3 if args.retries is None else args.retries,
+        journal=args.journal,
+    )
+
+
+def _server_available(socket_path):
+    """
+    Check that a divvy server answers on a socket, e.g. one from the
+    environment that may be left over from a server that's gone.
+
+    :param str socket_path: path to the server socket
+    :return bool: whether the server answered
+    """
+    from .server import request
+
+    try:
+        request(socket_path, {"command": "ping"}, timeout=1)
+    except ServerError as e:
+        _LOGGER.warning("{}; rendering in this process instead".format(e))
+        return False
+    return True
+
+
+def _request_server(socket_path, args, divcfg, vars_groups):
+    """
+    Have a divvy server write, or submit, the job script for a CLI call.
+
+    :param str socket_path: path to the server socket
+    :param argparse.Namespace args: parsed command-line arguments
+    :param str divcfg: path to the divvy configuration file
+    :param list[Mapping] vars_groups: extra variables for the template
+    :return divvy.SubmissionResult | NoneType: outcome of the submission, or
+        None for a write
+    """
+    from .server import request
+
+    _LOGGER.info(
+        "Sending {} request to divvy server: {}".format(args.command, socket_path)
+    )
+    response = request(
+        socket_path,
+        {
+            "command": args.command,
+            "config": os.path.abspath(divcfg),
+            "package": args.package,
+            "variables": vars_groups,
+            "output": os.path.abspath(args.outfile) if args.outfile else None,
+            "incremental": getattr(args, "incremental", False),
+        },
+    )
+    if args.command == "write":
+        if "content" in response:
+            print(response["content"])
+        return None
+    from .submission import SubmissionResult
+
+    return SubmissionResult(
+        response["script"],
+        None,
+        response["returncode"],
+        response["stdout"],
+        response["stderr"],
+        response["job_id"],
+        None,
+    )
+
+
 def main():
     """Primary workflow"""
 
@@ -503,6 +1990,11 @@ def main():
     logmuse.init_logger("yacman", **logger_kwargs)
     global _LOGGER
     _LOGGER = logmuse.logger_via_cli(args)
+    # the logger that the modules' loggers report to
+    logmuse.logger_via_cli(args, name="divvy")
+
+    if (args.profile or args.profile_format) and profiling.get_profile() is None:
+        profiling.enable(report=args.profile_format or PROFILE_FORMATS[0])
 
     if not args.command:
         parser.print_help()
@@ -516,10 +2008,77 @@ def main():
         divvy_init(divcfg, DEFAULT_CONFIG_FILEPATH)
         sys.exit(0)
 
+    if args.command == "jobs":
+        from .ledger import JobLedger, format_jobs, parse_since
+
+        try:
+            since = parse_since(args.since) if args.since else None
+        except ValueError as e:
+            parser.error(str(e))
+        with JobLedger(args.ledger) as ledger:
+            records = ledger.jobs(
+                package=args.package,
+                job_id=args.job_id,
+                script=args.script,
+                since=since,
+                failed=True if args.failed else None,
+                limit=args.limit or None,
+            )
+        print(format_jobs(records, args.format))
+        sys.exit(0)
+
+    if args.command == "serve":
+        from .packing import parse_mem
+        from .registry import ConfigRegistry
+        from .server import DivvyServer, default_socket_path
+
+        config_files = args.config or [select_divvy_config(None)]
+        try:
+            max_size = parse_mem(args.max_memory) * 2**20 if args.max_memory else None
+        except ValueError as e:
+            parser.error(str(e))
+        registry = ConfigRegistry(max_configs=args.max_configs, max_size=max_size)
+        server = DivvyServer(
+            args.socket or default_socket_path(), config_files, registry
+        )
+        _LOGGER.info("Serving on {}".format(server.socket_path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            _LOGGER.info("Shutting down")
+        finally:
+            server.server_close()
+        sys.exit(0)
+
     _LOGGER.debug("Divvy config: {}".format(args.config))
     divcfg = select_divvy_config(args.config)
     _LOGGER.info("Using divvy config: {}".format(divcfg))
-    dcc = ComputingConfiguration(filepath=divcfg)
+    socket_path = None
+    if args.command in ("write", "submit") and not (
+        args.array
+        or args.pack
+        or getattr(args, "stream", None)
+        or getattr(args, "ledger", None)
+        or getattr(args, "check", False)
+        or getattr(args, "bundle", None)
+        or getattr(args, "atomic", False)
+        or getattr(args, "fsync", False)
+        or any(getattr(args, o, None) is not None for o in _THROTTLE_OPTIONS)
+    ):
+        socket_path = args.socket or os.environ.get(SOCKET_VARNAME)
+        if socket_path and not args.socket and not _server_available(socket_path):
+            socket_path = None
+    dcc = None if socket_path else ComputingConfiguration(filepath=divcfg)
+
+    if args.command == "check":
+        from .lint import format_lint
+
+        reports = dcc.check_packages(
+            args.package,
+            {y[0]: y[1] for y in [x.split("=") for x in args.compute or []]},
+        )
+        print(format_lint(reports))
+        sys.exit(0 if all(r.ok for r in reports) else 1)
 
     if args.command == "list":
         # Output header via logger and content via print so the user can
@@ -538,21 +2097,132 @@ def main():
         cli_vars = {}
 
     if args.command == "write" or args.command == "submit":
-        try:
-            dcc.activate_package(args.package)
-        except AttributeError:
-            parser.print_help(sys.stderr)
-            sys.exit(1)
+        from .inputs import iter_variable_groups
+
+        if getattr(args, "jobs", None) and not args.stream:
+            parser.error("--jobs only applies to writing with --stream")
+
+        throttle = _cli_throttle(args) if args.command == "submit" else None
+        if throttle is not None and args.array:
+            parser.error(
+                "An array job is one submission; --rate, --max-queued, "
+                "--retries and --journal don't apply to it"
+            )
+
+        ledger = None
+        if getattr(args, "ledger", None):
+            from .ledger import JobLedger
+
+            ledger = JobLedger(args.ledger)
 
         if args.settings:
+            import yaml
+
             _LOGGER.info("Loading settings file: %s", args.settings)
             with open(args.settings, "r") as f:
-                vars_groups = [cli_vars, yaml.load(f, SafeLoader)]
+                vars_groups = [cli_vars, yaml.load(f, yaml.SafeLoader)]
         else:
             vars_groups = [cli_vars]
 
         _LOGGER.debug(vars_groups)
-        if args.command == "write":
-            dcc.write_script(args.outfile, vars_groups)
-        elif args.command == "submit":
-            dcc.submit(args.outfile, vars_groups)
+        if dcc is not None:
+            try:
+                dcc.activate_package(args.package)
+            except AttributeError:
+                parser.print_help(sys.stderr)
+                sys.exit(1)
+
+        if socket_path:
+            try:
+                result = _request_server(socket_path, args, divcfg, vars_groups)
+            except ServerError as e:
+                _LOGGER.error(str(e))
+                sys.exit(1)
+            if args.command == "write":
+                sys.exit(0)
+        elif args.array:
+            if not args.outfile:
+                parser.error("An array job needs an output filepath (-o)")
+            _LOGGER.info("Loading array tasks table: %s", args.array)
+            tasks = list(iter_variable_groups(args.array))
+            if args.command == "write":
+                dcc.write_array_script(args.outfile, tasks, vars_groups)
+                sys.exit(0)
+            result = dcc.submit_array(args.outfile, tasks, vars_groups, ledger=ledger)
+        elif args.pack:
+            if not args.outfile:
+                parser.error("Packing needs an output filepath pattern (-o)")
+            _LOGGER.info("Loading jobs to pack: %s", args.pack)
+            jobs = list(iter_variable_groups(args.pack))
+            limits = (args.max_cores, args.max_mem, args.max_time)
+            if args.command == "write":
+                dcc.write_packed_scripts(args.outfile, jobs, vars_groups, *limits)
+                sys.exit(0)
+            results = dcc.submit_packed(
+                args.outfile,
+                jobs,
+                vars_groups,
+                *limits,
+                throttle=throttle,
+                ledger=ledger,
+            )
+            for result in results:
+                sys.stdout.write(result.stdout)
+                sys.stderr.write(result.stderr)
+                if result.job_id:
+                    _LOGGER.info("Job ID: {}".format(result.job_id))
+            sys.exit(max([r.returncode for r in results] + [0]))
+        elif args.command == "write":
+            writer = _cli_writer(parser, args)
+            if args.stream:
+                if not args.outfile:
+                    parser.error("Streaming needs an output filepath pattern (-o)")
+                if args.stream != "-" and not args.stream_format:
+                    from .inputs import guess_stream_format
+
+                    try:
+                        guess_stream_format(args.stream)
+                    except ValueError as e:
+                        parser.error("{}; or give --stream-format".format(e))
+                _LOGGER.info("Streaming job variables from: %s", args.stream)
+                scripts = dcc.stream_scripts(
+                    iter_variable_groups(args.stream, args.stream_format),
+                    args.outfile,
+                    vars_groups,
+                    workers=args.jobs,
+                    backend=args.backend,
+                    incremental=args.incremental,
+                    writer=writer,
+                    check=args.check,
+                )
+            else:
+                scripts = dcc.write_scripts(
+                    [(args.outfile, vars_groups)],
+                    lazy=True,
+                    workers=args.jobs,
+                    backend=args.backend,
+                    incremental=args.incremental,
+                    check=args.check,
+                    writer=writer,
+                )
+            try:
+                if writer is None:
+                    for _ in scripts:
+                        pass
+                else:
+                    with writer:
+                        for _ in scripts:
+                            pass
+            except MissingVariablesError as e:
+                _LOGGER.error(str(e))
+                sys.exit(1)
+            sys.exit(0)
+        else:
+            result = dcc.submit(
+                args.outfile, vars_groups, ledger=ledger, throttle=throttle
+            )
+        sys.stdout.write(result.stdout)
+        sys.stderr.write(result.stderr)
+        if result.job_id:
+            _LOGGER.info("Job ID: {}".format(result.job_id))
+        sys.exit(result.returncode)
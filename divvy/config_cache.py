@@ -0,0 +1,214 @@
+""" Persistent cache of validated divvy configurations """
+
+import hashlib
+import logging
+import os
+import pickle
+import stat
+import tempfile
+from collections.abc import Mapping
+
+from ._version import __version__
+from .const import CONFIG_CACHE_DIR_VARNAME, CONFIG_CACHE_VARNAME
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["ConfigCache", "config_cache_enabled"]
+
+# Bump when the layout of cache files changes
+_CACHE_FORMAT = 2
+
+
+def config_cache_enabled():
+    """
+    Determine whether the persistent configuration cache is switched on.
+
+    :return bool: whether the cache environment variable is set to a true value
+    """
+    return os.environ.get(CONFIG_CACHE_VARNAME, "").lower() in ("1", "true", "yes")
+
+
+def default_cache_dir():
+    """
+    Folder for the persistent configuration cache.
+
+    :return str: the folder named by the cache folder environment variable,
+        or 'divvy' in the XDG cache folder
+    """
+    if os.environ.get(CONFIG_CACHE_DIR_VARNAME):
+        return os.path.expanduser(os.environ[CONFIG_CACHE_DIR_VARNAME])
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return os.path.join(os.path.expanduser(base), "divvy")
+
+
+class ConfigCache(object):
+    """
+    On-disk cache of validated configuration file contents.
+
+    An entry is keyed by the configuration file's absolute path, and is only
+    used if the file's modification time, size and content hash, the schema's
+    content hash and the divvy version all match those at the time the entry
+    was stored, as do the modification times and sizes of the files that the
+    configuration extends or includes. Entries are pickled, so loading one
+    skips both YAML parsing and schema validation.
+
+    Unpickling runs code that a cache file can name, so the cache folder is
+    only used if it's owned by the current user and no one else may write
+    to it; it's created that way. Don't point the cache folder environment
+    variable at a folder that others share.
+
+    :param str cache_dir: folder to keep cache files in
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+
+    def _entry_path(self, filepath):
+        name = hashlib.sha256(filepath.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, name + ".pickle")
+
+    @staticmethod
+    def fingerprint(filepath, schema_path):
+        """
+        Summarize everything that a cached configuration depends on.
+
+        Take the fingerprint before reading the configuration file, so that
+        an edit made while it's read invalidates what gets cached.
+
+        :param str filepath: absolute path to the configuration file
+        :param str schema_path: path to the schema the file is validated with
+        :return tuple: fingerprint of the configuration file and its context
+        """
+        st = os.stat(filepath)
+        with open(filepath, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        with open(schema_path, "rb") as f:
+            schema_hash = hashlib.sha256(f.read()).hexdigest()
+        return (
+            _CACHE_FORMAT,
+            __version__,
+            filepath,
+            st.st_mtime_ns,
+            st.st_size,
+            content_hash,
+            schema_hash,
+        )
+
+    def load(self, filepath, fingerprint):
+        """
+        Get the cached contents of a configuration file, if still valid.
+
+        :param str filepath: absolute path to the configuration file
+        :param tuple fingerprint: current fingerprint of the configuration
+        :return (dict, dict, list) | NoneType: configuration file contents,
+            the schema and the path, modification time and size of each file
+            the configuration is made of, or None if there is no valid cache
+            entry
+        """
+        if not self._private():
+            return None
+        try:
+            with open(self._entry_path(filepath), "rb") as f:
+                cached = pickle.load(f)
+            if not isinstance(cached, dict):
+                raise TypeError("not a cache entry: {}".format(type(cached)))
+            fresh = cached.get("fingerprint") == fingerprint and all(
+                _signature(path) == signature for path, signature in cached["sources"]
+            )
+            entry = cached["entries"], cached["schema"], list(cached["sources"])
+        except Exception as e:
+            # missing, truncated, or from another version or program
+            _LOGGER.debug("No cached configuration for {}: {}".format(filepath, e))
+            return None
+        if not fresh:
+            _LOGGER.debug("Cached configuration is stale: {}".format(filepath))
+            return None
+        _LOGGER.debug("Using cached configuration: {}".format(filepath))
+        return entry
+
+    def store(self, filepath, fingerprint, entries, schema, sources=()):
+        """
+        Cache the validated contents of a configuration file.
+
+        Failure to write the cache is logged and otherwise ignored.
+
+        :param str filepath: absolute path to the configuration file
+        :param tuple fingerprint: fingerprint of the configuration taken
+            before it was read
+        :param Mapping entries: configuration file contents
+        :param dict schema: the schema
+        :param Iterable[(str, (int, int))] sources: path, modification time
+            and size of each file the configuration is made of, as they were
+            before it was read
+        """
+        try:
+            data = {
+                "fingerprint": fingerprint,
+                "entries": _plain(entries),
+                "schema": schema,
+                "sources": list(sources),
+            }
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, mode=0o700)
+            if not self._private():
+                return
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._entry_path(filepath))
+        except (OSError, pickle.PicklingError) as e:
+            _LOGGER.warning("Could not cache configuration {}: {}".format(filepath, e))
+        else:
+            _LOGGER.debug("Cached configuration: {}".format(filepath))
+
+    def _private(self):
+        """
+        Check that only the current user can write to the cache folder.
+
+        :return bool: whether the cache folder is owned by the current user,
+            and not writable by its group or others; True if there's no such
+            folder yet, or no user IDs, as on Windows
+        """
+        if not hasattr(os, "getuid"):
+            return True
+        try:
+            st = os.stat(self.cache_dir)
+        except OSError:
+            return True
+        if st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return True
+        _LOGGER.warning(
+            "Not using the configuration cache in {}: it must be owned by you, "
+            "and not writable by others".format(self.cache_dir)
+        )
+        return False
+
+    def clear(self):
+        """Remove all the cache files."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pickle"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _plain(value):
+    """
+    Convert nested mappings to plain dicts, values as stored.
+
+    This avoids attmap's `to_dict`, which recurses once per key and so
+    exhausts the stack for configurations with many packages.
+    """
+    if isinstance(value, Mapping):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
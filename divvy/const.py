@@ -12,6 +12,36 @@ DEFAULT_CONFIG_FILEPATH = os.path.join(
 DEFAULT_CONFIG_SCHEMA = os.path.join(
     os.path.dirname(__file__), "schemas", "divvy_config_schema.yaml"
 )
+# Set to a true value to cache validated configurations on disk
+CONFIG_CACHE_VARNAME = "DIVVY_CONFIG_CACHE"
+CONFIG_CACHE_DIR_VARNAME = "DIVVY_CACHE_DIR"
+# Set to 1, 'table' or 'json' to profile divvy and report at exit
+PROFILE_VARNAME = "DIVVY_PROFILE"
+PROFILE_FILE_VARNAME = "DIVVY_PROFILE_FILE"
+PROFILE_FORMATS = ("table", "json")
+# Set to a true value to record submissions in the job ledger
+LEDGER_VARNAME = "DIVVY_LEDGER"
+LEDGER_PATH_VARNAME = "DIVVY_LEDGER_PATH"
+JOBS_FORMATS = ("table", "tsv", "json")
+# Name of the file, in each output folder, with the inputs of written scripts
+MANIFEST_FILENAME = ".divvy_manifest.json"
+# Path to the socket of a running `divvy serve`
+SOCKET_VARNAME = "DIVVY_SOCKET"
+DEFAULT_TEMPLATE_CACHE_SIZE = 32
+# Templates kept by a registry, which are shared by all its configurations
+DEFAULT_REGISTRY_TEMPLATE_CACHE_SIZE = 256
+DEFAULT_MAX_IN_FLIGHT = 16
+# Worker pool kinds for writing scripts
+POOL_BACKENDS = ("thread", "process")
+# Job variables stream format by file extension
+STREAM_FORMATS = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".csv": "csv",
+    ".tsv": "tsv",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+}
 COMPUTE_CONSTANTS = [
     "COMPUTE_SETTINGS_VARNAME",
     "DEFAULT_COMPUTE_RESOURCES_NAME",
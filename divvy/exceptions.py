@@ -0,0 +1,64 @@
+""" Package exception types """
+
+__all__ = [
+    "ConfigCompositionError",
+    "DivvyError",
+    "MissingVariablesError",
+    "ScriptWriteError",
+    "ServerError",
+]
+
+
+class DivvyError(Exception):
+    """Base divvy exception type."""
+
+    pass
+
+
+class ScriptWriteError(DivvyError):
+    """Some scripts of a batch could not be written."""
+
+    def __init__(self, errors, total):
+        """
+        :param list[(str, Exception)] errors: output path and error for each
+            script that could not be written
+        :param int total: number of scripts in the batch
+        """
+        self.errors = errors
+        self.total = total
+        super(ScriptWriteError, self).__init__(
+            "{} of {} scripts could not be written; first error ({}): {}".format(
+                len(errors), total, errors[0][0], errors[0][1]
+            )
+        )
+
+
+class MissingVariablesError(DivvyError):
+    """Some jobs of a batch would leave template placeholders unfilled."""
+
+    def __init__(self, missing, total):
+        """
+        :param list[(str, list[str])] missing: output path, or job number,
+            and the names of the unfilled placeholders, for each such job
+        :param int total: number of jobs in the batch
+        """
+        self.missing = missing
+        self.total = total
+        super(MissingVariablesError, self).__init__(
+            "{} of {} jobs would leave template placeholders unfilled; first "
+            "({}): {}".format(
+                len(missing), total, missing[0][0], ", ".join(missing[0][1])
+            )
+        )
+
+
+class ConfigCompositionError(DivvyError):
+    """Configuration files or compute packages can't be composed."""
+
+    pass
+
+
+class ServerError(DivvyError):
+    """A divvy server could not be reached or could not carry out a request."""
+
+    pass
@@ -0,0 +1,75 @@
+""" Streaming readers of job variables tables """
+
+import csv
+import json
+import logging
+import os
+import sys
+
+from .const import STREAM_FORMATS
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["STREAM_FORMATS", "iter_variable_groups", "guess_stream_format"]
+
+
+def guess_stream_format(filepath):
+    """
+    Determine the format of a job variables file from its extension.
+
+    :param str filepath: path to the file
+    :return str: format name, one of the values of `STREAM_FORMATS`
+    :raise ValueError: if the extension is not recognized
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    try:
+        return STREAM_FORMATS[ext]
+    except KeyError:
+        raise ValueError(
+            "Can't tell the format of '{}'; use one of: {}".format(
+                filepath, ", ".join(sorted(set(STREAM_FORMATS.values())))
+            )
+        )
+
+
+def iter_variable_groups(filepath, fmt=None):
+    """
+    Read a job variables file one group of variables at a time.
+
+    Each JSON Lines line, CSV/TSV row or YAML document is one group of
+    variables, e.g. for one job, and only one is held in memory at a time.
+
+    :param str filepath: path to the file, or '-' for standard input
+    :param str fmt: format of the file, 'jsonl', 'csv', 'tsv' or 'yaml';
+        by default guessed from the file extension, or JSON Lines for
+        standard input
+    :return Generator[Mapping]: variables groups
+    """
+    fmt = fmt or ("jsonl" if filepath == "-" else guess_stream_format(filepath))
+    if filepath == "-":
+        for group in _iter_groups(sys.stdin, fmt):
+            yield group
+        return
+    # the csv module handles the line endings, including within quoted fields
+    newline = "" if fmt in ("csv", "tsv") else None
+    with open(filepath, "r", newline=newline) as f:
+        for group in _iter_groups(f, fmt):
+            yield group
+
+
+def _iter_groups(f, fmt):
+    if fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt in ("csv", "tsv"):
+        for row in csv.DictReader(f, delimiter="\t" if fmt == "tsv" else ","):
+            yield row
+    elif fmt == "yaml":
+        import yaml
+
+        for doc in yaml.load_all(f, yaml.SafeLoader):
+            if doc is not None:
+                yield doc
+    else:
+        raise ValueError("Unknown job variables format: '{}'".format(fmt))
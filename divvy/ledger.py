@@ -0,0 +1,337 @@
+""" Local ledger of submitted job scripts, in SQLite """
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from .const import JOBS_FORMATS, LEDGER_PATH_VARNAME, LEDGER_VARNAME
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = [
+    "JobLedger",
+    "JobRecord",
+    "default_ledger_path",
+    "format_jobs",
+    "ledger_enabled",
+    "parse_since",
+    "variables_digest",
+]
+
+# Bump, with a migration in `_SCHEMA`, when the tables change
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    submitted_at REAL NOT NULL,
+    finished_at REAL,
+    config TEXT,
+    package TEXT,
+    scheduler TEXT,
+    script TEXT NOT NULL,
+    variables_hash TEXT,
+    job_id TEXT,
+    returncode INTEGER,
+    command TEXT,
+    stderr TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_submitted_at ON submissions (submitted_at);
+CREATE INDEX IF NOT EXISTS submissions_job_id ON submissions (job_id);
+CREATE INDEX IF NOT EXISTS submissions_script ON submissions (script);
+"""
+
+JobRecord = namedtuple(
+    "JobRecord",
+    [
+        "id",
+        "submitted_at",
+        "finished_at",
+        "config",
+        "package",
+        "scheduler",
+        "script",
+        "variables_hash",
+        "job_id",
+        "returncode",
+        "command",
+        "stderr",
+    ],
+)
+
+_COLUMNS = ", ".join(JobRecord._fields)
+
+# Error output kept for each submission, enough for the scheduler's message
+_MAX_STDERR = 4000
+
+_AGE_REGEX = re.compile(r"^(\d+(?:\.\d*)?)([smhdw])$")
+_AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# Columns of the job listing table
+_TABLE_FIELDS = [
+    "submitted_at",
+    "package",
+    "scheduler",
+    "job_id",
+    "returncode",
+    "script",
+]
+
+
+def ledger_enabled():
+    """
+    Determine whether submissions are recorded in the ledger by default.
+
+    :return bool: whether the ledger environment variable is set to a true
+        value
+    """
+    return os.environ.get(LEDGER_VARNAME, "").lower() in ("1", "true", "yes")
+
+
+def default_ledger_path():
+    """
+    Path of the ledger, when not given explicitly.
+
+    :return str: the path named by the ledger path environment variable, or
+        'ledger.sqlite' in the 'divvy' folder of the XDG data folder
+    """
+    if os.environ.get(LEDGER_PATH_VARNAME):
+        return os.path.expanduser(os.environ[LEDGER_PATH_VARNAME])
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join("~", ".local", "share")
+    return os.path.join(os.path.expanduser(base), "divvy", "ledger.sqlite")
+
+
+class JobLedger(object):
+    """
+    Record of submitted job scripts, and of the job IDs the schedulers
+    assigned them, in a SQLite database.
+
+    Each batch of submissions is recorded with a single transaction. The
+    database is in write-ahead log mode, so that it can be queried while
+    submissions are recorded, also from other processes. A ledger object may
+    be used from several threads.
+
+    :param str path: path to the database file; see `default_ledger_path`
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_ledger_path()
+        folder = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < _SCHEMA_VERSION:
+                self._conn.executescript(_SCHEMA)
+                self._conn.execute("PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def record(
+        self, results, config=None, package=None, scheduler=None, variables=None
+    ):
+        """
+        Record a batch of submissions.
+
+        Each submission is recorded with the time its own command started,
+        or, if that's unknown, the time it's recorded less its duration.
+
+        :param Iterable[divvy.SubmissionResult] results: outcome of each
+            submission; results without a command, which weren't submitted
+            this time, are left out
+        :param str config: path to the divvy configuration the scripts were
+            written with
+        :param str package: name of the compute package
+        :param str scheduler: name of the scheduler, see
+            `divvy.submission.scheduler_name`
+        :param Mapping[str, Sequence[Mapping[str, str]]] variables: resolved
+            variables each script was written with, by script path, to record
+            a digest of; see `variables_digest`. Scripts without any are
+            recorded without a digest
+        :return int: number of submissions recorded
+        """
+        now = time.time()
+        variables = variables or {}
+        rows = [
+            (
+                r.started if r.started is not None else now - (r.duration or 0),
+                (r.started + r.duration) if r.started is not None else now,
+                config,
+                package,
+                scheduler,
+                os.path.abspath(r.script),
+                (
+                    variables_digest(variables[r.script])
+                    if r.script in variables
+                    else None
+                ),
+                r.job_id,
+                r.returncode,
+                " ".join(r.command),
+                (r.stderr or "")[-_MAX_STDERR:] or None,
+            )
+            for r in results
+            if r.command is not None
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO submissions ({}) VALUES ({})".format(
+                    ", ".join(JobRecord._fields[1:]),
+                    ", ".join("?" * (len(JobRecord._fields) - 1)),
+                ),
+                rows,
+            )
+        _LOGGER.debug("Recorded {} submissions in {}".format(len(rows), self.path))
+        return len(rows)
+
+    def jobs(
+        self,
+        package=None,
+        job_id=None,
+        script=None,
+        since=None,
+        failed=None,
+        limit=None,
+    ):
+        """
+        Query the recorded submissions, most recent first.
+
+        :param str package: only those with this compute package
+        :param str job_id: only those with this job ID
+        :param str script: only those whose script path contains this text
+        :param float since: only those submitted at or after this time, in
+            seconds since the epoch
+        :param bool failed: only failed submissions if true, only successful
+            ones if false
+        :param int limit: most records to return
+        :return list[JobRecord]: the matching submissions
+        """
+        where = []
+        params = []
+        if package is not None:
+            where.append("package = ?")
+            params.append(package)
+        if job_id is not None:
+            where.append("job_id = ?")
+            params.append(str(job_id))
+        if script is not None:
+            where.append("instr(script, ?) > 0")
+            params.append(script)
+        if since is not None:
+            where.append("submitted_at >= ?")
+            params.append(since)
+        if failed is not None:
+            where.append("returncode != 0" if failed else "returncode = 0")
+        query = "SELECT {} FROM submissions".format(_COLUMNS)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY submitted_at DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            return [JobRecord(*row) for row in self._conn.execute(query, params)]
+
+
+def variables_digest(groups):
+    """
+    Digest of the resolved variables a script was written with.
+
+    :param Sequence[Mapping[str, str]] groups: text of each slot filled, as
+        given by `SubmissionTemplate.values`: one mapping for a script, or
+        one for each task of an array job or each job of a packed script
+    :return str: hex digest of the variables, the same for scripts written
+        with the same variables
+    """
+    h = hashlib.sha256()
+    for values in groups:
+        h.update(b"\1")
+        for name in sorted(values):
+            h.update(b"\0" + name.encode() + b"\0" + values[name].encode())
+    return h.hexdigest()
+
+
+def parse_since(text, now=None):
+    """
+    Read the start of a period of time, as an age or a date.
+
+    :param str text: age, e.g. '90m', '12h' or '7d', or a local date and
+        optional time in ISO format, e.g. '2024-05-01' or '2024-05-01T14:00'
+    :param float now: current time, in seconds since the epoch
+    :return float: start of the period, in seconds since the epoch
+    :raise ValueError: if the text is neither an age nor a date
+    """
+    match = _AGE_REGEX.match(text.strip())
+    if match:
+        age = float(match.group(1)) * _AGE_UNITS[match.group(2)]
+        return (time.time() if now is None else now) - age
+    try:
+        return datetime.strptime(text.strip(), "%Y-%m-%d").timestamp()
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(text.strip(), fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError("Not an age or a date: '{}'".format(text))
+
+
+def format_jobs(records, fmt="table"):
+    """
+    Render job ledger records as text.
+
+    :param Iterable[JobRecord] records: records to render
+    :param str fmt: 'table', 'tsv' or 'json'
+    :return str: the records, one per line for 'table' and 'tsv', with a
+        header, or as a JSON list of objects
+    """
+    if fmt not in JOBS_FORMATS:
+        raise ValueError(
+            "Unknown jobs format '{}'; choose from: {}".format(
+                fmt, ", ".join(JOBS_FORMATS)
+            )
+        )
+    records = list(records)
+    if fmt == "json":
+        return json.dumps([r._asdict() for r in records], indent=2)
+    rows = [[_cell(name, getattr(r, name)) for name in _TABLE_FIELDS] for r in records]
+    header = ["submitted", "package", "scheduler", "job_id", "exit", "script"]
+    if fmt == "tsv":
+        return "\n".join("\t".join(row) for row in [header] + rows)
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+        for row in [header] + rows
+    )
+
+
+def _cell(name, value):
+    if value is None:
+        return "-"
+    if name == "submitted_at":
+        return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+    return str(value)
@@ -0,0 +1,114 @@
+""" Pre-flight checks of compute packages' submission templates """
+
+import logging
+from collections import namedtuple
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["PackageReport", "format_lint", "lint_packages"]
+
+
+class PackageReport(
+    namedtuple(
+        "PackageReport",
+        ["package", "template", "placeholders", "adapted", "unfilled", "error"],
+    )
+):
+    """
+    Outcome of checking a compute package's submission template.
+
+    :param str package: name of the package
+    :param str template: path to the submission template
+    :param tuple[str] placeholders: the template's placeholders
+    :param list[str] adapted: placeholders that only adapters fill, so are
+        filled if the extra variables have the adapted values
+    :param list[str] unfilled: placeholders that neither the package, the
+        adapters nor the given variables fill
+    :param str error: why the template could not be checked, if it couldn't
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """
+        Whether all the template's placeholders can be filled.
+
+        :return bool: whether the template was read, and nothing is unfilled
+        """
+        return self.error is None and not self.unfilled
+
+
+def lint_packages(dcc, packages=None, extra_vars=None):
+    """
+    Check that the placeholders of packages' templates can all be filled.
+
+    A placeholder can be filled by a package setting of the same name, by an
+    adapter, or by a variable that is always given, e.g. on the command line.
+    Each template is read and compiled once, through the configuration's
+    template cache.
+
+    :param divvy.ComputingConfiguration dcc: configuration to check
+    :param Iterable[str] packages: names of the packages to check; all of
+        them by default
+    :param Iterable[Mapping] | Mapping extra_vars: variables that will be
+        given for every job
+    :return list[PackageReport]: outcome for each package, in order of name
+    """
+    if not extra_vars:
+        extra_vars = []
+    elif not isinstance(extra_vars, list):
+        extra_vars = [extra_vars]
+    given = {str(k).upper() for group in extra_vars for k in group}
+    template_cache = dcc["__internal"].template_cache
+    reports = []
+    for name in sorted(packages or dcc.compute_packages or []):
+        snapshot = dcc._package_snapshot(name)
+        if snapshot is None:
+            reports.append(
+                PackageReport(name, None, (), [], [], "no such compute package")
+            )
+            continue
+        path = snapshot.compute.get("submission_template")
+        try:
+            template = template_cache.get(path)
+        except (OSError, TypeError) as e:
+            reports.append(
+                PackageReport(
+                    name, path, (), [], [], "can't read template: {}".format(e)
+                )
+            )
+            continue
+        settings = {str(k).upper() for k in snapshot.compute}
+        adapters = {n.upper() for n in snapshot.adapter_plan.names}
+        known = settings | given
+        placeholders = template.placeholders
+        adapted = [n for n in placeholders if n in adapters and n not in known]
+        unfilled = [n for n in placeholders if n not in known and n not in adapters]
+        _LOGGER.debug(
+            "Package '{}': {} placeholders, unfilled: {}".format(
+                name, len(placeholders), ", ".join(unfilled) or "none"
+            )
+        )
+        reports.append(PackageReport(name, path, placeholders, adapted, unfilled, None))
+    return reports
+
+
+def format_lint(reports):
+    """
+    Render package check outcomes as text.
+
+    :param Iterable[PackageReport] reports: outcomes to render
+    :return str: a line per package, followed by one with the placeholders
+        that only adapters fill, if any
+    """
+    lines = []
+    for r in reports:
+        if r.error is not None:
+            lines.append("{}: ERROR {}".format(r.package, r.error))
+            continue
+        status = "ok" if r.ok else "UNFILLED {}".format(", ".join(r.unfilled))
+        lines.append("{}: {} ({})".format(r.package, status, r.template))
+        if r.adapted:
+            lines.append("  from adapters: {}".format(", ".join(r.adapted)))
+    return "\n".join(lines)
@@ -0,0 +1,136 @@
+""" Manifests of written scripts, for rewriting only those that changed """
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from . import profiling
+from .const import MANIFEST_FILENAME
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["RenderManifest"]
+
+# Bump when the layout of manifest files changes
+_MANIFEST_FORMAT = 1
+
+
+class RenderManifest(object):
+    """
+    Record of the inputs of the scripts written to each folder.
+
+    Each folder that scripts are written to gets a manifest file, which holds
+    a digest of the template and of the values that filled it, along with the
+    modification time and size of the written file, for each script. A script
+    is left untouched if its digest is the same as when it was written and
+    the file itself hasn't changed since. Updates are thread-safe. Separate
+    manifests that write to the same folder at once may lose each other's
+    entries, which only means those scripts are written again next time.
+
+    :param str filename: name of the manifest file in each output folder
+    """
+
+    def __init__(self, filename=MANIFEST_FILENAME):
+        self.filename = filename
+        self.written = 0
+        self.skipped = 0
+        self._folders = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{}(written={}, skipped={})".format(
+            self.__class__.__name__, self.written, self.skipped
+        )
+
+    @staticmethod
+    def digest(template, values):
+        """
+        Digest of what a script's content is made of.
+
+        :param divvy.SubmissionTemplate template: compiled template
+        :param Mapping[str, str] values: text for each filled slot, as given
+            by `SubmissionTemplate.values`
+        :return str: hex digest of the template and the values
+        """
+        h = hashlib.sha256(template.digest.encode())
+        for name in sorted(values):
+            h.update(b"\0" + name.encode() + b"\0" + values[name].encode())
+        return h.hexdigest()
+
+    def unchanged(self, path, digest):
+        """
+        Whether a script was written with the same inputs and left as is.
+
+        Scripts that are unchanged count as skipped.
+
+        :param str path: path to the script
+        :param str digest: digest of the script's inputs, see `digest`
+        :return bool: whether the script can be left untouched
+        """
+        folder, name = os.path.split(os.path.abspath(path))
+        with self._lock:
+            entry = self._entries(folder).get(name)
+        if entry is None or entry[0] != digest:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if [st.st_mtime_ns, st.st_size] != entry[1:]:
+            return False
+        with self._lock:
+            self.skipped += 1
+        profiling.count("scripts.skipped")
+        return True
+
+    def record(self, path, digest):
+        """
+        Note the inputs of a script that was just written.
+
+        :param str path: path to the script
+        :param str digest: digest of the script's inputs, see `digest`
+        """
+        folder, name = os.path.split(os.path.abspath(path))
+        st = os.stat(path)
+        with self._lock:
+            self._entries(folder)[name] = [digest, st.st_mtime_ns, st.st_size]
+            self._dirty.add(folder)
+            self.written += 1
+
+    def save(self):
+        """Write the manifest file of each folder that scripts were written to."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            for folder in dirty:
+                self._save(folder, self._folders[folder])
+
+    def _entries(self, folder):
+        entries = self._folders.get(folder)
+        if entries is None:
+            entries = self._folders[folder] = self._load(folder)
+        return entries
+
+    def _load(self, folder):
+        path = os.path.join(folder, self.filename)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("format") != _MANIFEST_FORMAT:
+            return {}
+        return data.get("scripts", {})
+
+    def _save(self, folder, entries):
+        data = {"format": _MANIFEST_FORMAT, "scripts": entries}
+        try:
+            fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"), sort_keys=True)
+            os.replace(tmp, os.path.join(folder, self.filename))
+        except OSError as e:
+            _LOGGER.warning("Could not save manifest in {}: {}".format(folder, e))
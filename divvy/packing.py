@@ -0,0 +1,194 @@
+""" Packing of many small jobs into fewer, larger scheduler allocations """
+
+import logging
+import re
+from collections import namedtuple
+
+from .arrays import _ansi_quote
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["Resources", "pack_jobs", "parse_mem", "parse_time", "render_wrapper"]
+
+# Cores, memory in megabytes and time in seconds; for limits, None is no limit
+Resources = namedtuple("Resources", ["cores", "mem", "time"])
+
+# Memory amount with an optional unit, in megabytes when there is none, as
+# SLURM reads it
+_MEM_REGEX = re.compile(r"^\s*(\d+(?:\.\d*)?)\s*([KMGT]?)B?\s*$", re.IGNORECASE)
+_MEM_UNITS = {"K": 1.0 / 1024, "": 1, "M": 1, "G": 1024, "T": 1024**2}
+
+# SLURM time limit formats: M, M:S, H:M:S, D-H, D-H:M and D-H:M:S
+_TIME_REGEX = re.compile(r"^\s*(?:(\d+)-)?(\d+)(?::(\d+))?(?::(\d+))?\s*$")
+
+_MARKER = "\x00CODE\x00"
+
+
+def parse_mem(text):
+    """
+    Read a memory amount, e.g. '4G', '500M' or '2000' (megabytes).
+
+    :param str | int text: memory amount
+    :return int: megabytes, rounded up
+    :raise ValueError: if the amount can't be read
+    """
+    match = _MEM_REGEX.match(str(text))
+    if not match:
+        raise ValueError("Not a memory amount: '{}'".format(text))
+    mb = float(match.group(1)) * _MEM_UNITS[match.group(2).upper()]
+    return int(-(-mb // 1))
+
+
+def parse_time(text):
+    """
+    Read a time limit in any of the formats SLURM accepts, e.g. '30'
+    (minutes), '02:00:00' or '1-12:00'.
+
+    :param str | int text: time limit
+    :return int: seconds
+    :raise ValueError: if the time limit can't be read
+    """
+    match = _TIME_REGEX.match(str(text))
+    if not match:
+        raise ValueError("Not a time limit: '{}'".format(text))
+    days, first, second, third = match.groups()
+    if days is not None:
+        # D-H, D-H:M or D-H:M:S
+        fields = [int(days) * 24 + int(first), second or 0, third or 0]
+    elif third is not None:
+        fields = [first, second, third]
+    elif second is not None:
+        fields = [0, first, second]
+    else:
+        fields = [0, first, 0]
+    hours, minutes, seconds = (int(f) for f in fields)
+    return (hours * 60 + minutes) * 60 + seconds
+
+
+def format_mem(mb):
+    """
+    Write a memory amount the way schedulers read it.
+
+    :param int mb: megabytes
+    :return str: memory amount, e.g. '4096M'
+    """
+    return "{}M".format(mb)
+
+
+def format_time(seconds):
+    """
+    Write a time limit as hours, minutes and seconds.
+
+    :param int seconds: time limit
+    :return str: time limit, e.g. '26:30:00'
+    """
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+def pack_jobs(demands, limits):
+    """
+    Group jobs into allocations whose members run side by side.
+
+    The members of an allocation run at the same time, so it needs the sum
+    of their cores and memory, and as much time as the longest of them. Jobs
+    are packed first-fit, longest first, which keeps jobs of similar length
+    together, so that little of an allocation's time goes unused.
+
+    :param Sequence[Resources] demands: cores, memory and time of each job
+    :param Resources limits: most cores, memory and time of an allocation;
+        None for no limit
+    :return list[list[int]]: indices of the jobs in each allocation, in
+        order of the jobs
+    :raise ValueError: if a job needs more than an allocation can have
+    """
+    for i, demand in enumerate(demands):
+        for field, need, limit in zip(Resources._fields, demand, limits):
+            if limit is not None and need > limit:
+                raise ValueError(
+                    "Job {} needs {} {}, more than the packing limit of {}".format(
+                        i, need, field, limit
+                    )
+                )
+    order = sorted(
+        range(len(demands)),
+        key=lambda i: (demands[i].time, demands[i].cores, demands[i].mem),
+        reverse=True,
+    )
+    # An allocation that can't fit even the smallest job is closed, so that
+    # the search only ever goes through the few allocations that still have room
+    min_cores = min((d.cores for d in demands), default=0)
+    min_mem = min((d.mem for d in demands), default=0)
+    bins = []
+    open_bins = []
+    for i in order:
+        cores, mem, _ = demands[i]
+        for b in open_bins:
+            if _fits(b, cores, mem, limits):
+                break
+        else:
+            b = [[], 0, 0]
+            bins.append(b)
+            open_bins.append(b)
+        b[0].append(i)
+        b[1] += cores
+        b[2] += mem
+        if not _fits(b, min_cores, min_mem, limits):
+            open_bins.remove(b)
+    _LOGGER.debug("Packed {} jobs into {} allocations".format(len(demands), len(bins)))
+    return [sorted(b[0]) for b in bins]
+
+
+def _fits(b, cores, mem, limits):
+    return (limits.cores is None or b[1] + cores <= limits.cores) and (
+        limits.mem is None or b[2] + mem <= limits.mem
+    )
+
+
+def render_wrapper(template, values, members):
+    """
+    Render the script of an allocation that runs several jobs side by side.
+
+    The {CODE} slot, which must make up a whole line of the template, is
+    replaced by lines that start each member's command in the background and
+    then wait for all of them. The script's last command fails if any member
+    failed.
+
+    :param divvy.SubmissionTemplate template: compiled template
+    :param Mapping[str, str] values: text for each slot but CODE, e.g. the
+        allocation's resources
+    :param Sequence[(str, str)] members: command of each member, and a path
+        to send its output to, or None to leave it in the allocation's output
+    :return str: script content
+    :raise ValueError: if the template has no line with only {CODE} on it
+    """
+    lines = template.fill(dict(values, CODE=_MARKER)).split("\n")
+    index = next((i for i, l in enumerate(lines) if l.strip() == _MARKER), None)
+    if index is None:
+        raise ValueError(
+            "Packing jobs needs a template with {CODE} on a line of its own"
+        )
+    indent = lines[index][: len(lines[index]) - len(lines[index].lstrip())]
+    body = [
+        "# {} jobs packed into this allocation, run side by side".format(len(members)),
+        "divvy_pids=()",
+    ]
+    for command, output in members:
+        start = "( eval {} )".format(_ansi_quote(command))
+        if output:
+            start += " > {} 2>&1".format(_ansi_quote(output))
+        body.append(start + " &")
+        body.append("divvy_pids+=($!)")
+    body += [
+        "divvy_failed=0",
+        'for divvy_i in "${!divvy_pids[@]}"; do',
+        '  wait "${divvy_pids[$divvy_i]}" || {',
+        '    echo "Packed job $((divvy_i + 1)) failed" >&2',
+        "    divvy_failed=1",
+        "  }",
+        "done",
+        '[ "$divvy_failed" -eq 0 ]',
+    ]
+    lines[index : index + 1] = [indent + line for line in body]
+    return "\n".join(lines)
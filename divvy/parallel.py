@@ -0,0 +1,81 @@
+""" Worker pools for writing submission scripts concurrently """
+
+import logging
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .const import POOL_BACKENDS
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["imap_ordered"]
+
+# The function each process pool worker runs, set once per worker process
+_WORKER_FUNC = None
+
+
+def _init_worker(func):
+    global _WORKER_FUNC
+    _WORKER_FUNC = func
+
+
+def _call_worker(args):
+    return _WORKER_FUNC(*args)
+
+
+def imap_ordered(func, args_iter, workers, backend="thread", window=None):
+    """
+    Apply a function to argument tuples in a worker pool, in input order.
+
+    Results are yielded in the order of the arguments regardless of the
+    order in which they are completed, and at most `window` calls are pending
+    at once, so arguments are consumed lazily. For the process backend the
+    function is sent to each worker process once, rather than with every call
+    (from Python 3.7), so it must be picklable, as must the arguments and
+    results.
+
+    :param callable func: function to apply
+    :param Iterable[tuple] args_iter: positional arguments for each call
+    :param int workers: number of pool workers
+    :param str backend: kind of pool, 'thread' or 'process'
+    :param int window: maximum number of calls pending at once; by default
+        four per worker
+    :return Generator[(tuple, object, Exception)]: arguments, result and
+        exception for each call; exactly one of the latter two is None
+    """
+    if backend not in POOL_BACKENDS:
+        raise ValueError(
+            "Unknown pool backend '{}'; choose from: {}".format(
+                backend, ", ".join(POOL_BACKENDS)
+            )
+        )
+    window = window or 4 * workers
+    if backend == "process" and sys.version_info < (3, 7):
+        # No worker initializer before 3.7, so send the function every time
+        executor = ProcessPoolExecutor(workers)
+        submit = lambda args: executor.submit(func, *args)
+    elif backend == "process":
+        executor = ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(func,)
+        )
+        submit = lambda args: executor.submit(_call_worker, args)
+    else:
+        executor = ThreadPoolExecutor(workers)
+        submit = lambda args: executor.submit(func, *args)
+    _LOGGER.debug("Started {} pool with {} workers".format(backend, workers))
+    pending = deque()
+    with executor:
+        for args in args_iter:
+            pending.append((args, submit(args)))
+            if len(pending) >= window:
+                yield _settle(*pending.popleft())
+        while pending:
+            yield _settle(*pending.popleft())
+
+
+def _settle(args, future):
+    try:
+        return args, future.result(), None
+    except Exception as e:
+        return args, None, e
@@ -0,0 +1,241 @@
+""" Timings and counts of divvy operations, for finding where time goes """
+
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from .const import PROFILE_FILE_VARNAME, PROFILE_FORMATS, PROFILE_VARNAME
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["Profile", "count", "enable", "disable", "get_profile", "phase", "record"]
+
+
+class Profile(object):
+    """
+    Running totals of the time spent in each phase and of event counts.
+
+    Updates are thread-safe. Processes of a process pool keep their own
+    totals, which are not collected.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        """
+        Add a timing of one run of a phase.
+
+        :param str name: phase name
+        :param float seconds: time the run took
+        """
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                self.phases[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+    def count(self, name, n=1):
+        """
+        Add to an event counter.
+
+        :param str name: counter name
+        :param int n: amount to add
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        """
+        Summarize the profile.
+
+        :return dict: 'phases', with calls, total, mean and max seconds per
+            phase, and 'counters'
+        """
+        with self._lock:
+            return {
+                "phases": {
+                    name: {
+                        "calls": calls,
+                        "total": total,
+                        "mean": total / calls,
+                        "max": longest,
+                    }
+                    for name, (calls, total, longest) in sorted(self.phases.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def format(self, fmt="table"):
+        """
+        Render the profile as text.
+
+        :param str fmt: 'table' or 'json'
+        :return str: the profile report
+        """
+        data = self.to_dict()
+        if fmt == "json":
+            return json.dumps(data, indent=2)
+        width = max(
+            [len(n) for n in list(data["phases"]) + list(data["counters"])] + [5]
+        )
+        lines = [
+            "{:<{w}} {:>8} {:>11} {:>11} {:>11}".format(
+                "phase", "calls", "total (s)", "mean (ms)", "max (ms)", w=width
+            )
+        ]
+        for name, stats in data["phases"].items():
+            lines.append(
+                "{:<{w}} {:>8} {:>11.4f} {:>11.3f} {:>11.3f}".format(
+                    name,
+                    stats["calls"],
+                    stats["total"],
+                    stats["mean"] * 1000,
+                    stats["max"] * 1000,
+                    w=width,
+                )
+            )
+        if data["counters"]:
+            lines.append("")
+            lines.append("{:<{w}} {:>8}".format("counter", "value", w=width))
+            for name, value in data["counters"].items():
+                lines.append("{:<{w}} {:>8}".format(name, value, w=width))
+        return "\n".join(lines)
+
+
+class _Phase(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if _profile is not None:
+            _profile.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+# The profile being recorded, or None when profiling is off
+_profile = None
+
+
+def phase(name):
+    """
+    Time a block of code as a run of a phase, if profiling is on.
+
+    :param str name: phase name
+    :return contextmanager: context that records the time spent within it
+    """
+    if _profile is None:
+        return _NULL_PHASE
+    return _Phase(name)
+
+
+def record(name, seconds):
+    """
+    Add a timing of one run of a phase measured elsewhere, if profiling is on.
+
+    :param str name: phase name
+    :param float seconds: time the run took
+    """
+    if _profile is not None:
+        _profile.record(name, seconds)
+
+
+def count(name, n=1):
+    """
+    Add to an event counter, if profiling is on.
+
+    :param str name: counter name
+    :param int n: amount to add
+    """
+    if _profile is not None:
+        _profile.count(name, n)
+
+
+def get_profile():
+    """
+    Get the profile being recorded.
+
+    :return Profile | NoneType: the profile, or None if profiling is off
+    """
+    return _profile
+
+
+def enable(report=None, output=None):
+    """
+    Start recording a new profile.
+
+    :param str report: format of the report to write at exit, 'table' or
+        'json'; no report is written by default
+    :param str output: path to write the report to; standard error by default
+    :return Profile: the profile being recorded
+    """
+    global _profile
+    if report is not None and report not in PROFILE_FORMATS:
+        raise ValueError(
+            "Unknown profile format '{}'; choose from: {}".format(
+                report, ", ".join(PROFILE_FORMATS)
+            )
+        )
+    _profile = Profile()
+    if report:
+        atexit.register(_write_report, _profile, report, output)
+    return _profile
+
+
+def disable():
+    """Stop recording the profile."""
+    global _profile
+    _profile = None
+
+
+def _write_report(profile, fmt, output):
+    text = profile.format(fmt) + "\n"
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        sys.stderr.write(text)
+
+
+def _enable_from_env():
+    value = os.environ.get(PROFILE_VARNAME, "").lower()
+    if not value or value in ("0", "false", "no"):
+        return
+    if multiprocessing.current_process().name != "MainProcess":
+        # Pool workers inherit the environment, but report to no one
+        return
+    enable(
+        report=value if value in PROFILE_FORMATS else PROFILE_FORMATS[0],
+        output=os.environ.get(PROFILE_FILE_VARNAME),
+    )
+
+
+_enable_from_env()
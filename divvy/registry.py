@@ -0,0 +1,239 @@
+""" Registry of many loaded divvy configurations, for long-lived processes """
+
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from ubiquerg import expandpath
+
+from . import profiling
+from .config_cache import _signature
+from .const import DEFAULT_REGISTRY_TEMPLATE_CACHE_SIZE
+from .template import TemplateCache
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["ConfigRegistry", "RegistryInfo"]
+
+RegistryInfo = namedtuple(
+    "RegistryInfo",
+    ["hits", "misses", "evictions", "configs", "size", "max_configs", "max_size"],
+)
+
+
+class _Entry(object):
+    """A registered configuration, and the lock that guards its loading and
+    its active settings."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.config = None
+        self.size = 0
+
+
+class ConfigRegistry(object):
+    """
+    Loaded divvy configurations, for a process that serves many of them.
+
+    Configurations are loaded on first use, and loaded again when any of the
+    files they are made of changes, see `ComputingConfiguration.config_sources`.
+    They share a cache of compiled templates, so configurations that point to
+    the same template file only read and compile it once. Once there are more
+    than `max_configs` configurations, or they take more than `max_size`
+    bytes, the least recently used ones are dropped; a configuration that's
+    in use stays valid, and is loaded again on its next use.
+
+    The registry is thread-safe, and only one thread loads a configuration
+    at a time, while others can get configurations that are already loaded.
+    Threads can render with a shared configuration at once through
+    `ComputingConfiguration.render`, which leaves the active settings alone;
+    threads that activate packages should hold a configuration's lock, see
+    `checkout`.
+
+    :param int max_configs: most configurations to keep; no limit by default
+    :param int max_size: most memory, in bytes, that the configurations'
+        settings may take, as estimated when they are loaded; the compiled
+        templates are bounded by the template cache's own size
+    :param divvy.TemplateCache template_cache: cache of compiled templates to
+        share between the configurations
+    :param bool use_cache: whether to load configurations through the
+        persistent cache of validated configurations; see
+        `ComputingConfiguration`
+    """
+
+    def __init__(
+        self, max_configs=None, max_size=None, template_cache=None, use_cache=None
+    ):
+        if max_configs is not None and max_configs < 1:
+            raise ValueError(
+                "Registry must be able to keep a configuration: {}".format(max_configs)
+            )
+        self.max_configs = max_configs
+        self.max_size = max_size
+        if template_cache is None:
+            template_cache = TemplateCache(DEFAULT_REGISTRY_TEMPLATE_CACHE_SIZE)
+        self.template_cache = template_cache
+        self.use_cache = use_cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{}(configs={}, max_configs={}, max_size={})".format(
+            self.__class__.__name__, len(self), self.max_configs, self.max_size
+        )
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for e in self._entries.values() if e.config is not None)
+
+    def __contains__(self, filepath):
+        entry = self._entries.get(_key(filepath))
+        return entry is not None and entry.config is not None
+
+    def get(self, filepath):
+        """
+        Get a configuration, loading it if it's not loaded or it changed.
+
+        :param str filepath: path to the configuration file
+        :return divvy.ComputingConfiguration: the configuration
+        """
+        return self._load(filepath).config
+
+    @contextmanager
+    def checkout(self, filepath):
+        """
+        Use a configuration, holding its lock, e.g. to activate a package and
+        capture the settings to render with.
+
+        :param str filepath: path to the configuration file
+        :return Generator[divvy.ComputingConfiguration]: the configuration
+        """
+        entry = self._load(filepath)
+        with entry.lock:
+            yield entry.config
+
+    def discard(self, filepath):
+        """
+        Drop a configuration, if it's loaded.
+
+        :param str filepath: path to the configuration file
+        """
+        with self._lock:
+            entry = self._entries.pop(_key(filepath), None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def clear(self):
+        """Drop all the configurations and compiled templates."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        self.template_cache.clear()
+
+    def info(self):
+        """
+        Report registry statistics.
+
+        :return RegistryInfo: hit, miss and eviction counts, number of
+            configurations, their estimated size in bytes, and the limits
+        """
+        with self._lock:
+            return RegistryInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                sum(1 for e in self._entries.values() if e.config is not None),
+                self._size,
+                self.max_configs,
+                self.max_size,
+            )
+
+    def _load(self, filepath):
+        path = _key(filepath)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                entry = self._entries[path] = _Entry(path)
+            self._entries.move_to_end(path)
+        with entry.lock:
+            config = entry.config
+            if config is not None and _unchanged(config):
+                with self._lock:
+                    self.hits += 1
+                profiling.count("registry.hits")
+                return entry
+            from .compute import ComputingConfiguration
+
+            _LOGGER.info(
+                "{} divvy config: {}".format(
+                    "Loading" if config is None else "Reloading", path
+                )
+            )
+            config = ComputingConfiguration(
+                filepath=path,
+                use_cache=self.use_cache,
+                template_cache=self.template_cache,
+            )
+            size = _footprint(config)
+            with self._lock:
+                self.misses += 1
+                if self._entries.get(path) is not entry:
+                    # Dropped while it was loaded; use it this time anyway
+                    self._entries[path] = entry
+                    entry.size = 0
+                self._size += size - entry.size
+                entry.config, entry.size = config, size
+                self._evict(keep=path)
+            profiling.count("registry.misses")
+            return entry
+
+    def _evict(self, keep):
+        """Drop least recently used configurations while over a limit."""
+        while (
+            self.max_configs is not None and len(self._entries) > self.max_configs
+        ) or (self.max_size is not None and self._size > self.max_size):
+            path = next((p for p in self._entries if p != keep), None)
+            if path is None:
+                _LOGGER.warning(
+                    "Divvy config takes about {} bytes, more than the registry's "
+                    "limit of {}: {}".format(self._size, self.max_size, keep)
+                )
+                break
+            entry = self._entries.pop(path)
+            self._size -= entry.size
+            self.evictions += 1
+            profiling.count("registry.evictions")
+            _LOGGER.debug("Dropped divvy config: {}".format(path))
+
+
+def _key(filepath):
+    return os.path.abspath(expandpath(filepath))
+
+
+def _unchanged(config):
+    return all(_signature(p) == sig for p, sig in config.config_sources())
+
+
+def _footprint(value):
+    """
+    Estimate the memory a configuration's settings take.
+
+    :param object value: configuration, or a value in it
+    :return int: bytes taken by the mappings, lists and strings in the
+        value, but not by the objects they share
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, Mapping):
+        size += sum(_footprint(k) + _footprint(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_footprint(v) for v in value)
+    return size
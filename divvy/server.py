@@ -0,0 +1,287 @@
+""" Long-lived render server on a Unix domain socket, and its client """
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from .const import DEFAULT_COMPUTE_RESOURCES_NAME, SOCKET_VARNAME
+from .exceptions import ServerError
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["DivvyServer", "default_socket_path", "request"]
+
+# Requests and responses are single lines of JSON
+_ENCODING = "utf-8"
+
+# Seconds between saves of a folder's render manifest by the server
+_MANIFEST_SAVE_INTERVAL = 1.0
+
+
+def default_socket_path():
+    """
+    Path of the server socket, when not given explicitly.
+
+    :return str: the path named by the socket environment variable, or
+        'divvy.sock' in the user's runtime folder, or in the temporary folder
+    """
+    if os.environ.get(SOCKET_VARNAME):
+        return os.path.expanduser(os.environ[SOCKET_VARNAME])
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "divvy.sock")
+    return os.path.join(tempfile.gettempdir(), "divvy-{}.sock".format(os.getuid()))
+
+
+def request(socket_path, message, timeout=None):
+    """
+    Send one request to a divvy server and wait for its response.
+
+    :param str socket_path: path to the server socket
+    :param Mapping message: the request; see `DivvyServer` for the fields
+    :param float timeout: seconds to wait for the response; no limit by default
+    :return dict: the response
+    :raise divvy.ServerError: if the server can't be reached, or it reports
+        that the request failed
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(message).encode(_ENCODING) + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError as e:
+        raise ServerError("Can't reach divvy server at {}: {}".format(socket_path, e))
+    if not line:
+        raise ServerError("No response from divvy server at {}".format(socket_path))
+    response = json.loads(line.decode(_ENCODING))
+    if not response.get("ok"):
+        raise ServerError(response.get("error", "Request failed"))
+    return response
+
+
+class DivvyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve script rendering and submission requests on a Unix domain socket.
+
+    Configurations are loaded on first use and kept in memory, along with
+    their compiled templates, and reloaded when their files change; see
+    `divvy.ConfigRegistry`. Each connection carries one request, a line of
+    JSON with these fields:
+
+    - `command`: 'write', 'submit' or 'ping'
+    - `config`: absolute path to the divvy configuration file; by default
+      the first one the server was started with
+    - `package`: compute package to use; 'default' by default, or if the
+      package doesn't exist
+    - `variables`: list of groups of extra variables for the template
+    - `output`: absolute path to write the script to; for 'write', the
+      rendered script is returned instead if it's not given
+    - `incremental`: for 'write', whether to leave the script untouched if
+      its inputs didn't change; `skipped` in the response tells if it was.
+      The server keeps the render manifest of each output folder in memory,
+      and saves it at most every second, and when it's closed
+
+    The response is a line of JSON with `ok`, and `error` if the request
+    failed, or the `script` path (or `content`) and, for 'submit', the
+    `returncode`, `stdout`, `stderr` and `job_id` of the submission command.
+    Submissions are recorded in the job ledger if the server's environment
+    switches it on.
+
+    :param str socket_path: path to create the socket at
+    :param Iterable[str] config_files: configuration files to load up front
+    :param divvy.ConfigRegistry registry: registry to keep the configurations
+        in, e.g. with limits on how many are kept
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config_files=None, registry=None):
+        from .registry import ConfigRegistry
+
+        self.socket_path = socket_path
+        self.registry = registry or ConfigRegistry()
+        self._default_config = None
+        self._manifests = {}
+        self._manifests_lock = threading.Lock()
+        for filepath in config_files or []:
+            self.registry.get(filepath)
+            self._default_config = self._default_config or os.path.abspath(filepath)
+        if os.path.exists(socket_path):
+            # A socket left by a server that didn't shut down cleanly
+            try:
+                request(socket_path, {"command": "ping"}, timeout=1)
+            except ServerError:
+                os.remove(socket_path)
+            else:
+                raise ServerError("A divvy server is running at " + socket_path)
+        # Only the user may connect; the umask makes the socket so from the
+        # start, where changing its mode after binding would leave a gap.
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        with self._manifests_lock:
+            folders = list(self._manifests.values())
+        for folder in folders:
+            folder.save()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+    def handle_message(self, message):
+        """
+        Carry out one request.
+
+        :param Mapping message: the request
+        :return dict: the response
+        """
+        command = message.get("command")
+        if command == "ping":
+            return {"ok": True}
+        if command not in ("write", "submit"):
+            raise ValueError("Unknown command: '{}'".format(command))
+        filepath = message.get("config") or self._default_config
+        if not filepath:
+            from .compute import select_divvy_config
+
+            filepath = select_divvy_config(None)
+        package = message.get("package") or DEFAULT_COMPUTE_RESOURCES_NAME
+        config = self.registry.get(filepath)
+        if package not in (config.compute_packages or {}):
+            # Fall back to the default package, as the command line does
+            package = DEFAULT_COMPUTE_RESOURCES_NAME
+        # The renderer reads the package without activating it, so requests
+        # for the same configuration don't wait for each other
+        render = config._package_renderer(package)
+        submission_command = render.compute.get("submission_command")
+        config_file = config.config_file
+        extra_vars = message.get("variables")
+        output_path = message.get("output")
+        if command == "write":
+            if not output_path:
+                variables = render.variables(extra_vars)
+                return {"ok": True, "content": render.template.render(variables)}
+            if not message.get("incremental"):
+                return {"ok": True, "script": render(output_path, extra_vars)}
+            folder = self._folder_manifest(output_path)
+            with folder.lock:
+                skipped = folder.manifest.skipped
+                render.manifest = folder.manifest
+                script = render(output_path, extra_vars)
+                skipped = folder.manifest.skipped - skipped
+            folder.changed()
+            return {"ok": True, "script": script, "skipped": skipped}
+        from .submission import submit_scripts
+
+        variables = render.variables(extra_vars)
+        values = render.template.values(variables)
+        if output_path:
+            script = render.write(output_path, variables)
+            result = submit_scripts(submission_command, [script], capture=True)[0]
+        else:
+            with tempfile.NamedTemporaryFile() as temp:
+                script = render.write(temp.name, variables)
+                result = submit_scripts(submission_command, [script], capture=True)[0]
+        self._record_submission(
+            result, config_file, package, submission_command, values
+        )
+        return {
+            "ok": True,
+            "script": result.script,
+            "returncode": result.returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "job_id": result.job_id,
+        }
+
+    def _folder_manifest(self, output_path):
+        """Get the render manifest of a script's folder, loaded once."""
+        folder = os.path.dirname(os.path.abspath(output_path))
+        with self._manifests_lock:
+            manifest = self._manifests.get(folder)
+            if manifest is None:
+                manifest = self._manifests[folder] = _FolderManifest()
+            return manifest
+
+    @staticmethod
+    def _record_submission(result, config_file, package, submission_command, values):
+        """Record a submission in the job ledger, if it's switched on."""
+        from .ledger import JobLedger, ledger_enabled
+        from .submission import scheduler_name
+
+        if not ledger_enabled():
+            return
+        with JobLedger() as ledger:
+            ledger.record(
+                [result],
+                config=config_file,
+                package=package,
+                scheduler=scheduler_name(submission_command),
+                variables={result.script: [values]},
+            )
+
+
+class _FolderManifest(object):
+    """
+    A server's render manifest of one output folder.
+
+    Requests for scripts in the folder hold its lock while they check and
+    write them, so each one knows whether its script was skipped. Saving
+    is put off for up to `_MANIFEST_SAVE_INTERVAL` seconds, so that a burst
+    of requests doesn't rewrite the manifest file for every script.
+    """
+
+    def __init__(self):
+        from .manifest import RenderManifest
+
+        self.manifest = RenderManifest()
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved_at = 0.0
+        self._timer = None
+
+    def changed(self):
+        """Save the manifest now, or soon if it was saved just now."""
+        with self._save_lock:
+            wait = self._saved_at + _MANIFEST_SAVE_INTERVAL - time.monotonic()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self.save)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.save()
+
+    def save(self):
+        """Save the manifest, if scripts were written since the last save."""
+        with self._save_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._saved_at = time.monotonic()
+            self.manifest.save()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.handle_message(json.loads(line.decode(_ENCODING)))
+        except Exception as e:
+            _LOGGER.warning("Request failed: {}".format(e))
+            response = {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+        self.wfile.write(json.dumps(response).encode(_ENCODING) + b"\n")
@@ -0,0 +1,314 @@
+""" Concurrent submission of job scripts to computing resources """
+
+import asyncio
+import logging
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from subprocess import PIPE
+
+from . import profiling
+from .const import DEFAULT_MAX_IN_FLIGHT
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = [
+    "SubmissionResult",
+    "parse_job_id",
+    "run_in_new_loop",
+    "run_submission",
+    "scheduler_name",
+    "submission_argv",
+    "submit_scripts",
+]
+
+
+class SubmissionResult(
+    namedtuple(
+        "SubmissionResult",
+        [
+            "script",
+            "command",
+            "returncode",
+            "stdout",
+            "stderr",
+            "job_id",
+            "duration",
+            "started",
+        ],
+    )
+):
+    """
+    Outcome of a single script submission.
+
+    :param str script: path to the submitted script
+    :param list[str] command: the submission command that was run
+    :param int returncode: exit status of the submission command
+    :param str stdout: output of the submission command
+    :param str stderr: error output of the submission command
+    :param str job_id: job ID assigned by the scheduler, if reported
+    :param float duration: seconds the submission command took
+    :param float started: time the submission command was started, in
+        seconds since the epoch, if known
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """
+        Whether the submission command succeeded.
+
+        :return bool: whether the exit status was zero
+        """
+        return self.returncode == 0
+
+
+SubmissionResult.__new__.__defaults__ = (None,)
+
+# Scheduler submission output, by scheduler; the last pattern of each is for
+# the terse output of `sbatch --parsable` and `qsub -terse`
+SCHEDULER_JOB_ID_PATTERNS = {
+    "slurm": [
+        re.compile(r"Submitted batch job (\d+)"),
+        re.compile(r"^(\d+)(?:;\S+)?\s*$", re.MULTILINE),
+    ],
+    "sge": [
+        re.compile(r"Your job(?:-array)? (\d+)"),
+        re.compile(r"^(\d+)(?:\.\S+)?\s*$", re.MULTILINE),
+    ],
+    "lsf": [re.compile(r"Job <(\d+)> is submitted")],
+}
+
+# Verbose submission output of any scheduler
+JOB_ID_PATTERNS = [patterns[0] for patterns in SCHEDULER_JOB_ID_PATTERNS.values()]
+
+# Name of the scheduler of submission commands that run the script right away
+LOCAL_SCHEDULER = "local"
+
+# Submission commands that only exist as shell builtins, and the program
+# to run a script with instead
+_SHELL_BUILTINS = {".": "sh", "source": "sh"}
+
+
+def scheduler_name(submission_command):
+    """
+    Name the scheduler that a submission command submits to.
+
+    :param str submission_command: command, possibly with options
+    :return str: 'slurm', 'sge' or 'lsf', or 'local' for any other command,
+        which is taken to run the script itself
+    """
+    argv = shlex.split(submission_command)
+    return _program_scheduler(argv[0] if argv else "")
+
+
+def _program_scheduler(program):
+    from .arrays import ARRAY_SCHEDULERS
+
+    scheduler = ARRAY_SCHEDULERS.get(os.path.basename(program))
+    return scheduler.name if scheduler else LOCAL_SCHEDULER
+
+
+def parse_job_id(output, scheduler=None):
+    """
+    Find the job ID in the output of a scheduler submission command.
+
+    :param str output: submission command output
+    :param str scheduler: name of the scheduler, as given by
+        `scheduler_name`, to only look for its output formats, including the
+        terse ones; the verbose formats of all schedulers by default
+    :return str | NoneType: job ID, or None if no known format matches, or
+        the scheduler is local
+    """
+    if scheduler == LOCAL_SCHEDULER:
+        return None
+    for pattern in SCHEDULER_JOB_ID_PATTERNS.get(scheduler, JOB_ID_PATTERNS):
+        match = pattern.search(output)
+        if match:
+            return match.group(1)
+    return None
+
+
+def submission_argv(submission_command, script):
+    """
+    Build the arguments to run a submission command on a script, no shell.
+
+    A shell builtin command, like the `.` used by local compute packages,
+    is replaced by a program that runs the script in a new shell, which is
+    what the builtin amounted to when the command was run through a shell.
+
+    :param str submission_command: command, possibly with options
+    :param str script: path to the script to submit
+    :return list[str]: program and arguments
+    """
+    argv = shlex.split(submission_command)
+    if argv and argv[0] in _SHELL_BUILTINS:
+        argv[0] = _SHELL_BUILTINS[argv[0]]
+    return argv + [script]
+
+
+def submit_scripts(submission_command, scripts, max_in_flight=None, capture=False):
+    """
+    Submit job scripts concurrently.
+
+    Each script is submitted with its own run of the submission command,
+    without a shell, with at most `max_in_flight` of them running at once.
+    A local command, which runs the script itself, runs one script at a
+    time, with its output going straight to this process's output.
+
+    :param str submission_command: command to submit each script with
+    :param Iterable[str] scripts: paths to the scripts to submit
+    :param int max_in_flight: maximum number of submission commands to run
+        at once
+    :param bool capture: whether to capture a local command's output too,
+        e.g. to pass it on to another process
+    :return list[SubmissionResult]: outcome for each script, in order
+    """
+    if scheduler_name(submission_command) == LOCAL_SCHEDULER:
+        max_in_flight = 1
+    return run_in_new_loop(
+        _submit_all,
+        submission_command,
+        list(scripts),
+        max_in_flight or DEFAULT_MAX_IN_FLIGHT,
+        capture,
+    )
+
+
+def run_in_new_loop(main, *args):
+    """
+    Run a coroutine function to completion in a new event loop.
+
+    Like `asyncio.run`, the loop is made the current event loop while it
+    runs, and unset afterwards; before Python 3.8, the child watcher is
+    attached to it, so that subprocesses can be started from it. The
+    coroutine is only created once the loop is current, so any asyncio
+    primitives made by it belong to the new loop. If an event loop is
+    already running in this thread, the new one runs in a thread of its
+    own instead.
+
+    :param callable main: coroutine function to run
+    :param args: positional arguments to call it with
+    :return object: what the coroutine returns
+    """
+    if _loop_running():
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(1) as pool:
+            return pool.submit(run_in_new_loop, main, *args).result()
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        if _needs_child_watcher() and _in_main_thread():
+            # Setting the loop attaches the watcher to it, if it exists
+            # already; otherwise it's made attached to the current loop.
+            asyncio.get_child_watcher()
+        return loop.run_until_complete(main(*args))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def _loop_running():
+    try:
+        if sys.version_info < (3, 7):
+            return asyncio.get_event_loop().is_running()
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _needs_child_watcher():
+    # Before 3.8 the default child watcher needs the loop that starts the
+    # subprocesses attached to it.
+    return sys.version_info < (3, 8) and os.name == "posix"
+
+
+def _in_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+async def _submit_all(submission_command, scripts, max_in_flight, capture):
+    semaphore = asyncio.Semaphore(max_in_flight)
+    if max_in_flight == 1:
+        # in order; gather may start its tasks in any order before 3.7
+        return [
+            await _submit_one(submission_command, s, semaphore, capture)
+            for s in scripts
+        ]
+    return await asyncio.gather(
+        *[_submit_one(submission_command, s, semaphore, capture) for s in scripts]
+    )
+
+
+async def _submit_one(submission_command, script, semaphore, capture):
+    argv = submission_argv(submission_command, script)
+    async with semaphore:
+        return await run_submission(argv, script, capture)
+
+
+async def run_submission(argv, script, capture=False):
+    """
+    Run a submission command once, without a shell.
+
+    The output of a scheduler's submission command is captured, to find the
+    job ID in; a local command's output goes to this process's output,
+    unless `capture` is set.
+
+    :param list[str] argv: submission command and its arguments, as given by
+        `submission_argv`
+    :param str script: path to the script being submitted
+    :param bool capture: whether to capture a local command's output too
+    :return SubmissionResult: outcome of the submission
+    """
+    _LOGGER.info(" ".join(argv))
+    scheduler = _program_scheduler(argv[0])
+    capture = capture or scheduler != LOCAL_SCHEDULER
+    start = time.time()
+    try:
+        returncode, out, err = await _run_process(argv, capture)
+    except OSError as e:
+        out, err, returncode = b"", str(e).encode(), 127
+    duration = time.time() - start
+    profiling.record("submit", duration)
+    profiling.count("submissions")
+    stdout = (out or b"").decode(errors="replace")
+    stderr = (err or b"").decode(errors="replace")
+    if returncode != 0:
+        profiling.count("submissions.failed")
+        _LOGGER.warning(
+            "Submission of {} failed ({}){}".format(
+                script, returncode, ": " + stderr.strip() if stderr else ""
+            )
+        )
+    return SubmissionResult(
+        script,
+        argv,
+        returncode,
+        stdout,
+        stderr,
+        parse_job_id(stdout, scheduler),
+        duration,
+        start,
+    )
+
+
+async def _run_process(argv, capture=True):
+    stream = PIPE if capture else None
+    if _needs_child_watcher() and not _in_main_thread():
+        # No child watcher to start asyncio subprocesses with, so wait for the
+        # process in a worker thread instead.
+        run = partial(subprocess.run, argv, stdout=stream, stderr=stream)
+        done = await asyncio.get_event_loop().run_in_executor(None, run)
+        return done.returncode, done.stdout, done.stderr
+    proc = await asyncio.create_subprocess_exec(*argv, stdout=stream, stderr=stream)
+    out, err = await proc.communicate()
+    return proc.returncode, out, err
@@ -0,0 +1,363 @@
+""" Submission template compilation and rendering """
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import ChainMap, OrderedDict, namedtuple
+from collections.abc import Mapping
+
+from . import profiling
+from .const import DEFAULT_TEMPLATE_CACHE_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = [
+    "SubmissionTemplate",
+    "TemplateCache",
+    "CacheInfo",
+    "VariableScope",
+    "slot_text",
+]
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+# Anything in curly braces that does not itself contain a curly brace is a
+# candidate slot, which is exactly what "{" + KEY + "}" replacement can hit.
+_SLOT_REGEX = re.compile(r"\{([^{}]*)\}")
+
+# Slots that template variables are meant to fill, as opposed to e.g. the
+# braces of a shell or awk block
+_PLACEHOLDER_REGEX = re.compile(r"^[A-Z_][A-Z0-9_]*$")
+
+
+def slot_text(value):
+    """
+    Get the text that a variable's value fills a slot with.
+
+    Mappings are written as the YAML-like text of a YacAttMap, as they were
+    when the variables pool was one.
+
+    :param object value: variable value
+    :return str: text for the value
+    """
+    if isinstance(value, Mapping):
+        from yacman import YacAttMap
+
+        return str(YacAttMap(value))
+    return str(value)
+
+
+class SubmissionTemplate(object):
+    """
+    Submission script template compiled for repeated rendering.
+
+    The template text is tokenized once into literal segments and
+    `{PLACEHOLDER}` slots, so that rendering is a single pass over the slots
+    and a single join, regardless of how many variables are in the pool.
+
+    Rendering is equivalent to calling `content.replace("{" + KEY + "}", v)`
+    for each key in the variable pool (keys are uppercased, and the first of
+    several keys that uppercase to the same placeholder wins), with unknown
+    placeholders left in place. That replacement scans the text it inserts
+    again for the placeholders of the keys after theirs, so where a value
+    completes a placeholder (e.g. it contains a curly brace) the template is
+    rendered by replacing each key in turn, exactly like that. The one
+    difference is that a key which itself contains a curly brace can't name
+    a slot, so it fills nothing.
+
+    :param str content: submission script template text
+    """
+
+    def __init__(self, content):
+        self._content = content
+        self._digest = None
+        self._placeholders = None
+        tokens = _SLOT_REGEX.split(content)
+        # split with one capturing group alternates literal, name, literal...
+        self._parts = [
+            tok if i % 2 == 0 else "{" + tok + "}" for i, tok in enumerate(tokens)
+        ]
+        self._slots = [(i, tokens[i]) for i in range(1, len(tokens), 2)]
+        # Whether a slot follows an unclosed brace, e.g. {{JOBNAME}} or a
+        # shell { ... } block, so that the text put in it may complete a
+        # placeholder
+        self._nested = False
+        opened = False
+        for i, part in enumerate(self._parts):
+            if i % 2 == 1:
+                self._nested = self._nested or opened
+                continue
+            last = max(part.rfind("{"), part.rfind("}"))
+            if last >= 0:
+                opened = part[last] == "{"
+        seen = set()
+        self._slot_names = tuple(
+            n for _, n in self._slots if not (n in seen or seen.add(n))
+        )
+
+    def __repr__(self):
+        return "{}({} slots, {} chars)".format(
+            self.__class__.__name__, len(self._slots), len(self._content)
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, SubmissionTemplate) and self.content == other.content
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._content)
+
+    @classmethod
+    def from_file(cls, filepath):
+        """
+        Read and compile a submission template file.
+
+        :param str filepath: path to the template file
+        :return SubmissionTemplate: compiled template
+        """
+        with open(filepath, "r") as f:
+            return cls(f.read())
+
+    @property
+    def content(self):
+        """
+        Original template text.
+
+        :return str: template text, as compiled
+        """
+        return self._content
+
+    @property
+    def digest(self):
+        """
+        Digest of the template text.
+
+        :return str: SHA-256 hex digest of the template text
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._content.encode()).hexdigest()
+        return self._digest
+
+    @property
+    def slot_names(self):
+        """
+        Names of all the slots in the template, in order of first appearance.
+
+        :return list[str]: slot names
+        """
+        return list(self._slot_names)
+
+    def iter_parts(self):
+        """
+        Go through the template's literal segments and slots, in order.
+
+        :return Iterator[(str, str | NoneType)]: text of each part, which for
+            a slot is its name in curly braces, and the slot's name, or None
+            for a literal segment
+        """
+        for i, part in enumerate(self._parts):
+            yield part, part[1:-1] if i % 2 else None
+
+    @property
+    def placeholders(self):
+        """
+        Names of the slots that template variables are meant to fill.
+
+        These are the slots named with an uppercase identifier, like {MEM},
+        and not preceded by a dollar sign, as in the shell's ${HOME}. They
+        are found once per template.
+
+        :return tuple[str]: placeholder names, in order of first appearance
+        """
+        if self._placeholders is None:
+            found = OrderedDict()
+            for i, name in self._slots:
+                if _PLACEHOLDER_REGEX.match(name) and not self._parts[i - 1].endswith(
+                    "$"
+                ):
+                    found[name] = None
+            self._placeholders = tuple(found)
+        return self._placeholders
+
+    def missing(self, data):
+        """
+        Find the placeholders that a variables pool leaves unfilled.
+
+        This takes one pass over the pool's keys, and one lookup for each of
+        the template's placeholders.
+
+        :param Mapping data: a "pool" from which values are available to
+            replace keys in the template
+        :return list[str]: names of the unfilled placeholders
+        """
+        placeholders = self.placeholders
+        if not placeholders:
+            return []
+        names = {str(k).upper() for k in data}
+        return [n for n in placeholders if n not in names]
+
+    def values(self, data):
+        """
+        Select the values from a variables pool that fill the template slots.
+
+        :param Mapping data: a "pool" from which values are available to
+            replace keys in the template
+        :return dict[str, str]: text for each slot that the pool fills
+        """
+        pool = {}
+        for k, v in data.items():
+            pool.setdefault(str(k).upper(), v)
+        return {n: slot_text(pool[n]) for n in self._slot_names if n in pool}
+
+    def render(self, data, values=None):
+        """
+        Populate the template with data.
+
+        :param Mapping data: a "pool" from which values are available to
+            replace keys in the template
+        :param Mapping[str, str] values: the pool's text for each slot, if
+            already selected with `values`
+        :return str: rendered content
+        """
+        if values is None:
+            values = self.values(data)
+        if any("{" in v or "}" in v for v in values.values()):
+            return self._replace_each(data)
+        content = self.fill(values)
+        if self._nested:
+            # Text put within braces may complete the placeholder of a key
+            names = set(_SLOT_REGEX.findall(content))
+            if names:
+                keys = {str(k).upper() for k in data}
+                if names & keys or any("{" in k or "}" in k for k in keys):
+                    return self._replace_each(data)
+        return content
+
+    def _replace_each(self, data):
+        # The original rendering, for values that complete placeholders
+        content = self._content
+        for k, v in data.items():
+            content = content.replace("{" + str(k).upper() + "}", slot_text(v))
+        return content
+
+    def fill(self, values):
+        """
+        Populate the template with the text for each slot.
+
+        :param Mapping[str, str] values: text to fill each slot with, by slot
+            name; slots not in the mapping are left in place
+        :return str: rendered content
+        """
+        parts = list(self._parts)
+        for i, name in self._slots:
+            if name in values:
+                parts[i] = values[name]
+        return "".join(parts)
+
+
+class VariableScope(ChainMap):
+    """
+    Read-only, layered pool of template variables.
+
+    Keys are looked up in each layer in turn, so earlier layers take
+    precedence, and iteration yields keys in the order in which successive
+    `dict.update` calls, last layer first, would have inserted them. The
+    layers themselves are never copied or modified.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+    __setitem__ = __delitem__ = _read_only
+    pop = popitem = clear = update = setdefault = _read_only
+
+    def __iter__(self):
+        # ChainMap only iterates in this order from Python 3.7; walk the
+        # layers explicitly, so that the first of several keys that uppercase
+        # to the same slot name is the same on every version.
+        keys = OrderedDict()
+        for mapping in reversed(self.maps):
+            keys.update(OrderedDict.fromkeys(mapping))
+        return iter(keys)
+
+
+class TemplateCache(object):
+    """
+    Bounded cache of compiled submission templates, keyed by absolute path.
+
+    Each lookup stats the file, and a template whose modification time or
+    size has changed since it was cached is read and compiled again, so that
+    edits to template files are still picked up. Once more than `maxsize`
+    templates are cached, the least recently used one is dropped. Lookups are
+    thread-safe, so a cache may be shared by configurations used from
+    several threads.
+
+    :param int maxsize: maximum number of templates to keep
+    """
+
+    def __init__(self, maxsize=DEFAULT_TEMPLATE_CACHE_SIZE):
+        if maxsize < 1:
+            raise ValueError("Template cache size must be positive: {}".format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filepath):
+        return os.path.abspath(filepath) in self._entries
+
+    def get(self, filepath):
+        """
+        Get the compiled template for a file, reading it only if needed.
+
+        :param str filepath: path to the template file
+        :return SubmissionTemplate: compiled template for the current file
+        """
+        path = os.path.abspath(filepath)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                self._entries.move_to_end(path)
+            else:
+                self.misses += 1
+        if entry is not None and entry[0] == stamp:
+            profiling.count("template_cache.hits")
+            return entry[1]
+        profiling.count("template_cache.misses")
+        _LOGGER.debug("Reading submission template: {}".format(path))
+        # Read outside the lock, so other templates can be looked up meanwhile
+        with profiling.phase("template.read"):
+            template = SubmissionTemplate.from_file(path)
+        with self._lock:
+            self._entries[path] = (stamp, template)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return template
+
+    def info(self):
+        """
+        Report cache statistics.
+
+        :return CacheInfo: hit and miss counts, size limit and current size
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        """Drop all cached templates and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
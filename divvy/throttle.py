@@ -0,0 +1,461 @@
+""" Throttled, resumable submission of many job scripts """
+
+import asyncio
+import getpass
+import json
+import logging
+import os
+import random
+import re
+import shlex
+import subprocess
+import threading
+import time
+
+from .const import DEFAULT_MAX_IN_FLIGHT
+from .submission import (
+    LOCAL_SCHEDULER,
+    SubmissionResult,
+    run_in_new_loop,
+    run_submission,
+    scheduler_name,
+    submission_argv,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = [
+    "CommandProbe",
+    "SubmissionJournal",
+    "SubmissionThrottle",
+    "TokenBucket",
+    "default_probe",
+]
+
+# Scheduler complaints that mean "not now" rather than "never"
+TRANSIENT_ERRORS = re.compile(
+    r"timed out|temporarily|try again|unable to contact|connection refused|"
+    r"busy|slurm_load|AssocMaxSubmitJobLimit|QOSMaxSubmitJob|"
+    r"job submit limit|too many",
+    re.IGNORECASE,
+)
+
+# Queue listing commands that print one job per line, by submission command
+_QUEUE_COMMANDS = {"sbatch": "squeue --noheader --user {user} --format %i"}
+
+
+class TokenBucket(object):
+    """
+    Rate limiter that lets through `rate` events per second on average, and
+    bursts of up to `burst` events at once.
+
+    :param float rate: events per second
+    :param int burst: most events let through at once; by default one
+    :param callable clock: source of the current time, in seconds
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("Rate must be positive: {}".format(rate))
+        self.rate = float(rate)
+        self.burst = burst or 1
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Take a token if one is available.
+
+        :return float: 0 if a token was taken, else the seconds to wait until
+            one will be
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        """Wait for a token, and take it."""
+        wait = self.take()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.take()
+
+
+class CommandProbe(object):
+    """
+    Queue depth probe that counts the lines a command prints, e.g. the jobs
+    listed by `squeue --noheader`.
+
+    :param str command: command to run, without a shell
+    :param float timeout: seconds to let the command run
+    """
+
+    def __init__(self, command, timeout=30):
+        self.command = command
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.command)
+
+    def __call__(self):
+        """
+        Count the jobs in the queue.
+
+        :return int | NoneType: number of jobs, or None if the command failed
+        """
+        try:
+            out = subprocess.run(
+                shlex.split(self.command),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=self.timeout,
+                check=True,
+                universal_newlines=True,
+            ).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            _LOGGER.warning("Queue probe failed ({}): {}".format(self.command, e))
+            return None
+        return sum(1 for line in out.splitlines() if line.strip())
+
+
+def default_probe(submission_command):
+    """
+    Queue depth probe for the scheduler that a submission command targets.
+
+    :param str submission_command: command that submits job scripts
+    :return CommandProbe | NoneType: probe that counts the user's jobs, or
+        None if the scheduler has no known queue listing
+    """
+    program = os.path.basename(shlex.split(submission_command)[0])
+    command = _QUEUE_COMMANDS.get(program)
+    if command is None:
+        return None
+    return CommandProbe(command.format(user=shlex.quote(getpass.getuser())))
+
+
+class SubmissionJournal(object):
+    """
+    Persistent record of the scripts queued for submission and of their
+    outcome, so that an interrupted run can be resumed.
+
+    The journal is a JSON Lines file that is only ever appended to, and
+    flushed to disk with each record; the last record of a script is its
+    state. A script submitted just before an interruption, but not yet
+    recorded, is submitted again on resumption.
+
+    :param str path: path to the journal file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._torn = False
+        self._states = self._load()
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.path)
+
+    def _load(self):
+        states = {}
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a record cut short by an interruption
+                        self._torn = not line.endswith("\n")
+                        continue
+                    states[record["script"]] = record
+        except OSError:
+            pass
+        return states
+
+    def _append(self, records):
+        if not records:
+            return
+        with open(self.path, "a") as f:
+            if self._torn:
+                # end the cut short record's line, so it stays on its own
+                f.write("\n")
+                self._torn = False
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                self._states[record["script"]] = record
+            f.flush()
+            os.fsync(f.fileno())
+
+    def enqueue(self, scripts):
+        """
+        Add scripts to the queue, unless they're already in it.
+
+        :param Iterable[str] scripts: paths to the scripts
+        """
+        with self._lock:
+            self._append(
+                [
+                    {"script": s, "state": "queued"}
+                    for s in scripts
+                    if s not in self._states
+                ]
+            )
+
+    def record(self, result):
+        """
+        Record the outcome of a submission.
+
+        :param divvy.SubmissionResult result: outcome of the submission
+        """
+        with self._lock:
+            self._append(
+                [
+                    {
+                        "script": result.script,
+                        "state": "submitted" if result.ok else "failed",
+                        "returncode": result.returncode,
+                        "job_id": result.job_id,
+                    }
+                ]
+            )
+
+    def submitted(self, script):
+        """
+        Get the record of a successful submission of a script.
+
+        :param str script: path to the script
+        :return dict | NoneType: the record, or None if the script hasn't
+            been submitted successfully
+        """
+        record = self._states.get(script)
+        return record if record and record["state"] == "submitted" else None
+
+    def pending(self):
+        """
+        Get the scripts that are queued, or whose submission failed.
+
+        :return list[str]: paths to the scripts, in order of queueing
+        """
+        return [s for s, r in self._states.items() if r["state"] != "submitted"]
+
+
+class SubmissionThrottle(object):
+    """
+    Submit many job scripts without overwhelming the scheduler.
+
+    Submissions are let through at most `rate` per second, and at most
+    `max_in_flight` submission commands run at once. With `max_queued`, no
+    script is submitted while the scheduler's queue holds that many of the
+    user's jobs, as counted by the probe, which is run at most once every
+    `probe_interval` seconds; submissions made since the last probe count
+    towards the queue too. A submission that fails with an error that looks
+    temporary, like a timeout or a submit limit, is tried again after an
+    exponentially growing, jittered, delay. With a journal, scripts that
+    were submitted successfully before are skipped, so a failed or
+    interrupted run can simply be repeated, or resumed with `resume`.
+
+    :param float rate: most submissions per second; no limit by default
+    :param int burst: most submissions let through at once under the rate
+    :param int max_in_flight: most submission commands running at once
+    :param int max_queued: most of the user's jobs in the scheduler's queue
+    :param callable probe: function that returns the number of the user's
+        jobs in the queue, or None if it can't tell; by default, a probe for
+        the scheduler of the submission command, e.g. squeue for sbatch
+    :param float probe_interval: seconds between queue probes
+    :param int retries: times to try a submission again after a temporary
+        failure
+    :param float backoff: seconds to wait before the first retry; each
+        further retry waits twice as long as the one before
+    :param float max_backoff: longest wait before a retry
+    :param str | SubmissionJournal journal: journal, or path to its file
+    :param re.Pattern transient: pattern of submission command output that
+        marks a failure as temporary
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        max_in_flight=None,
+        max_queued=None,
+        probe=None,
+        probe_interval=10.0,
+        retries=3,
+        backoff=1.0,
+        max_backoff=60.0,
+        journal=None,
+        transient=TRANSIENT_ERRORS,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight or DEFAULT_MAX_IN_FLIGHT
+        self.max_queued = max_queued
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        if journal is not None and not isinstance(journal, SubmissionJournal):
+            journal = SubmissionJournal(journal)
+        self.journal = journal
+        self.transient = transient
+
+    def retry_delay(self, attempt):
+        """
+        Seconds to wait before a retry.
+
+        :param int attempt: number of the retry, from 0
+        :return float: delay, between half and all of the exponential backoff
+        """
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def is_transient(self, result):
+        """
+        Whether a failed submission is worth trying again.
+
+        :param divvy.SubmissionResult result: outcome of the submission
+        :return bool: whether the failure looks temporary
+        """
+        if result.ok or result.command is None or result.returncode == 127:
+            return False
+        return bool(self.transient.search(result.stderr + result.stdout))
+
+    def submit(self, submission_command, scripts):
+        """
+        Submit job scripts, throttled.
+
+        :param str submission_command: command to submit each script with
+        :param Iterable[str] scripts: paths to the scripts to submit
+        :return list[divvy.SubmissionResult]: outcome for each script, in
+            order; for a script the journal has as submitted already, the
+            result has the recorded job ID, and no command
+        :raise ValueError: if the queue is limited, but there is no probe for
+            the submission command
+        """
+        scripts = [os.path.abspath(s) for s in scripts]
+        probe = self.probe
+        if self.max_queued is not None and probe is None:
+            probe = default_probe(submission_command)
+            if probe is None:
+                raise ValueError(
+                    "Limiting the queue needs a queue depth probe for "
+                    "'{}'".format(submission_command)
+                )
+        if self.journal is not None:
+            self.journal.enqueue(scripts)
+        return run_in_new_loop(
+            _ThrottledRun.run, self, submission_command, probe, scripts
+        )
+
+    def resume(self, submission_command):
+        """
+        Submit the scripts that the journal has as queued or failed.
+
+        :param str submission_command: command to submit each script with
+        :return list[divvy.SubmissionResult]: outcome for each script
+        :raise ValueError: if there is no journal
+        """
+        if self.journal is None:
+            raise ValueError("Resuming submission needs a journal")
+        scripts = self.journal.pending()
+        _LOGGER.info("Resuming submission of {} scripts".format(len(scripts)))
+        return self.submit(submission_command, scripts)
+
+
+class _ThrottledRun(object):
+    """
+    State of one throttled batch of submissions, on one event loop.
+
+    It holds asyncio primitives, so it's only made inside the running loop,
+    by `run`.
+    """
+
+    @classmethod
+    async def run(cls, throttle, submission_command, probe, scripts):
+        return await cls(throttle, submission_command, probe).submit_all(scripts)
+
+    def __init__(self, throttle, submission_command, probe):
+        self.throttle = throttle
+        self.submission_command = submission_command
+        self.probe = probe
+        self.bucket = throttle.rate and TokenBucket(throttle.rate, throttle.burst)
+        # a local command runs the script itself, so one at a time, in order
+        self.serial = scheduler_name(submission_command) == LOCAL_SCHEDULER
+        self.semaphore = asyncio.Semaphore(throttle.max_in_flight)
+        self.depth_lock = asyncio.Lock()
+        self.depth = None
+        self.probed_at = None
+
+    async def submit_all(self, scripts):
+        if self.serial:
+            return [await self.submit_one(s) for s in scripts]
+        return await asyncio.gather(*[self.submit_one(s) for s in scripts])
+
+    async def submit_one(self, script):
+        throttle = self.throttle
+        journal = throttle.journal
+        record = journal and journal.submitted(script)
+        if record:
+            _LOGGER.debug("Already submitted: {}".format(script))
+            return SubmissionResult(script, None, 0, "", "", record.get("job_id"), 0.0)
+        argv = submission_argv(self.submission_command, script)
+        async with self.semaphore:
+            for attempt in range(throttle.retries + 1):
+                await self.wait_for_room()
+                if self.bucket:
+                    await self.bucket.acquire()
+                result = await run_submission(argv, script)
+                if result.ok:
+                    break
+                # a failed submission doesn't add to the queue
+                self.release_room()
+                if attempt == throttle.retries or not throttle.is_transient(result):
+                    break
+                delay = throttle.retry_delay(attempt)
+                _LOGGER.info(
+                    "Retrying submission of {} in {:.1f}s".format(script, delay)
+                )
+                await asyncio.sleep(delay)
+        if journal is not None:
+            journal.record(result)
+        return result
+
+    async def wait_for_room(self):
+        """Wait until the queue has room for a job, and claim it."""
+        limit = self.throttle.max_queued
+        if limit is None:
+            return
+        loop = asyncio.get_event_loop()
+        while True:
+            async with self.depth_lock:
+                now = time.monotonic()
+                if (
+                    self.probed_at is None
+                    or now - self.probed_at >= self.throttle.probe_interval
+                ):
+                    depth = await loop.run_in_executor(None, self.probe)
+                    self.probed_at = now
+                    if depth is not None:
+                        self.depth = depth
+                    elif self.depth is None:
+                        self.depth = 0
+                if self.depth < limit:
+                    self.depth += 1
+                    return
+            _LOGGER.debug(
+                "Scheduler queue is full ({} jobs); waiting".format(self.depth)
+            )
+            await asyncio.sleep(self.throttle.probe_interval)
+
+    def release_room(self):
+        if self.throttle.max_queued is not None and self.depth:
+            self.depth -= 1
@@ -2,43 +2,98 @@
 
 import logging
 import os
-import re
 
+from . import profiling
+from .template import SubmissionTemplate
 
 _LOGGER = logging.getLogger(__name__)
 
+# Templates and the placeholders they were left with that were warned about,
+# so a batch of scripts written from one template warns only once
+_WARNED_UNFILLED = set()
 
-def write_submit_script(fp, content, data):
+
+def write_submit_script(fp, content, data, writer=None):
     """
     Write a submission script by populating a template with data.
 
+    Placeholders left unfilled are warned about once per template and set of
+    placeholders in a process, rather than for every script.
+
     :param str fp: Path to the file to which to create/write submissions script.
-    :param str content: Template for submission script, defining keys that
-        will be filled by given data
+    :param str | divvy.SubmissionTemplate content: Template for submission
+        script, defining keys that will be filled by given data; pass a
+        compiled template to avoid tokenizing it again for every script
     :param Mapping data: a "pool" from which values are available to replace
         keys in the template
+    :param divvy.ScriptWriter | divvy.BundleWriter writer: writer to write
+        the script with, e.g. one shared by a batch of scripts
     :return str: Path to the submission script
     """
+    with profiling.phase("render"):
+        if not isinstance(content, SubmissionTemplate):
+            content = SubmissionTemplate(content)
+        values = content.values(data)
+        keys_left = [n for n in content.placeholders if n not in values]
+        text = content.render(data, values)
 
-    for k, v in data.items():
-        placeholder = "{" + str(k).upper() + "}"
-        content = content.replace(placeholder, str(v))
-
-    keys_left = re.findall(r"!$\{(.+?)\}", content)
     if len(keys_left) > 0:
-        _LOGGER.warning(
-            "> Warning: %d submission template variables are not " "populated: '%s'",
-            len(keys_left),
-            str(keys_left),
-        )
+        warned = (content.digest, tuple(keys_left))
+        if warned in _WARNED_UNFILLED:
+            _LOGGER.debug("Unfilled template variables in %s: %s", fp, keys_left)
+        else:
+            _WARNED_UNFILLED.add(warned)
+            _LOGGER.warning(
+                "> Warning: %d submission template variables are not "
+                "populated: '%s'",
+                len(keys_left),
+                str(keys_left),
+            )
+
+    return write_file(fp, text, writer)
+
+
+def write_file(fp, content, writer=None):
+    """
+    Write text to a file, creating its folder if needed.
 
+    :param str fp: Path to the file to create/write; if not provided, the
+        text is printed instead
+    :param str content: text to write
+    :param divvy.ScriptWriter | divvy.BundleWriter writer: writer to write
+        the file with; by default, the file is written right away
+    :return str: Path to the file, or the text if no path was provided
+    """
     if not fp:
         print(content)
         return content
+    elif writer is not None:
+        return writer.write(fp, content)
     else:
-        outdir = os.path.dirname(fp)
-        if outdir and not os.path.isdir(outdir):
-            os.makedirs(outdir)
-        with open(fp, "w") as f:
-            f.write(content)
+        with profiling.phase("write"):
+            outdir = os.path.dirname(fp)
+            if outdir and not os.path.isdir(outdir):
+                os.makedirs(outdir)
+            with open(fp, "w") as f:
+                f.write(content)
+        if profiling.get_profile() is not None:
+            profiling.count("scripts.written")
+            profiling.count("bytes.written", len(content.encode()))
         return fp
+
+
+def copy_tree(src, dst):
+    """
+    Copy a folder's contents into another, possibly existing, folder.
+
+    :param str src: Path to the folder to copy
+    :param str dst: Path to the folder to copy into
+    """
+    import shutil
+
+    for root, _, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        for f in files:
+            shutil.copy2(os.path.join(root, f), os.path.join(target, f))
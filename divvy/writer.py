@@ -0,0 +1,332 @@
+""" Writers of many small submission scripts, to folders or to a bundle """
+
+import io
+import json
+import logging
+import os
+import tarfile
+import threading
+import time
+
+from . import profiling
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["BundleWriter", "ScriptWriter"]
+
+# tarfile write mode by bundle file extension, and the JSON Lines shard
+_BUNDLE_MODES = [
+    (".tar", "w"),
+    (".tar.gz", "w:gz"),
+    (".tgz", "w:gz"),
+    (".tar.bz2", "w:bz2"),
+    (".tar.xz", "w:xz"),
+    (".jsonl", None),
+]
+
+
+class ScriptWriter(object):
+    """
+    Writer of scripts to files, for batches of many small scripts.
+
+    On network file systems, such as NFS or Lustre, checking and creating
+    folders costs far more than writing a small file. A writer remembers the
+    folders it has seen, so each is checked once per batch rather than once
+    per script, and with a buffer, holds scripts back and writes them folder
+    by folder. Atomic writes go to a temporary file next to the script,
+    which is then renamed over it, so a script is never seen half written.
+    With fsync, each script's content is flushed to disk before it is closed
+    or renamed, and each folder written to is flushed once, when the buffer
+    is.
+
+    Writes are thread-safe. A buffered writer reports a failed write when
+    the script's buffer is flushed, so possibly from a later write, and
+    scripts held back are only written when the buffer fills, or on `flush`
+    or `close`.
+
+    :param int buffer: number of scripts to hold back before writing them;
+        by default, scripts are written right away
+    :param bool atomic: whether to write each script to a temporary file and
+        rename it
+    :param bool fsync: whether to flush scripts, and the folders they are
+        written to, to disk
+    """
+
+    def __init__(self, buffer=0, atomic=False, fsync=False):
+        self.buffer = buffer
+        self.atomic = atomic
+        self.fsync = fsync
+        self._folders = set()
+        self._unsynced = set()
+        self._pending = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{}(buffer={}, atomic={}, fsync={})".format(
+            self.__class__.__name__, self.buffer, self.atomic, self.fsync
+        )
+
+    def __getstate__(self):
+        if self._pending_count:
+            raise TypeError("Can't pickle a writer with scripts held back")
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @property
+    def buffered(self):
+        """
+        Whether scripts may not be on disk yet when `write` returns.
+
+        :return bool: whether scripts are held back
+        """
+        return self.buffer > 0
+
+    def write(self, path, content):
+        """
+        Write, or hold back, a script.
+
+        :param str path: path to the script
+        :param str content: text of the script
+        :return str: path to the script
+        """
+        if not self.buffered:
+            with profiling.phase("write"):
+                self._write(path, content)
+            if self.fsync:
+                with self._lock:
+                    self._unsynced.add(os.path.dirname(path) or os.curdir)
+            return path
+        folder = os.path.dirname(path)
+        with self._lock:
+            self._pending.setdefault(folder, []).append((path, content))
+            self._pending_count += 1
+            if self._pending_count >= self.buffer:
+                self._flush()
+        return path
+
+    def flush(self):
+        """Write the scripts held back, and flush written folders to disk."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Write the scripts held back; the writer may still be used after."""
+        self.flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._pending_count = 0
+        with profiling.phase("write"):
+            for folder, scripts in pending.items():
+                for path, content in scripts:
+                    self._write(path, content)
+                if self.fsync:
+                    self._unsynced.add(folder or os.curdir)
+            unsynced, self._unsynced = self._unsynced, set()
+            for folder in unsynced:
+                _sync_folder(folder)
+
+    def _write(self, path, content):
+        folder = os.path.dirname(path)
+        if folder and folder not in self._folders:
+            os.makedirs(folder, exist_ok=True)
+            self._folders.add(folder)
+            profiling.count("folders.created")
+        try:
+            self._write_file(path, content)
+        except FileNotFoundError:
+            if not folder:
+                raise
+            # The folder was removed since it was seen
+            os.makedirs(folder, exist_ok=True)
+            self._write_file(path, content)
+        if profiling.get_profile() is not None:
+            profiling.count("scripts.written")
+            profiling.count("bytes.written", len(content.encode()))
+
+    def _write_file(self, path, content):
+        target = path
+        if self.atomic:
+            path = "{}.{}-{}.tmp".format(path, os.getpid(), threading.get_ident())
+        try:
+            with open(path, "w") as f:
+                f.write(content)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if self.atomic:
+                os.replace(path, target)
+        except BaseException:
+            if self.atomic and os.path.exists(path):
+                os.remove(path)
+            raise
+
+
+def _sync_folder(folder):
+    """Flush a folder's entries, e.g. of renamed files, to disk."""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError as e:
+        _LOGGER.debug("Can't open folder {} to sync it: {}".format(folder, e))
+        return
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # Not every platform and file system can sync folders
+        _LOGGER.debug("Can't sync folder {}: {}".format(folder, e))
+    finally:
+        os.close(fd)
+
+
+class BundleWriter(object):
+    """
+    Writer of a batch's scripts into a single bundle file, for schedulers
+    and workflow tools that read scripts from a bundle.
+
+    The bundle is a tar archive, compressed or not, or a JSON Lines shard
+    with an object per script, with its 'path' and 'content'. The bundle is
+    written to a temporary file next to it, which is renamed when the writer
+    is closed, so it is only there once it is complete. Writes are
+    thread-safe.
+
+    :param str path: path to the bundle file; its extension, one of '.tar',
+        '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz' or '.jsonl', sets its format
+    :param str root: folder that the scripts' paths in the bundle are
+        relative to; by default, paths are kept as given, without a leading
+        separator
+    :param bool fsync: whether to flush the bundle to disk when it is closed
+    :raise ValueError: if the path has none of the bundle extensions
+    """
+
+    buffered = True
+
+    def __init__(self, path, root=None, fsync=False):
+        mode = next(
+            (
+                (ext, mode)
+                for ext, mode in sorted(_BUNDLE_MODES, key=lambda m: -len(m[0]))
+                if path.endswith(ext)
+            ),
+            None,
+        )
+        if mode is None:
+            raise ValueError(
+                "Unknown bundle format of '{}'; use one of the extensions: "
+                "{}".format(path, ", ".join(ext for ext, _ in _BUNDLE_MODES))
+            )
+        self.path = path
+        self.format = "jsonl" if mode[1] is None else "tar"
+        self.root = root
+        self.fsync = fsync
+        self.count = 0
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._tmp = "{}.{}.tmp".format(path, os.getpid())
+        self._file = open(self._tmp, "wb")
+        self._tar = None
+        if mode[1] is not None:
+            self._tar = tarfile.open(fileobj=self._file, mode=mode[1])
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    @property
+    def closed(self):
+        """
+        Whether the bundle is complete, or was discarded.
+
+        :return bool: whether scripts can no longer be added
+        """
+        return self._file is None
+
+    def write(self, path, content):
+        """
+        Add a script to the bundle.
+
+        :param str path: path to the script
+        :param str content: text of the script
+        :return str: name of the script in the bundle
+        :raise ValueError: if the bundle was closed
+        """
+        name = self._name(path)
+        data = content.encode()
+        with self._lock:
+            if self._file is None:
+                raise ValueError("Bundle is closed: {}".format(self.path))
+            with profiling.phase("write"):
+                if self._tar is None:
+                    record = {"path": name, "content": content}
+                    self._file.write(json.dumps(record).encode() + b"\n")
+                else:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    info.mode = 0o644
+                    self._tar.addfile(info, io.BytesIO(data))
+            self.count += 1
+        if profiling.get_profile() is not None:
+            profiling.count("scripts.written")
+            profiling.count("bytes.written", len(data))
+        return name
+
+    def flush(self):
+        """Flush the bundle's buffers; it's complete only once closed."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        """Complete the bundle, and move it to its path."""
+        with self._lock:
+            if self._file is None:
+                return
+            if self._tar is not None:
+                self._tar.close()
+            if self.fsync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp, self.path)
+            if self.fsync:
+                _sync_folder(os.path.dirname(self.path) or os.curdir)
+        _LOGGER.info("Bundled {} scripts into {}".format(self.count, self.path))
+
+    def discard(self):
+        """Drop the bundle, leaving any previous file at its path as is."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+            os.remove(self._tmp)
+
+    def _name(self, path):
+        if self.root is not None:
+            path = os.path.relpath(path, self.root)
+        return path.replace(os.sep, "/").lstrip("/")
@@ -1,7 +1,10 @@
 import os
 import glob
+import logging
+import stat
 import divvy
 import pytest
+import yaml
 
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -9,6 +12,43 @@ DATA_DIR = os.path.join(THIS_DIR, "data/divcfg-master")
 FILES = glob.glob(DATA_DIR + "/*.yaml")
 DCC_ATTRIBUTES = divvy.ComputingConfiguration().keys()
 
+# Fake scheduler: the queue is a file with a line per job, which the fake
+# squeue lists and then empties, as if the jobs had all started; sbatch
+# records the queue length at each submission, and the names of the scripts
+# it submitted. Scripts named 'flaky*' fail with a timeout on their first
+# submission, and 'bad*' always fail.
+FAKE_SBATCH = """#!/bin/sh
+dir=$(dirname "$0")
+name=$(basename "$1" .sub)
+case "$name" in
+  bad*)
+    echo "sbatch: error: invalid partition" >&2
+    exit 1;;
+  flaky*)
+    if [ ! -e "$dir/$name.tried" ]; then
+      touch "$dir/$name.tried"
+      echo "sbatch: error: Socket timed out on send/recv operation" >&2
+      exit 1
+    fi;;
+esac
+echo "$name" >> "$dir/queue"
+wc -l < "$dir/queue" >> "$dir/depths"
+echo "$name" >> "$dir/submitted"
+echo "Submitted batch job $(echo "$name" | tr -cd 0-9)"
+"""
+
+FAKE_SQUEUE = """#!/bin/sh
+dir=$(dirname "$0")
+cat "$dir/queue" 2>/dev/null
+: > "$dir/queue"
+"""
+
+
+def _executable(path, content):
+    path.write(content)
+    os.chmod(path.strpath, os.stat(path.strpath).st_mode | stat.S_IEXEC)
+    return path.strpath
+
 
 @pytest.fixture
 def empty_dcc():
@@ -22,6 +62,53 @@ def dcc(request):
     return divvy.ComputingConfiguration(filepath=request.param)
 
 
+@pytest.fixture
+def fake_scheduler(tmpdir):
+    """Provide a folder with the fake sbatch and squeue"""
+    _executable(tmpdir.join("sbatch"), FAKE_SBATCH)
+    _executable(tmpdir.join("squeue"), FAKE_SQUEUE)
+    return tmpdir
+
+
+@pytest.fixture
+def fake_sbatch(fake_scheduler):
+    """Provide the path to the fake sbatch"""
+    return fake_scheduler.join("sbatch").strpath
+
+
+@pytest.fixture
+def make_dcc(tmpdir):
+    """
+    Provide a function that writes the given templates and a
+    divvy_config.yaml with the given compute packages into tmpdir, and
+    returns the ComputingConfiguration loaded from it
+    """
+
+    def make(packages, templates=None, adapters=None):
+        for name, content in (templates or {}).items():
+            tmpdir.join(name).write(content)
+        data = {"compute_packages": packages}
+        if adapters:
+            data["adapters"] = adapters
+        cfg = tmpdir.join("divvy_config.yaml")
+        cfg.write(yaml.safe_dump(data, default_flow_style=False))
+        return divvy.ComputingConfiguration(filepath=cfg.strpath)
+
+    return make
+
+
+@pytest.fixture
+def divvy_caplog(caplog):
+    """
+    Provide caplog, capturing divvy's records even when its logger doesn't
+    propagate, as with logmuse before 0.3
+    """
+    logger = logging.getLogger("divvy")
+    logger.addHandler(caplog.handler)
+    yield caplog
+    logger.removeHandler(caplog.handler)
+
+
 @pytest.fixture
 def mock_env_missing(monkeypatch):
     [
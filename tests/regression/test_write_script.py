@@ -23,3 +23,68 @@ def test_write_script_is_effect_free(tmpdir, extras):
     compute1 = deepcopy(cc.compute_packages)
     cc.write_script(tmpdir.join(get_random_key(20) + ".sh").strpath, extras)
     assert cc.compute_packages == compute1
+
+
+def _legacy_variables(cc, extra_vars):
+    """Variables as they were populated on a deep copy of the active package"""
+    variables = deepcopy(cc.compute)
+    if not isinstance(extra_vars, list):
+        extra_vars = [extra_vars]
+    exclude = set()
+    for n, v in cc.get_adapters().items():
+        split_v = v.split(".")
+        for extra_var in reversed(extra_vars):
+            if len(extra_var) > 0 and split_v[0] in list(extra_var.keys())[0]:
+                exclude.add(split_v[0])
+                var = extra_var
+                for a in split_v:
+                    var = var.get(a) if var is not None else None
+                if var is not None:
+                    variables[n] = var
+    for extra_var in reversed(extra_vars):
+        if len(extra_var) > 0 and list(extra_var.keys())[0] not in exclude:
+            variables.update(extra_var)
+    return variables
+
+
+@pytest.mark.parametrize("package", ["docker", "slurm", "singularity_slurm"])
+@pytest.mark.parametrize(
+    "extras",
+    [
+        {"code": "ls"},
+        [{"looper": {"command": "ls", "job_name": "j"}}, {"JOBNAME": "k"}],
+        [{"compute": {"mem": 1, "cores": 2}}, {"mem": 3}, {"MEM": 4, "time": 1}],
+        [{"docker_args": "--rm"}, {"code": "a", "submission_template": "x"}],
+    ],
+)
+def test_layered_variables_match_deepcopy(tmpdir, package, extras):
+    """Layered variables have the same contents and order as the deep copy."""
+    cc = ComputingConfiguration()
+    cc.activate_package(package)
+    expected = _legacy_variables(cc, extras)
+    template = cc._compiled_template()
+    path = cc.write_script(tmpdir.join("layered.sh").strpath, extras)
+    with open(path) as f:
+        assert f.read() == template.render(expected)
+
+
+@pytest.mark.parametrize(
+    ["extras", "expected"],
+    [
+        ({"sample": {"name": "s1", "reads": 2}}, "name: s1\nreads: 2"),
+        ({"sample": {"genome": {"name": "hg38"}}}, "genome:\n  name: hg38"),
+        ({"sample": {"files": ["a", "b"]}}, "files: \n - a\n - b"),
+    ],
+)
+def test_mapping_variables_written_as_yaml(make_dcc, tmpdir, extras, expected):
+    """Mapping values fill a slot with the text the YacAttMap pool gave."""
+    cc = make_dcc(
+        {"default": {"submission_template": "t.sub", "submission_command": "sh"}},
+        {"t.sub": "#!/bin/bash\n{SAMPLE}\n"},
+    )
+    expected_script = "#!/bin/bash\n{}\n".format(expected)
+    path = cc.write_script(tmpdir.join("s.sh").strpath, extras)
+    with open(path) as f:
+        assert f.read() == expected_script
+    legacy = cc._compiled_template().render(_legacy_variables(cc, extras))
+    assert legacy == expected_script
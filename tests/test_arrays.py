@@ -0,0 +1,58 @@
+""" Tests for array job scripts """
+
+import os
+import subprocess
+import pytest
+
+from divvy import ComputingConfiguration
+
+
+@pytest.fixture
+def slurm_dcc():
+    dcc = ComputingConfiguration()
+    dcc.activate_package("slurm")
+    return dcc
+
+
+TASKS = [
+    {"looper": {"command": "echo 'first task' | tr a-z A-Z"}},
+    {"looper": {"command": 'echo "second\ttask"'}},
+    {"looper": {"command": "echo third > /dev/null; echo 3"}},
+]
+
+
+def test_array_script_header(tmpdir, slurm_dcc):
+    path = slurm_dcc.write_array_script(
+        tmpdir.join("array.sub").strpath, TASKS, {"jobname": "arr", "mem": "4G"}
+    )
+    with open(path) as f:
+        lines = f.read().split("\n")
+    assert "#SBATCH --array=1-3" in lines
+    assert "#SBATCH --job-name='arr'" in lines
+    assert "#SBATCH --mem='4G'" in lines
+    assert lines.index("#SBATCH --array=1-3") == 9
+    with open(path + ".params") as f:
+        assert len(f.read().splitlines()) == 3
+
+
+@pytest.mark.parametrize(
+    ["task_id", "expected"], [(1, "FIRST TASK"), (2, "second\ttask"), (3, "3")]
+)
+def test_array_task_runs_its_command(tmpdir, slurm_dcc, task_id, expected):
+    path = slurm_dcc.write_array_script(tmpdir.join("array.sub").strpath, TASKS)
+    env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(task_id))
+    out = subprocess.check_output(["bash", path], env=env, universal_newlines=True)
+    assert out.rstrip("\n").split("\n")[-1] == expected
+
+
+def test_varying_directive_rejected(tmpdir, slurm_dcc):
+    tasks = [{"jobname": "a", "code": "ls"}, {"jobname": "b", "code": "ls"}]
+    with pytest.raises(ValueError):
+        slurm_dcc.write_array_script(tmpdir.join("array.sub").strpath, tasks)
+
+
+def test_local_package_rejected(tmpdir):
+    with pytest.raises(ValueError):
+        ComputingConfiguration().write_array_script(
+            tmpdir.join("array.sub").strpath, TASKS
+        )
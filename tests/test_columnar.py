@@ -0,0 +1,99 @@
+""" Tests for bulk rendering of columnar job tables """
+
+import pytest
+
+from divvy import ComputingConfiguration, SubmissionTemplate
+from tests.test_template import TEMPLATES
+
+np = pytest.importorskip("numpy")
+from divvy.columnar import render_columns, table_columns  # noqa: E402
+
+TABLE = {
+    "code": np.array(["echo {}".format(i) for i in range(20)], dtype=object),
+    "JOBNAME": np.array(["job{}".format(i) for i in range(20)]),
+    "mem": np.arange(20) * 1000,
+    "cores": np.linspace(0.5, 10, 20),
+    "logfile": ["log{}.txt".format(i) for i in range(20)],
+}
+SHARED = {"time": "01:00:00", "partition": "standard", "mem": "overridden"}
+
+
+def _rows(table):
+    columns, n_rows = table_columns(table)
+    return [{k: c[i] for k, c in columns.items()} for i in range(n_rows)]
+
+
+@pytest.mark.parametrize("template_path", TEMPLATES)
+def test_matches_row_by_row_rendering(template_path):
+    template = SubmissionTemplate.from_file(template_path)
+    expected = [template.render(dict(SHARED, **row)) for row in _rows(TABLE)]
+    assert render_columns(template, TABLE, SHARED) == expected
+
+
+def test_mixed_types_rendered_as_given():
+    table = {
+        "mem": [2, 2.5, True, None],
+        "sample": [{"name": "a"}, "b", 3, {"name": "d", "reads": [1]}],
+    }
+    template = SubmissionTemplate("{MEM} {SAMPLE}")
+    rows = [{"mem": m, "sample": s} for m, s in zip(table["mem"], table["sample"])]
+    expected = [template.render(row) for row in rows]
+    assert expected[0] == "2 name: a"
+    assert render_columns(template, table) == expected
+
+
+def test_template_without_varying_slots():
+    template = SubmissionTemplate("#!/bin/bash\n{TIME} {UNKNOWN}\n")
+    assert (
+        render_columns(template, TABLE, SHARED)
+        == ["#!/bin/bash\n01:00:00 {UNKNOWN}\n"] * 20
+    )
+
+
+def test_empty_table():
+    assert render_columns(SubmissionTemplate("{CODE}"), {"code": []}) == []
+
+
+def test_columns_of_different_lengths():
+    with pytest.raises(ValueError, match="different lengths"):
+        table_columns({"a": [1, 2], "b": [1]})
+
+
+def test_not_a_table():
+    with pytest.raises(TypeError):
+        table_columns([1, 2, 3])
+
+
+def test_dataframe():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame(TABLE)
+    template = SubmissionTemplate("{CODE} {JOBNAME} {MEM} {CORES}")
+    assert render_columns(template, frame) == render_columns(template, TABLE)
+
+
+class TestConfiguration:
+    def test_write_columns_matches_stream_scripts(self, tmpdir):
+        dcc = ComputingConfiguration()
+        dcc.activate_package("slurm")
+        pattern = tmpdir.join("bulk", "{JOBNAME}.sub").strpath
+        paths = dcc.write_columns(pattern, TABLE, SHARED)
+        assert paths == [pattern.replace("{JOBNAME}", j) for j in TABLE["JOBNAME"]]
+        streamed = dcc.stream_scripts(
+            _rows(TABLE), tmpdir.join("{JOBNAME}.sub").strpath, SHARED
+        )
+        for bulk_path, stream_path in zip(paths, streamed):
+            with open(bulk_path) as bulk, open(stream_path) as stream:
+                assert bulk.read() == stream.read()
+
+    def test_render_columns_uses_adapters_for_shared_variables(self):
+        dcc = ComputingConfiguration()
+        dcc.activate_package("slurm")
+        contents = dcc.render_columns(
+            {"code": ["a", "b"]}, [{"compute": {"mem": 1234}}]
+        )
+        assert all("--mem='1234'" in c for c in contents)
+
+    def test_path_pattern_must_vary(self, tmpdir):
+        dcc = ComputingConfiguration()
+        with pytest.raises(ValueError, match="same path"):
+            dcc.write_columns(tmpdir.join("same.sub").strpath, TABLE)
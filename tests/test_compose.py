@@ -0,0 +1,264 @@
+""" Tests for configurations composed with extends and include """
+
+import os
+
+import pytest
+import yacman
+
+from divvy import ComputingConfiguration, ConfigCompositionError, ConfigResolver
+from divvy.compose import default_resolver
+from divvy.const import CONFIG_CACHE_DIR_VARNAME
+
+BASE = """\
+compute_packages:
+  default:
+    submission_template: templates/local.sub
+    submission_command: sh
+  slurm:
+    submission_template: templates/slurm.sub
+    submission_command: sbatch
+    partition: standard
+    mem: 4G
+adapters:
+  CODE: looper.command
+  JOBNAME: looper.job_name
+"""
+
+
+@pytest.fixture(autouse=True)
+def fresh_resolver():
+    default_resolver().clear()
+    yield
+    default_resolver().clear()
+
+
+@pytest.fixture
+def base(tmpdir):
+    folder = tmpdir.mkdir("site")
+    folder.mkdir("templates")
+    folder.join("templates", "local.sub").write("{CODE}\n")
+    folder.join("templates", "slurm.sub").write("#SBATCH -p {PARTITION}\n{CODE}\n")
+    path = folder.join("base.yaml")
+    path.write(BASE)
+    return path
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Paths of the configuration files parsed"""
+    calls = []
+    load_yaml = yacman.load_yaml
+
+    def counting(path):
+        calls.append(os.path.basename(path))
+        return load_yaml(path)
+
+    monkeypatch.setattr(yacman, "load_yaml", counting)
+    return calls
+
+
+def _write(tmpdir, name, text):
+    path = tmpdir.join(name)
+    path.write(text)
+    return path.strpath
+
+
+def test_extends_file(tmpdir, base):
+    cfg = _write(
+        tmpdir,
+        "derived.yaml",
+        "extends: site/base.yaml\n"
+        "compute_packages:\n"
+        "  slurm:\n"
+        "    partition: bigmem\n"
+        "  mine:\n"
+        "    submission_template: mine.sub\n"
+        "    submission_command: sh\n"
+        "adapters:\n"
+        "  CODE: pipeline.command\n",
+    )
+    dcc = ComputingConfiguration(filepath=cfg)
+    assert "extends" not in dcc
+    assert dcc.list_compute_packages() == {"default", "slurm", "mine"}
+    assert dcc.activate_package("slurm")
+    assert dcc.compute.partition == "bigmem"
+    assert dcc.compute.mem == "4G"
+    # templates are relative to the file that names them
+    assert dcc.compute.submission_template == base.dirpath("templates/slurm.sub")
+    assert dcc.template() == "#SBATCH -p {PARTITION}\n{CODE}\n"
+    dcc.activate_package("mine")
+    assert dcc.compute.submission_template == tmpdir.join("mine.sub").strpath
+    assert dict(dcc.adapters) == {
+        "CODE": "pipeline.command",
+        "JOBNAME": "looper.job_name",
+    }
+
+
+def test_include_order(tmpdir, base):
+    _write(tmpdir, "a.yaml", "compute_packages:\n  slurm:\n    partition: a\n")
+    _write(tmpdir, "b.yaml", "compute_packages:\n  slurm:\n    partition: b\n")
+    cfg = _write(
+        tmpdir,
+        "c.yaml",
+        "include: [a.yaml, b.yaml]\nextends: site/base.yaml\ncompute_packages: {}\n",
+    )
+    dcc = ComputingConfiguration(filepath=cfg)
+    dcc.activate_package("slurm")
+    assert dcc.compute.partition == "b"
+    assert dcc.compute.submission_command == "sbatch"
+
+
+def test_package_extends_and_include(tmpdir, base):
+    tmpdir.mkdir("containers").join("singularity.yaml").write(
+        "submission_template: singularity.sub\n" "singularity_args: --bind /scratch\n"
+    )
+    cfg = _write(
+        tmpdir,
+        "derived.yaml",
+        "extends: site/base.yaml\n"
+        "compute_packages:\n"
+        "  bigmem:\n"
+        "    extends: slurm\n"
+        "    partition: bigmem\n"
+        "  bigmem_long:\n"
+        "    extends: [bigmem]\n"
+        "    time: '48:00:00'\n"
+        "  slurm_singularity:\n"
+        "    extends: slurm\n"
+        "    include: containers/singularity.yaml\n",
+    )
+    dcc = ComputingConfiguration(filepath=cfg)
+    dcc.activate_package("bigmem_long")
+    assert (dcc.compute.partition, dcc.compute.time) == ("bigmem", "48:00:00")
+    assert dcc.compute.submission_command == "sbatch"
+    assert "extends" not in dcc.compute
+    dcc.activate_package("slurm_singularity")
+    assert dcc.compute.partition == "standard"
+    assert dcc.compute.singularity_args == "--bind /scratch"
+    assert dcc.compute.submission_template == tmpdir.join(
+        "containers", "singularity.sub"
+    )
+    # the packages extended are unchanged
+    dcc.activate_package("slurm")
+    assert dcc.compute.partition == "standard"
+
+
+def test_file_cycle(tmpdir):
+    _write(tmpdir, "a.yaml", "extends: b.yaml\ncompute_packages: {}\n")
+    _write(tmpdir, "b.yaml", "include: [a.yaml]\ncompute_packages: {}\n")
+    with pytest.raises(ConfigCompositionError, match="a.yaml -> .*b.yaml -> .*a.yaml"):
+        ComputingConfiguration(filepath=tmpdir.join("a.yaml").strpath)
+
+
+def test_package_cycle(tmpdir, base):
+    cfg = _write(
+        tmpdir,
+        "c.yaml",
+        "extends: site/base.yaml\n"
+        "compute_packages:\n"
+        "  a:\n    extends: b\n"
+        "  b:\n    extends: c\n"
+        "  c:\n    extends: a\n",
+    )
+    with pytest.raises(ConfigCompositionError, match="a -> b -> c -> a"):
+        ComputingConfiguration(filepath=cfg)
+
+
+@pytest.mark.parametrize(
+    ["text", "message"],
+    [
+        ("extends: nowhere.yaml\n", "Can't find .*nowhere.yaml"),
+        ("compute_packages:\n  a:\n    extends: nothing\n", "unknown package"),
+        ("compute_packages:\n  a:\n    include: nowhere.yaml\n", "package 'a'"),
+        ("extends: {a: b}\n", "must be a name or a list of names"),
+    ],
+)
+def test_broken_references(tmpdir, text, message):
+    with pytest.raises(ConfigCompositionError, match=message):
+        ComputingConfiguration(filepath=_write(tmpdir, "c.yaml", text))
+
+
+def test_resolved_configuration_is_validated(tmpdir, base):
+    cfg = _write(
+        tmpdir,
+        "c.yaml",
+        "extends: site/base.yaml\ncompute_packages:\n  slurm:\n    mem: [1, 2]\n",
+    )
+    with pytest.raises(Exception, match="not of type 'string'"):
+        ComputingConfiguration(filepath=cfg)
+
+
+def test_shared_base_is_parsed_once(tmpdir, base, parsed):
+    configs = [
+        _write(
+            tmpdir,
+            "{}.yaml".format(p),
+            "extends: site/base.yaml\n"
+            "compute_packages:\n  slurm:\n    partition: {}\n".format(p),
+        )
+        for p in ("short", "long", "gpu")
+    ]
+    for path in configs:
+        ComputingConfiguration(filepath=path)
+    assert sorted(parsed) == ["base.yaml", "gpu.yaml", "long.yaml", "short.yaml"]
+    dcc = ComputingConfiguration(filepath=configs[2])
+    assert len(parsed) == 4
+    dcc.activate_package("slurm")
+    assert dcc.compute.partition == "gpu"
+    # changing the resolved configuration leaves the memo as it was
+    dcc.compute_packages = {}
+    assert "slurm" in ComputingConfiguration(filepath=configs[2]).compute_packages
+
+
+def test_edited_base_is_parsed_again(tmpdir, base, parsed):
+    cfg = _write(tmpdir, "c.yaml", "extends: site/base.yaml\n")
+    ComputingConfiguration(filepath=cfg)
+    base.write(BASE.replace("standard", "edited-partition"))
+    dcc = ComputingConfiguration(filepath=cfg)
+    assert parsed == ["c.yaml", "base.yaml", "base.yaml"]
+    dcc.activate_package("slurm")
+    assert dcc.compute.partition == "edited-partition"
+
+
+def test_persistent_cache_follows_base(tmpdir, base, monkeypatch):
+    monkeypatch.setenv(CONFIG_CACHE_DIR_VARNAME, tmpdir.join("cache").strpath)
+    cfg = _write(tmpdir, "c.yaml", "extends: site/base.yaml\n")
+    ComputingConfiguration(filepath=cfg, use_cache=True)
+    base.write(BASE.replace("standard", "edited-partition"))
+    dcc = ComputingConfiguration(filepath=cfg, use_cache=True)
+    dcc.activate_package("slurm")
+    assert dcc.compute.partition == "edited-partition"
+
+
+def test_update_packages_on_merged_view(tmpdir, base):
+    dcc = ComputingConfiguration(
+        filepath=_write(tmpdir, "c.yaml", "extends: site/base.yaml\n")
+    )
+    update = _write(
+        tmpdir,
+        "update.yaml",
+        "compute_packages:\n"
+        "  slurm:\n    partition: updated\n"
+        "  gpu:\n    extends: slurm\n    gres: gpu:1\n",
+    )
+    dcc.update_packages(update)
+    assert dcc.list_compute_packages() == {"default", "slurm", "gpu"}
+    dcc.activate_package("gpu")
+    assert dcc.compute.partition == "updated"
+    assert dcc.compute.gres == "gpu:1"
+    assert dcc.compute.submission_template == base.dirpath("templates/slurm.sub")
+    dcc.activate_package("slurm")
+    assert dcc.compute.mem == "4G"
+
+
+def test_resolver_api(tmpdir, base):
+    resolver = ConfigResolver()
+    entries, sources = resolver.resolve(base.strpath)
+    assert entries["compute_packages"]["slurm"]["partition"] == "standard"
+    assert [path for path, _ in sources] == [base.strpath]
+    entries["compute_packages"].clear()
+    again, _ = resolver.resolve(base.strpath)
+    assert "slurm" in again["compute_packages"]
+    packages = {"a": {"x": "1"}, "b": {"extends": "a", "y": "2"}}
+    assert resolver.resolve_packages(packages) == {"b": {"x": "1", "y": "2"}}
+    assert packages["b"] == {"x": "1", "y": "2"}
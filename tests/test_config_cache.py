@@ -0,0 +1,150 @@
+""" Tests for the persistent cache of validated configurations """
+
+import os
+import pickle
+import shutil
+
+import pytest
+import yacman
+
+from divvy import ComputingConfiguration
+from divvy.config_cache import ConfigCache, config_cache_enabled, default_cache_dir
+from divvy.const import CONFIG_CACHE_DIR_VARNAME, CONFIG_CACHE_VARNAME
+from tests.conftest import DATA_DIR, FILES
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    """Point the configuration cache at a temporary folder"""
+    path = str(tmpdir.join("cache"))
+    monkeypatch.setenv(CONFIG_CACHE_DIR_VARNAME, path)
+    return path
+
+
+@pytest.fixture
+def cfg_file(tmpdir):
+    """A configuration file, with its templates, that tests may edit"""
+    dst = tmpdir.join("cfg")
+    shutil.copytree(DATA_DIR, str(dst))
+    return str(dst.join("compute_config.yaml"))
+
+
+def _count_validations(monkeypatch):
+    calls = []
+    validate = yacman.YacAttMap.validate
+
+    def counting_validate(self, *args, **kwargs):
+        calls.append(1)
+        return validate(self, *args, **kwargs)
+
+    monkeypatch.setattr(yacman.YacAttMap, "validate", counting_validate)
+    return calls
+
+
+class TestSwitch:
+    def test_off_by_default(self, monkeypatch):
+        monkeypatch.delenv(CONFIG_CACHE_VARNAME, raising=False)
+        assert not config_cache_enabled()
+
+    @pytest.mark.parametrize("value", ["1", "true", "YES"])
+    def test_env_var_turns_on(self, monkeypatch, value):
+        monkeypatch.setenv(CONFIG_CACHE_VARNAME, value)
+        assert config_cache_enabled()
+
+    def test_xdg_cache_home(self, monkeypatch, tmpdir):
+        monkeypatch.delenv(CONFIG_CACHE_DIR_VARNAME, raising=False)
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+        assert default_cache_dir() == os.path.join(str(tmpdir), "divvy")
+
+    def test_uncached_load_writes_nothing(self, cache_dir, cfg_file, monkeypatch):
+        monkeypatch.delenv(CONFIG_CACHE_VARNAME, raising=False)
+        ComputingConfiguration(filepath=cfg_file)
+        assert not os.path.exists(cache_dir)
+
+
+class TestCachedLoad:
+    @pytest.mark.parametrize("filepath", FILES)
+    def test_same_as_uncached(self, cache_dir, filepath):
+        plain = ComputingConfiguration(filepath=filepath)
+        stored = ComputingConfiguration(filepath=filepath, use_cache=True)
+        cached = ComputingConfiguration(filepath=filepath, use_cache=True)
+        assert len(os.listdir(cache_dir)) == 1
+        for dcc in (stored, cached):
+            assert dcc.to_dict() == plain.to_dict()
+            assert dcc.config_file == plain.config_file
+            assert dcc.template() == plain.template()
+            assert dcc.list_compute_packages() == plain.list_compute_packages()
+
+    def test_hit_skips_validation(self, cache_dir, cfg_file, monkeypatch):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        calls = _count_validations(monkeypatch)
+        dcc = ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert not calls
+        assert dcc["__internal"].schema
+
+    def test_edit_invalidates(self, cache_dir, cfg_file, monkeypatch):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        with open(cfg_file, "a") as f:
+            f.write("  extra_package:\n    submission_template: x.sub\n")
+        calls = _count_validations(monkeypatch)
+        dcc = ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert calls
+        assert "extra_package" in dcc.list_compute_packages()
+
+    def test_cached_config_activates_packages(self, cache_dir, cfg_file):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        dcc = ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert dcc.activate_package("local")
+        assert dcc.compute.submission_command == "sh"
+        assert os.path.isabs(dcc.compute.submission_template)
+
+    def test_corrupt_entry_is_ignored(self, cache_dir, cfg_file):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), "wb") as f:
+                f.write(b"not a pickle")
+        dcc = ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert "local" in dcc.list_compute_packages()
+
+    @pytest.mark.parametrize(
+        "content", [["a", "list"], {"fingerprint": None}, {"sources": 1}]
+    )
+    def test_foreign_entry_is_ignored(self, cache_dir, cfg_file, content):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), "wb") as f:
+                pickle.dump(content, f)
+        dcc = ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert "local" in dcc.list_compute_packages()
+
+    def test_cache_dir_made_private(self, cache_dir, cfg_file):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+    def test_shared_cache_dir_is_refused(self, cache_dir, cfg_file, monkeypatch):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        os.chmod(cache_dir, 0o777)
+        calls = _count_validations(monkeypatch)
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert calls
+        ConfigCache().clear()
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        assert os.listdir(cache_dir) == []
+
+    def test_clear(self, cache_dir, cfg_file):
+        ComputingConfiguration(filepath=cfg_file, use_cache=True)
+        ConfigCache().clear()
+        assert os.listdir(cache_dir) == []
+
+    def test_many_packages(self, cache_dir, tmpdir):
+        cfg = tmpdir.join("many.yaml")
+        cfg.write(
+            "compute_packages:\n"
+            + "".join(
+                "  p{}:\n    submission_template: t.sub\n".format(i)
+                for i in range(2000)
+            )
+        )
+        ComputingConfiguration(filepath=cfg.strpath, use_cache=True)
+        dcc = ComputingConfiguration(filepath=cfg.strpath, use_cache=True)
+        assert len(dcc.list_compute_packages()) == 2000
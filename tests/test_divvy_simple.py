@@ -1,6 +1,8 @@
 import divvy
 import os
 import pytest
+import subprocess
+import sys
 from collections import OrderedDict
 
 from yacman import YacAttMap
@@ -10,6 +12,11 @@ from yacman import YacAttMap
 # logmuse.init_logger("divvy", "DEBUG")
 
 
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
 class TestPackageaAtivation:
     def test_activate_package(self):
         dcc = divvy.ComputingConfiguration()
@@ -22,6 +29,79 @@ class TestPackageaAtivation:
         t2 = dcc["compute"]["submission_template"]
         assert t == t2
 
+    def test_previous_package_doesnt_leak(self):
+        dcc = divvy.ComputingConfiguration()
+        dcc.activate_package("singularity_slurm")
+        assert "singularity_args" in dcc.compute
+        dcc.activate_package("local")
+        assert "singularity_args" not in dcc.compute
+
+    def test_activation_reuses_resolved_package(self):
+        dcc = divvy.ComputingConfiguration()
+        dcc.activate_package("slurm")
+        slurm, plan = dcc.compute, dcc.get_adapter_plan()
+        dcc.activate_package("local")
+        dcc.activate_package("slurm")
+        assert dcc.compute == slurm
+        assert dcc.get_adapter_plan() is plan
+        assert os.path.isabs(slurm.submission_template)
+
+    def test_active_settings_changes_dont_reach_package(self, make_dcc):
+        dcc = make_dcc(
+            {
+                "slurm": {
+                    "submission_template": "t.sub",
+                    "submission_command": "sbatch",
+                    "partition": "standard",
+                }
+            },
+            {"t.sub": "#SBATCH -p {PARTITION}\n"},
+        )
+        dcc.activate_package("slurm")
+        dcc.compute["partition"] = "X"
+        assert dcc.render("slurm") == "#SBATCH -p standard\n"
+        dcc.activate_package("slurm")
+        assert dcc.compute.partition == "standard"
+
+    def test_replaced_packages_are_resolved_again(self):
+        dcc = divvy.ComputingConfiguration()
+        dcc.activate_package("slurm")
+        template = dcc.compute.submission_template
+        dcc.compute_packages = {
+            "slurm": {"submission_template": template, "submission_command": "x"}
+        }
+        dcc.activate_package("slurm")
+        assert dcc.compute.submission_command == "x"
+        assert not dcc.activate_package("local")
+
+    def test_packages_changed_in_place_are_resolved_again(self):
+        dcc = divvy.ComputingConfiguration()
+        dcc.activate_package("slurm")
+        plan = dcc.get_adapter_plan()
+        dcc.compute_packages["slurm"]["submission_command"] = "x"
+        dcc.compute_packages["extra"] = {"submission_template": "/tmp/extra.sub"}
+        dcc.activate_package("slurm")
+        assert dcc.compute.submission_command == "x"
+        assert dcc.activate_package("extra")
+        assert dcc.render("slurm").startswith("#!/bin/bash")
+        dcc.adapters["CODE"] = "looper.other_command"
+        dcc.activate_package("slurm")
+        assert dcc.get_adapter_plan() is not plan
+
+    def test_update_packages_resolves_again(self, tmpdir):
+        dcc = divvy.ComputingConfiguration()
+        cfg = tmpdir.join("extra.yaml")
+        cfg.write(
+            "compute_packages:\n"
+            "  extra:\n"
+            "    submission_template: /tmp/extra.sub\n"
+            "    submission_command: sh\n"
+        )
+        dcc.activate_package("default")
+        dcc.update_packages(cfg.strpath)
+        assert dcc.activate_package("extra")
+        assert dcc.compute.submission_template == "/tmp/extra.sub"
+
 
 class TestWriting:
     def test_write_script(self):
@@ -41,6 +121,74 @@ class TestWriting:
         os.remove("test.sub")
 
 
+class TestBatchWriting:
+    def test_write_scripts_matches_write_script(self, tmpdir):
+        dcc = divvy.ComputingConfiguration()
+        dcc.activate_package("slurm")
+        jobs = [
+            (
+                tmpdir.join("batch{}.sub".format(i)).strpath,
+                [{"looper": {"job_name": "j{}".format(i)}}, {"mem": i}],
+            )
+            for i in range(5)
+        ]
+        paths = dcc.write_scripts(jobs)
+        assert paths == [p for p, _ in jobs]
+        for path, extra_vars in jobs:
+            single = dcc.write_script(path + ".single", extra_vars)
+            with open(path) as batch_file, open(single) as single_file:
+                assert batch_file.read() == single_file.read()
+
+    def test_write_scripts_lazy(self, tmpdir):
+        dcc = divvy.ComputingConfiguration()
+        paths = dcc.write_scripts(
+            ((tmpdir.join("{}.sub".format(i)).strpath, {"code": i}) for i in range(3)),
+            lazy=True,
+        )
+        assert not tmpdir.listdir()
+        assert len(list(paths)) == 3
+        assert len(tmpdir.listdir()) == 3
+
+    @pytest.mark.parametrize("backend", ["thread", "process"])
+    def test_write_scripts_parallel_matches_serial(self, tmpdir, backend):
+        dcc = divvy.ComputingConfiguration()
+        dcc.activate_package("slurm")
+        jobs = [
+            (tmpdir.join("{}.sub".format(i)).strpath, {"looper": {"command": i}})
+            for i in range(20)
+        ]
+        serial = [_read(p) for p in dcc.write_scripts(jobs)]
+        paths = dcc.write_scripts(jobs, workers=3, backend=backend)
+        assert paths == [p for p, _ in jobs]
+        assert [_read(p) for p in paths] == serial
+
+    def test_cli_jobs_needs_stream(self, tmpdir):
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "divvy", "write", "-j", "2"]
+            + ["-o", tmpdir.join("x.sub").strpath],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        _, err = proc.communicate()
+        assert proc.returncode == 2
+        assert "--jobs only applies to writing with --stream" in err
+        assert not tmpdir.join("x.sub").check()
+
+    def test_write_scripts_parallel_collects_errors(self, tmpdir):
+        dcc = divvy.ComputingConfiguration()
+        blocker = tmpdir.join("file")
+        blocker.write("")
+        jobs = [(tmpdir.join("ok{}.sub".format(i)).strpath, {}) for i in range(3)] + [
+            (blocker.join("bad.sub").strpath, {})
+        ]
+        with pytest.raises(divvy.ScriptWriteError) as e:
+            dcc.write_scripts(jobs, workers=2)
+        assert e.value.total == 4
+        assert [p for p, _ in e.value.errors] == [jobs[-1][0]]
+        assert all(os.path.exists(p) for p, _ in jobs[:3])
+
+
 class TestAdapters:
     @pytest.mark.parametrize(
         "compute",
@@ -62,6 +210,27 @@ class TestAdapters:
             assert contents.find("1000") > 0
         os.remove("test.sub")
 
+    def test_adapter_plan_cached_until_activation(self):
+        dcc = divvy.ComputingConfiguration()
+        plan = dcc.get_adapter_plan()
+        assert dcc.get_adapter_plan() is plan
+        dcc.activate_package("slurm")
+        assert dcc.get_adapter_plan() is not plan
+
+    def test_adapter_plan_tracks_replaced_adapters(self):
+        dcc = divvy.ComputingConfiguration()
+        dcc.get_adapter_plan()
+        dcc.adapters = {"CODE": "pipeline.cmd"}
+        assert dcc.get_adapter_plan().namespaces == ["pipeline"]
+
+    def test_adapter_plan_first_claiming_group_wins(self):
+        plan = divvy.AdapterPlan({"MEM": "compute.mem", "CODE": "looper.command"})
+        adapted, claimed = plan.resolve(
+            [{"compute": {"cores": 2}}, {"compute": {"mem": 1}}, {"mem": 5}]
+        )
+        assert adapted == [("MEM", 1)]
+        assert claimed == {"compute"}
+
     def test_adapters_overwitten_by_others(self):
         dcc = divvy.ComputingConfiguration()
         dcc.activate_package("singularity_slurm")
@@ -0,0 +1,68 @@
+""" Tests for lazy loading of divvy modules and dependencies """
+
+import os
+import subprocess
+import sys
+import pytest
+
+
+def _loaded_after(statement, modules):
+    """Which of the modules are imported after running the statement"""
+    code = "import sys; {}; print(' '.join(m for m in {!r} if m in sys.modules))"
+    out = subprocess.check_output(
+        [sys.executable, "-c", code.format(statement, modules)],
+        universal_newlines=True,
+    )
+    return out.split()
+
+
+EAGER_IMPORTS = pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="public names load eagerly before PEP 562"
+)
+
+
+@EAGER_IMPORTS
+def test_package_import_is_light():
+    assert _loaded_after("import divvy", ["yacman", "logmuse", "yaml"]) == []
+
+
+@EAGER_IMPORTS
+def test_cli_module_skips_unused_dependencies():
+    heavy = ["asyncio", "concurrent.futures", "distutils"]
+    assert _loaded_after("import divvy.compute", heavy) == []
+
+
+@pytest.mark.parametrize("name", ["ComputingConfiguration", "SubmissionTemplate"])
+def test_public_names_load_on_access(name):
+    import divvy
+
+    assert name in dir(divvy)
+    assert getattr(divvy, name).__name__ == name
+
+
+def test_unknown_name():
+    import divvy
+
+    with pytest.raises(AttributeError):
+        divvy.NotAThing
+
+
+def test_cli_logs_through_divvy_logger(make_dcc, tmpdir):
+    """Modules' log records reach the terminal, e.g. the submission command"""
+    dcc = make_dcc(
+        {"default": {"submission_template": "t.sub", "submission_command": "."}},
+        {"t.sub": "#!/bin/bash\n{CODE}\n"},
+    )
+    script = tmpdir.join("job.sub").strpath
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "divvy", "submit", dcc.config_file]
+        + ["-o", script, "-c", "code=true"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=dict(os.environ, DIVVY_LEDGER="", DIVVY_SOCKET=""),
+    )
+    _, err = proc.communicate()
+    assert proc.returncode == 0
+    # the format of the rest of the line depends on the logmuse version
+    assert any(line.endswith("sh " + script) for line in err.splitlines())
@@ -0,0 +1,69 @@
+""" Tests for streaming job variables input """
+
+import io
+import itertools
+import pytest
+
+from divvy import ComputingConfiguration, iter_variable_groups
+
+ROWS = [{"jobname": "a", "code": "ls"}, {"jobname": "b", "code": "pwd"}]
+
+
+@pytest.mark.parametrize(
+    ["filename", "content"],
+    [
+        (
+            "rows.jsonl",
+            '{"jobname": "a", "code": "ls"}\n\n{"jobname": "b", "code": "pwd"}\n',
+        ),
+        ("rows.csv", "jobname,code\na,ls\nb,pwd\n"),
+        ("rows.tsv", "jobname\tcode\na\tls\nb\tpwd\n"),
+        ("rows.yaml", "jobname: a\ncode: ls\n---\njobname: b\ncode: pwd\n"),
+    ],
+)
+def test_formats(tmpdir, filename, content):
+    path = tmpdir.join(filename)
+    path.write(content)
+    assert [dict(g) for g in iter_variable_groups(path.strpath)] == ROWS
+
+
+@pytest.mark.parametrize("filename", ["rows.csv", "rows.tsv"])
+def test_quoted_line_breaks_kept(tmpdir, filename):
+    sep = "\t" if filename.endswith(".tsv") else ","
+    path = tmpdir.join(filename)
+    with open(path.strpath, "w", newline="") as f:
+        f.write('jobname{0}code\r\na{0}"echo 1\r\necho 2"\r\n'.format(sep))
+    (group,) = iter_variable_groups(path.strpath)
+    assert dict(group) == {"jobname": "a", "code": "echo 1\r\necho 2"}
+
+
+def test_unknown_extension():
+    with pytest.raises(ValueError):
+        list(iter_variable_groups("rows.xlsx"))
+
+
+def test_standard_input_defaults_to_jsonl(monkeypatch):
+    monkeypatch.setattr("sys.stdin", io.StringIO('{"jobname": "a", "code": "ls"}\n'))
+    assert [dict(g) for g in iter_variable_groups("-")] == ROWS[:1]
+
+
+def test_stream_scripts_path_pattern(tmpdir):
+    dcc = ComputingConfiguration()
+    dcc.activate_package("slurm")
+    pattern = tmpdir.join("{JOBNAME}", "{JOBNAME}.sub").strpath
+    paths = list(dcc.stream_scripts(ROWS, pattern, {"mem": "1G"}))
+    assert paths == [
+        tmpdir.join(r["jobname"], r["jobname"] + ".sub").strpath for r in ROWS
+    ]
+    with open(paths[1]) as f:
+        content = f.read()
+    assert "#SBATCH --mem='1G'" in content
+    assert content.endswith("pwd\n")
+
+
+def test_stream_scripts_consumes_lazily(tmpdir):
+    dcc = ComputingConfiguration()
+    rows = ({"jobname": str(i)} for i in itertools.count())
+    scripts = dcc.stream_scripts(rows, tmpdir.join("{JOBNAME}.sub").strpath)
+    assert list(itertools.islice(scripts, 5))[-1] == tmpdir.join("4.sub").strpath
+    assert len(tmpdir.listdir()) == 5
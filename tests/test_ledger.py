@@ -0,0 +1,246 @@
+""" Tests for the job ledger """
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from divvy import JobLedger, parse_job_id
+from divvy.ledger import default_ledger_path, format_jobs, parse_since
+from divvy.submission import SubmissionResult, scheduler_name
+
+
+@pytest.fixture
+def dcc(make_dcc, fake_sbatch):
+    dcc = make_dcc(
+        {
+            "default": {"submission_template": "t.sub", "submission_command": "sh"},
+            "cluster": {
+                "submission_template": "t.sub",
+                "submission_command": fake_sbatch,
+            },
+        },
+        {"t.sub": "#!/bin/bash\n{CODE}\n"},
+    )
+    dcc.activate_package("cluster")
+    return dcc
+
+
+def _result(script, job_id, returncode=0, started=1000.0):
+    return SubmissionResult(
+        script, ["sbatch", script], returncode, "", "", job_id, 0.5, started
+    )
+
+
+@pytest.mark.parametrize(
+    ["output", "scheduler", "job_id"],
+    [
+        ("Submitted batch job 4242\n", "slurm", "4242"),
+        ("4242\n", "slurm", "4242"),
+        ("4242;cluster2\n", "slurm", "4242"),
+        ('Your job 17 ("test") has been submitted\n', "sge", "17"),
+        ("17.1-10:1\n", "sge", "17"),
+        ("Job <99> is submitted to default queue <normal>.\n", "lsf", "99"),
+        ("Submitted batch job 4242\n", "local", None),
+        ("4242\n", None, None),
+    ],
+)
+def test_parse_job_id_per_scheduler(output, scheduler, job_id):
+    assert parse_job_id(output, scheduler) == job_id
+
+
+@pytest.mark.parametrize(
+    ["command", "scheduler"],
+    [
+        ("sbatch --parsable", "slurm"),
+        ("/opt/slurm/bin/sbatch", "slurm"),
+        ("qsub", "sge"),
+        ("bsub", "lsf"),
+        (".", "local"),
+        ("sh", "local"),
+    ],
+)
+def test_scheduler_name(command, scheduler):
+    assert scheduler_name(command) == scheduler
+
+
+def test_default_ledger_path(monkeypatch, tmpdir):
+    monkeypatch.delenv("DIVVY_LEDGER_PATH", raising=False)
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmpdir))
+    assert default_ledger_path() == os.path.join(str(tmpdir), "divvy", "ledger.sqlite")
+    monkeypatch.setenv("DIVVY_LEDGER_PATH", "/x/jobs.sqlite")
+    assert default_ledger_path() == "/x/jobs.sqlite"
+
+
+def test_record_and_query(tmpdir):
+    script = tmpdir.join("1.sub")
+    script.write("#!/bin/bash\nls\n")
+    path = tmpdir.join("sub", "ledger.sqlite").strpath
+    with JobLedger(path) as ledger:
+        results = [
+            _result(script.strpath, "1", started=1000.0),
+            _result(tmpdir.join("bad.sub").strpath, None, 1, started=2000.0),
+            # already submitted before, e.g. skipped by a journal
+            SubmissionResult(script.strpath, None, 0, "", "", "1", 0.0),
+        ]
+        variables = {script.strpath: [{"CODE": "ls"}]}
+        assert (
+            ledger.record(
+                results, package="cluster", scheduler="slurm", variables=variables
+            )
+            == 2
+        )
+    with JobLedger(path) as ledger:
+        records = ledger.jobs()
+        assert [r.job_id for r in records] == [None, "1"]
+        first = records[1]
+        assert first.submitted_at == 1000.0
+        assert first.finished_at == 1000.5
+        assert first.package == "cluster"
+        assert first.command == "sbatch " + script.strpath
+        assert len(first.variables_hash) == 64
+        assert records[0].variables_hash is None
+        assert [r.job_id for r in ledger.jobs(failed=False)] == ["1"]
+        assert [r.returncode for r in ledger.jobs(failed=True)] == [1]
+        assert [r.job_id for r in ledger.jobs(job_id=1)] == ["1"]
+        assert len(ledger.jobs(script="bad")) == 1
+        assert len(ledger.jobs(since=1500.0)) == 1
+        assert len(ledger.jobs(limit=1)) == 1
+        assert ledger.jobs(package="other") == []
+
+
+def test_concurrent_recording(tmpdir):
+    with JobLedger(tmpdir.join("ledger.sqlite").strpath) as ledger:
+
+        def record(n):
+            ledger.record(
+                [_result("{}-{}.sub".format(n, i), str(i)) for i in range(50)]
+            )
+
+        threads = [threading.Thread(target=record, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(ledger.jobs()) == 200
+
+
+def test_submissions_recorded_with_package(dcc, tmpdir):
+    path = tmpdir.join("ledger.sqlite").strpath
+    with JobLedger(path) as ledger:
+        scripts = dcc.write_scripts(
+            [(tmpdir.join(n).strpath, {"code": "ls"}) for n in ["3.sub", "bad4.sub"]]
+        )
+        results = dcc.submit_scripts(scripts, ledger=ledger)
+        assert [r.job_id for r in results] == ["3", None]
+        records = sorted(ledger.jobs(), key=lambda r: r.script)
+        assert [r.package for r in records] == ["cluster", "cluster"]
+        assert [r.scheduler for r in records] == ["slurm", "slurm"]
+        assert [r.returncode for r in records] == [0, 1]
+        assert records[1].stderr.strip() == "sbatch: error: invalid partition"
+        assert records[0].config == dcc.config_file
+
+
+def test_variables_hash_from_resolved_variables(dcc, tmpdir):
+    path = tmpdir.join("ledger.sqlite").strpath
+    with JobLedger(path) as ledger:
+        for name, code in [("7.sub", "ls"), ("8.sub", "ls"), ("9.sub", "pwd")]:
+            script = tmpdir.join(name)
+            dcc.submit(script.strpath, {"code": code}, ledger=ledger)
+            # the script isn't read again for its hash
+            script.write("edited")
+        dcc.submit_packed(
+            tmpdir.join("1{PACK}.sub").strpath, [{"code": "ls"}], ledger=ledger
+        )
+        records = sorted(ledger.jobs(), key=lambda r: r.script)
+    hashes = [r.variables_hash for r in records]
+    assert [r.job_id for r in records] == ["11", "7", "8", "9"]
+    assert hashes[1] == hashes[2] != hashes[3]
+    assert hashes[0] not in hashes[1:]
+    assert all(len(h) == 64 for h in hashes)
+
+
+def test_submitted_at_per_submission(dcc, tmpdir):
+    with JobLedger(tmpdir.join("ledger.sqlite").strpath) as ledger:
+        scripts = dcc.write_scripts(
+            [(tmpdir.join(n).strpath, {"code": "ls"}) for n in ["1.sub", "2.sub"]]
+        )
+        results = dcc.submit_scripts(scripts, max_in_flight=1, ledger=ledger)
+        records = sorted(ledger.jobs(), key=lambda r: r.script)
+    assert [r.submitted_at for r in records] == [r.started for r in results]
+    assert records[0].finished_at <= records[1].submitted_at
+
+
+def test_ledger_from_environment(dcc, tmpdir, monkeypatch):
+    path = tmpdir.join("env.sqlite").strpath
+    monkeypatch.setenv("DIVVY_LEDGER_PATH", path)
+    script = dcc.write_script(tmpdir.join("5.sub").strpath, {"code": "ls"})
+    dcc.submit_scripts([script])
+    assert not os.path.exists(path)
+    monkeypatch.setenv("DIVVY_LEDGER", "1")
+    dcc.submit(tmpdir.join("6.sub").strpath, {"code": "ls"})
+    with JobLedger(path) as ledger:
+        assert [r.job_id for r in ledger.jobs()] == ["6"]
+
+
+def test_parse_since():
+    assert parse_since("90m", now=10000.0) == 10000.0 - 5400
+    assert parse_since("2d", now=10**6) == 10**6 - 2 * 86400
+    assert parse_since("2024-05-01") < parse_since("2024-05-01T12:00")
+    with pytest.raises(ValueError):
+        parse_since("yesterday")
+
+
+def test_format_jobs(tmpdir):
+    with JobLedger(tmpdir.join("ledger.sqlite").strpath) as ledger:
+        ledger.record([_result("a/1.sub", "1")], package="cluster")
+        records = ledger.jobs()
+    table = format_jobs(records).splitlines()
+    assert table[0].split() == [
+        "submitted",
+        "package",
+        "scheduler",
+        "job_id",
+        "exit",
+        "script",
+    ]
+    assert table[1].split()[2:] == [
+        "cluster",
+        "-",
+        "1",
+        "0",
+        os.path.abspath("a/1.sub"),
+    ]
+    assert format_jobs(records, "tsv").splitlines()[1].split("\t")[3] == "1"
+    assert json.loads(format_jobs(records, "json"))[0]["job_id"] == "1"
+    with pytest.raises(ValueError):
+        format_jobs(records, "xml")
+
+
+def test_cli(dcc, tmpdir):
+    path = tmpdir.join("ledger.sqlite").strpath
+    env = dict(os.environ, DIVVY_LEDGER="", DIVVY_SOCKET="")
+    for name in ["7.sub", "bad8.sub"]:
+        subprocess.run(
+            [sys.executable, "-m", "divvy", "submit", dcc.config_file, "-p", "cluster"]
+            + ["-o", tmpdir.join(name).strpath, "-c", "code=ls", "--ledger", path],
+            env=env,
+            check=False,
+        )
+    out = subprocess.check_output(
+        [sys.executable, "-m", "divvy", "jobs", "--ledger", path, "--format", "json"],
+        env=env,
+        universal_newlines=True,
+    )
+    records = json.loads(out)
+    assert sorted(r["returncode"] for r in records) == [0, 1]
+    out = subprocess.check_output(
+        [sys.executable, "-m", "divvy", "jobs", "--ledger", path, "--failed"],
+        env=env,
+        universal_newlines=True,
+    )
+    assert len(out.splitlines()) == 2
+    assert "bad8.sub" in out
@@ -0,0 +1,193 @@
+""" Tests for template placeholder checks """
+
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from divvy import (
+    MissingVariablesError,
+    SubmissionTemplate,
+    write_submit_script,
+)
+from divvy.lint import format_lint
+
+
+@pytest.mark.parametrize(
+    ["content", "placeholders"],
+    [
+        ("#SBATCH --mem={MEM}\n{CODE}\n{MEM}", ("MEM", "CODE")),
+        ("echo ${HOME} {JOB_NAME2}", ("JOB_NAME2",)),
+        ("awk '{print $1}' {lower} {} { CODE }", ()),
+        ("{\n  {CODE}\n} | tee {LOGFILE}", ("CODE", "LOGFILE")),
+    ],
+)
+def test_placeholders(content, placeholders):
+    assert SubmissionTemplate(content).placeholders == placeholders
+
+
+def test_missing():
+    template = SubmissionTemplate("{CODE} {MEM} {TIME}")
+    assert template.missing({"code": "ls", "Time": 1}) == ["MEM"]
+    assert template.missing({"code": 1, "mem": 2, "time": 3}) == []
+    assert SubmissionTemplate("plain").missing({}) == []
+
+
+@pytest.fixture
+def warned(monkeypatch):
+    """Forget the unfilled placeholders warned about by earlier tests"""
+    monkeypatch.setattr("divvy.utils._WARNED_UNFILLED", set())
+
+
+def test_unfilled_placeholders_are_reported(tmpdir, divvy_caplog, warned):
+    with divvy_caplog.at_level(logging.WARNING, logger="divvy"):
+        write_submit_script(
+            tmpdir.join("a.sub").strpath,
+            "#SBATCH --mem={MEM}\n#SBATCH -p {PARTITION}\necho ${HOME}\n{CODE}\n",
+            {"code": "ls"},
+        )
+    assert "2 submission template variables are not populated" in divvy_caplog.text
+    assert "PARTITION" in divvy_caplog.text and "HOME" not in divvy_caplog.text
+
+
+def test_unfilled_placeholders_reported_once_per_template(tmpdir, divvy_caplog, warned):
+    template = SubmissionTemplate("#SBATCH -p {PARTITION}\n{CODE}\n")
+    with divvy_caplog.at_level(logging.WARNING, logger="divvy"):
+        for i in range(3):
+            write_submit_script(tmpdir.join("{}.sub".format(i)).strpath, template, {})
+        write_submit_script(tmpdir.join("3.sub").strpath, template, {"code": "ls"})
+        write_submit_script(tmpdir.join("4.sub").strpath, "{CODE}", {})
+    assert [r.getMessage().split(":")[-1] for r in divvy_caplog.records] == [
+        " '['PARTITION', 'CODE']'",
+        " '['PARTITION']'",
+        " '['CODE']'",
+    ]
+
+
+@pytest.fixture
+def dcc(make_dcc):
+    return make_dcc(
+        {
+            "default": {"submission_template": "local.sub", "submission_command": "sh"},
+            "slurm": {
+                "submission_template": "slurm.sub",
+                "submission_command": "sbatch",
+                "mem": "4G",
+            },
+            "broken": {
+                "submission_template": "nowhere.sub",
+                "submission_command": "sh",
+            },
+        },
+        {
+            "slurm.sub": "#!/bin/bash\n#SBATCH --mem={MEM}\n#SBATCH -p {PARTITION}\n"
+            "{CODE}\n",
+            "local.sub": "#!/bin/bash\n{CODE}\n",
+        },
+        adapters={"CODE": "looper.command"},
+    )
+
+
+def test_check_packages(dcc):
+    reports = {r.package: r for r in dcc.check_packages()}
+    assert sorted(reports) == ["broken", "default", "slurm"]
+    assert reports["default"].ok
+    assert reports["default"].adapted == ["CODE"]
+    assert reports["slurm"].unfilled == ["PARTITION"]
+    assert not reports["slurm"].ok
+    assert "can't read template" in reports["broken"].error
+    text = format_lint(reports.values())
+    assert "slurm: UNFILLED PARTITION" in text
+    assert "broken: ERROR" in text
+
+
+def test_lowercase_adapter_names(make_dcc):
+    dcc = make_dcc(
+        {"default": {"submission_template": "t.sub", "submission_command": "sh"}},
+        {"t.sub": "#!/bin/bash\n{CODE}\n"},
+        adapters={"code": "looper.command"},
+    )
+    (report,) = dcc.check_packages()
+    assert report.ok
+    assert report.adapted == ["CODE"]
+    assert "ls" in dcc.render("default", {"looper": {"command": "ls"}})
+
+
+def test_check_packages_with_given_variables(dcc):
+    (report,) = dcc.check_packages(["slurm"], {"partition": "short"})
+    assert report.ok
+    (report,) = dcc.check_packages(["nope"])
+    assert report.error == "no such compute package"
+
+
+def test_write_scripts_check_fails_before_writing(dcc, tmpdir):
+    dcc.activate_package("slurm")
+    jobs = [
+        (tmpdir.join("{}.sub".format(i)).strpath, {"code": "ls", "partition": "p"})
+        for i in range(3)
+    ]
+    jobs[1] = (jobs[1][0], {"code": "ls"})
+    jobs.append((tmpdir.join("3.sub").strpath, {}))
+    with pytest.raises(MissingVariablesError) as e:
+        dcc.write_scripts(jobs, check=True)
+    assert e.value.total == 4
+    assert e.value.missing == [
+        (jobs[1][0], ["PARTITION"]),
+        (jobs[3][0], ["PARTITION", "CODE"]),
+    ]
+    assert not any(os.path.exists(path) for path, _ in jobs)
+    del jobs[3], jobs[1]
+    assert dcc.write_scripts(jobs, check=True) == [path for path, _ in jobs]
+
+
+def test_stream_path_pattern_in_report(dcc, tmpdir):
+    jobs = [(SubmissionTemplate(tmpdir.join("{NAME}.sub").strpath), {"name": "x"})]
+    with pytest.raises(MissingVariablesError) as e:
+        dcc.write_scripts(jobs, check=True)
+    assert e.value.missing == [(tmpdir.join("x.sub").strpath, ["CODE"])]
+
+
+def test_stream_scripts_check_stops_at_unfilled_job(dcc, tmpdir):
+    dcc.activate_package("slurm")
+    rows = [{"name": "a", "partition": "p"}, {"name": "b"}, {"name": "c"}]
+    pattern = tmpdir.join("{NAME}.sub").strpath
+    scripts = dcc.stream_scripts(rows, pattern, {"code": "ls"}, check=True)
+    with pytest.raises(MissingVariablesError) as e:
+        list(scripts)
+    assert e.value.missing == [(tmpdir.join("b.sub").strpath, ["PARTITION"])]
+    assert e.value.total == 2
+    assert tmpdir.join("a.sub").exists() and not tmpdir.join("b.sub").exists()
+
+
+def test_cli_stream_check(dcc, tmpdir):
+    stream = tmpdir.join("jobs.jsonl")
+    stream.write('{"name": "a", "code": "ls"}\n')
+    proc = subprocess.run(
+        [sys.executable, "-m", "divvy", "write", dcc.config_file, "-p", "slurm"]
+        + ["-o", tmpdir.join("{NAME}.sub").strpath]
+        + ["--stream", stream.strpath, "--check"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert proc.returncode == 1
+    assert "unfilled PARTITION" in proc.stderr
+    assert "Traceback" not in proc.stderr
+    assert not tmpdir.join("a.sub").exists()
+
+
+def test_cli(dcc):
+    def check(*args):
+        return subprocess.run(
+            [sys.executable, "-m", "divvy", "check", dcc.config_file] + list(args),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+
+    proc = check()
+    assert proc.returncode == 1
+    assert "slurm: UNFILLED PARTITION" in proc.stdout
+    proc = check("-p", "slurm", "default", "-c", "partition=short")
+    assert proc.returncode == 0
+    assert "broken" not in proc.stdout
@@ -0,0 +1,130 @@
+""" Tests for incremental writing of submission scripts """
+
+import os
+
+import pytest
+
+from divvy import RenderManifest
+from divvy.const import MANIFEST_FILENAME
+
+
+@pytest.fixture
+def dcc(make_dcc):
+    return make_dcc(
+        {
+            "default": {
+                "submission_template": "t.sub",
+                "submission_command": "sh",
+                "mem": "1G",
+            }
+        },
+        {"t.sub": "#!/bin/bash\n#SBATCH --mem={MEM}\n{CODE}\n"},
+    )
+
+
+def _jobs(folder, n=5, **extra):
+    return [
+        (
+            folder.join("{}.sub".format(i)).strpath,
+            dict({"code": "run {}".format(i)}, **extra),
+        )
+        for i in range(n)
+    ]
+
+
+def _mtimes(jobs):
+    return [os.stat(path).st_mtime_ns for path, _ in jobs]
+
+
+def _age(jobs):
+    """Backdate the scripts, so that rewriting them is noticed"""
+    for path, _ in jobs:
+        os.utime(path, ns=(0, 10**9))
+
+
+def test_unchanged_scripts_are_skipped(dcc, tmpdir):
+    out = tmpdir.mkdir("out")
+    jobs = _jobs(out)
+    first = RenderManifest()
+    assert dcc.write_scripts(jobs, incremental=first) == [p for p, _ in jobs]
+    assert (first.written, first.skipped) == (5, 0)
+    assert out.join(MANIFEST_FILENAME).check()
+    _age(jobs)
+    # the manifest hasn't seen the backdating, so record it
+    dcc.write_scripts(jobs, incremental=True)
+    before = _mtimes(jobs)
+    second = RenderManifest()
+    assert dcc.write_scripts(jobs, incremental=second) == [p for p, _ in jobs]
+    assert (second.written, second.skipped) == (0, 5)
+    assert _mtimes(jobs) == before
+
+
+def test_changed_variables_are_rewritten(dcc, tmpdir):
+    jobs = _jobs(tmpdir)
+    dcc.write_scripts(jobs, incremental=True)
+    jobs[2][1]["code"] = "changed"
+    manifest = RenderManifest()
+    dcc.write_scripts(jobs, incremental=manifest)
+    assert (manifest.written, manifest.skipped) == (1, 4)
+    with open(jobs[2][0]) as f:
+        assert "changed" in f.read()
+
+
+def test_changed_package_values_are_rewritten(dcc, tmpdir):
+    jobs = _jobs(tmpdir)
+    dcc.write_scripts(jobs, incremental=True)
+    manifest = RenderManifest()
+    dcc.write_scripts(_jobs(tmpdir, mem="2G"), incremental=manifest)
+    assert manifest.written == 5
+
+
+def test_changed_template_is_rewritten(dcc, tmpdir):
+    jobs = _jobs(tmpdir)
+    dcc.write_scripts(jobs, incremental=True)
+    with open(dcc.compute.submission_template, "a") as f:
+        f.write("# new line\n")
+    manifest = RenderManifest()
+    dcc.write_scripts(jobs, incremental=manifest)
+    assert manifest.written == 5
+
+
+def test_edited_or_removed_scripts_are_rewritten(dcc, tmpdir):
+    jobs = _jobs(tmpdir)
+    dcc.write_scripts(jobs, incremental=True)
+    with open(jobs[0][0], "a") as f:
+        f.write("echo tampered\n")
+    os.remove(jobs[1][0])
+    manifest = RenderManifest()
+    dcc.write_scripts(jobs, incremental=manifest)
+    assert (manifest.written, manifest.skipped) == (2, 3)
+    with open(jobs[0][0]) as f:
+        assert "tampered" not in f.read()
+
+
+def test_corrupt_manifest_is_ignored(dcc, tmpdir):
+    jobs = _jobs(tmpdir)
+    tmpdir.join(MANIFEST_FILENAME).write("{not json")
+    manifest = RenderManifest()
+    dcc.write_scripts(jobs, incremental=manifest)
+    assert manifest.written == 5
+
+
+def test_write_script_incremental(dcc, tmpdir):
+    path = tmpdir.join("one.sub").strpath
+    assert dcc.write_script(path, {"code": "ls"}, incremental=True) == path
+    manifest = RenderManifest()
+    dcc.write_script(path, {"code": "ls"}, incremental=manifest)
+    assert manifest.skipped == 1
+
+
+def test_thread_workers(dcc, tmpdir):
+    jobs = _jobs(tmpdir, n=40)
+    dcc.write_scripts(jobs, incremental=True, workers=4)
+    manifest = RenderManifest()
+    dcc.write_scripts(jobs, incremental=manifest, workers=4)
+    assert manifest.skipped == 40
+
+
+def test_process_workers_refused(dcc, tmpdir):
+    with pytest.raises(ValueError):
+        dcc.write_scripts(_jobs(tmpdir), incremental=True, workers=2, backend="process")
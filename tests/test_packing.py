@@ -0,0 +1,197 @@
+""" Tests for packing small jobs into larger allocations """
+
+import subprocess
+
+import pytest
+
+from divvy import ComputingConfiguration
+from divvy.packing import Resources, pack_jobs, parse_mem, parse_time
+
+UNLIMITED = Resources(None, None, None)
+
+
+@pytest.mark.parametrize(
+    ["text", "expected"],
+    [
+        ("2000", 2000),
+        ("4G", 4096),
+        ("500M", 500),
+        ("1.5g", 1536),
+        ("1024K", 1),
+        ("2GB", 2048),
+        (8000, 8000),
+    ],
+)
+def test_parse_mem(text, expected):
+    assert parse_mem(text) == expected
+
+
+@pytest.mark.parametrize(
+    ["text", "expected"],
+    [
+        ("30", 1800),
+        ("10:30", 630),
+        ("02:00:00", 7200),
+        ("1-12", 129600),
+        ("1-00:30", 88200),
+        ("2-01:00:05", 176405),
+    ],
+)
+def test_parse_time(text, expected):
+    assert parse_time(text) == expected
+
+
+@pytest.mark.parametrize("text", ["lots", "4X", "1:2:3:4", ""])
+def test_unreadable_resources(text):
+    with pytest.raises(ValueError):
+        parse_mem(text)
+    with pytest.raises(ValueError):
+        parse_time(text)
+
+
+def test_packing_respects_limits():
+    demands = [
+        Resources(1 + i % 3, 1000 * (1 + i % 2), 60 * (i % 7)) for i in range(200)
+    ]
+    limits = Resources(16, 8000, 600)
+    bins = pack_jobs(demands, limits)
+    assert sorted(i for b in bins for i in b) == list(range(200))
+    for b in bins:
+        assert sum(demands[i].cores for i in b) <= 16
+        assert sum(demands[i].mem for i in b) <= 8000
+
+
+def test_uniform_jobs_fill_allocations():
+    bins = pack_jobs([Resources(1, 0, 300)] * 100, Resources(16, None, None))
+    assert [len(b) for b in bins] == [16] * 6 + [4]
+
+
+def test_jobs_of_similar_length_are_packed_together():
+    demands = [Resources(1, 0, 60 if i % 2 else 3600) for i in range(8)]
+    bins = pack_jobs(demands, Resources(4, None, None))
+    assert {frozenset(b) for b in bins} == {
+        frozenset([0, 2, 4, 6]),
+        frozenset([1, 3, 5, 7]),
+    }
+
+
+def test_unlimited_packing_makes_one_allocation():
+    assert pack_jobs([Resources(1, 100, 60)] * 5, UNLIMITED) == [[0, 1, 2, 3, 4]]
+
+
+def test_job_larger_than_an_allocation():
+    with pytest.raises(ValueError):
+        pack_jobs([Resources(1, 0, 0), Resources(32, 0, 0)], Resources(16, None, None))
+    with pytest.raises(ValueError):
+        pack_jobs([Resources(1, 0, 7200)], Resources(None, None, 3600))
+
+
+@pytest.fixture
+def slurm_dcc():
+    dcc = ComputingConfiguration()
+    dcc.activate_package("slurm")
+    return dcc
+
+
+def _jobs(n, **extra):
+    return [
+        dict(
+            {"code": "echo job{}".format(i), "cores": 1, "mem": "1G", "time": "10"},
+            **extra
+        )
+        for i in range(n)
+    ]
+
+
+def test_wrapper_scripts(tmpdir, slurm_dcc):
+    paths = slurm_dcc.write_packed_scripts(
+        tmpdir.join("pack_{PACK}.sub").strpath,
+        _jobs(9) + [{"code": "echo long", "cores": 2, "mem": "2G", "time": "01:00:00"}],
+        {"jobname": "small", "logfile": "pack.log"},
+        max_cores=4,
+    )
+    assert [p.rsplit("/", 1)[-1] for p in paths] == [
+        "pack_1.sub",
+        "pack_2.sub",
+        "pack_3.sub",
+    ]
+    with open(paths[0]) as f:
+        first = f.read()
+    assert "#SBATCH --job-name='small_pack1'" in first
+    assert "#SBATCH --cpus-per-task='4'" in first
+    assert "#SBATCH --mem='4096M'" in first
+    assert "#SBATCH --time='01:00:00'" in first
+    with open(paths[2]) as f:
+        last = f.read()
+    assert "#SBATCH --cpus-per-task='3'" in last
+    assert "#SBATCH --time='00:10:00'" in last
+
+
+def test_wrapper_runs_all_members(tmpdir, slurm_dcc):
+    jobs = _jobs(3) + [{"code": "sleep 0.1\necho 'quoted $HOME'", "cores": 1}]
+    jobs.append({"code": "echo to-log", "logfile": tmpdir.join("own.log").strpath})
+    (path,) = slurm_dcc.write_packed_scripts(tmpdir.join("p.sub").strpath, jobs)
+    out = subprocess.check_output(["bash", path], universal_newlines=True)
+    lines = out.splitlines()
+    for expected in ["job0", "job1", "job2", "quoted $HOME"]:
+        assert expected in lines
+    assert "to-log" not in lines
+    assert tmpdir.join("own.log").read() == "to-log\n"
+
+
+def test_wrapper_fails_if_a_member_fails(tmpdir, slurm_dcc):
+    jobs = [{"code": "true"}, {"code": "exit 3"}, {"code": "echo done"}]
+    (path,) = slurm_dcc.write_packed_scripts(tmpdir.join("p.sub").strpath, jobs)
+    proc = subprocess.run(
+        ["bash", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert proc.returncode != 0
+    assert "done" in proc.stdout
+    assert "Packed job 2 failed" in proc.stderr
+
+
+def test_limits_from_package(tmpdir, make_dcc):
+    dcc = make_dcc(
+        {
+            "default": {
+                "submission_template": "t.sub",
+                "submission_command": "sh",
+                "max_cores": "2",
+            }
+        },
+        {"t.sub": "#!/bin/bash\n# cores={CORES}\n{CODE}\n"},
+    )
+    paths = dcc.write_packed_scripts(tmpdir.join("{PACK}.sub").strpath, _jobs(5))
+    assert len(paths) == 3
+    assert (
+        len(
+            dcc.write_packed_scripts(
+                tmpdir.join("{PACK}.sub").strpath, _jobs(5), max_cores=8
+            )
+        )
+        == 1
+    )
+
+
+def test_job_without_code(tmpdir, slurm_dcc):
+    with pytest.raises(ValueError):
+        slurm_dcc.write_packed_scripts(
+            tmpdir.join("{PACK}.sub").strpath, [{"cores": 1}]
+        )
+
+
+def test_inline_code_slot_rejected(tmpdir):
+    dcc = ComputingConfiguration()
+    dcc.activate_package("docker")
+    with pytest.raises(ValueError):
+        dcc.write_packed_scripts(tmpdir.join("{PACK}.sub").strpath, _jobs(2))
+
+
+def test_path_pattern_must_vary(tmpdir, slurm_dcc):
+    with pytest.raises(ValueError):
+        slurm_dcc.write_packed_scripts(
+            tmpdir.join("same.sub").strpath, _jobs(4), max_cores=2
+        )
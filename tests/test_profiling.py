@@ -0,0 +1,97 @@
+""" Tests for the instrumentation of divvy operations """
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from divvy import ComputingConfiguration, profiling
+from divvy.const import PROFILE_FILE_VARNAME, PROFILE_VARNAME
+from tests.conftest import THIS_DIR
+
+
+@pytest.fixture
+def profile():
+    """Record a profile for the duration of a test"""
+    yield profiling.enable()
+    profiling.disable()
+
+
+def _cli(args, **env):
+    full_env = dict(os.environ, PYTHONPATH=os.path.dirname(THIS_DIR), **env)
+    return subprocess.run(
+        [sys.executable, "-m", "divvy"] + args,
+        env=full_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def test_off_by_default():
+    assert profiling.get_profile() is None
+    with profiling.phase("anything"):
+        profiling.count("anything")
+    assert profiling.get_profile() is None
+
+
+def test_write_scripts_profile(profile, tmpdir):
+    dcc = ComputingConfiguration()
+    dcc.activate_package("slurm")
+    jobs = [(tmpdir.join("{}.sub".format(i)).strpath, {"code": "ls"}) for i in range(5)]
+    dcc.write_scripts(jobs)
+    data = profile.to_dict()
+    assert data["phases"]["render"]["calls"] == 5
+    assert data["phases"]["write"]["calls"] == 5
+    assert data["phases"]["adapters.resolve"]["calls"] == 5
+    assert data["counters"]["scripts.written"] == 5
+    assert data["counters"]["bytes.written"] == sum(
+        os.path.getsize(path) for path, _ in jobs
+    )
+    assert data["counters"]["template_cache.misses"] == 1
+
+
+def test_threads_are_counted(profile, tmpdir):
+    dcc = ComputingConfiguration()
+    jobs = [(tmpdir.join("{}.sub".format(i)).strpath, {}) for i in range(40)]
+    dcc.write_scripts(jobs, workers=4)
+    assert profile.counters["scripts.written"] == 40
+
+
+def test_record_and_format(profile):
+    profiling.record("submit", 0.5)
+    profiling.record("submit", 1.5)
+    profiling.count("submissions", 2)
+    stats = profile.to_dict()["phases"]["submit"]
+    assert stats == {"calls": 2, "total": 2.0, "mean": 1.0, "max": 1.5}
+    table = profile.format("table")
+    assert table.splitlines()[0].split()[:2] == ["phase", "calls"]
+    assert "submissions" in table
+    assert json.loads(profile.format("json"))["counters"] == {"submissions": 2}
+
+
+def test_unknown_report_format():
+    with pytest.raises(ValueError):
+        profiling.enable(report="xml")
+    assert profiling.get_profile() is None
+
+
+def test_cli_profile_flag(tmpdir):
+    out = tmpdir.join("job.sub").strpath
+    result = _cli(["--profile", "write", "-o", out, "-c", "code=ls"])
+    assert result.returncode == 0
+    assert "config.load" in result.stderr
+    assert "scripts.written" in result.stderr
+
+
+def test_env_var_json_report(tmpdir):
+    report = tmpdir.join("profile.json").strpath
+    out = tmpdir.join("job.sub").strpath
+    env = {PROFILE_VARNAME: "json", PROFILE_FILE_VARNAME: report}
+    assert _cli(["write", "-o", out], **env).returncode == 0
+    with open(report) as f:
+        data = json.load(f)
+    assert data["phases"]["config.load"]["calls"] == 1
+    assert data["counters"]["scripts.written"] == 1
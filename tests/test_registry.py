@@ -0,0 +1,138 @@
+""" Tests for the registry of loaded configurations """
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from divvy import ConfigRegistry
+
+
+@pytest.fixture
+def configs(tmpdir):
+    """Paths to configurations of several labs, which share a template"""
+    tmpdir.join("shared.sub").write("#SBATCH -p {PARTITION}\n{CODE}\n")
+    paths = []
+    for i in range(5):
+        path = tmpdir.join("lab{}.yaml".format(i))
+        path.write(
+            "compute_packages:\n"
+            "  default:\n"
+            "    submission_template: shared.sub\n"
+            "    submission_command: sbatch\n"
+            "    partition: lab{}\n".format(i)
+        )
+        paths.append(path.strpath)
+    return paths
+
+
+def test_configs_load_on_demand(configs):
+    registry = ConfigRegistry()
+    assert len(registry) == 0
+    first = registry.get(configs[0])
+    assert configs[0] in registry and configs[1] not in registry
+    assert registry.get(configs[0]) is first
+    info = registry.info()
+    assert (info.hits, info.misses, info.configs) == (1, 1, 1)
+    assert info.size > 0
+
+
+def test_templates_are_shared(configs):
+    registry = ConfigRegistry()
+    a, b = registry.get(configs[0]), registry.get(configs[1])
+    assert a._compiled_template() is b._compiled_template()
+    assert registry.template_cache.info().misses == 1
+    assert a.compute.partition == "lab0" and b.compute.partition == "lab1"
+
+
+def test_changed_config_is_reloaded(configs, tmpdir):
+    registry = ConfigRegistry()
+    before = registry.get(configs[0])
+    with open(configs[0], "a") as f:
+        f.write("  other:\n    submission_template: shared.sub\n")
+    after = registry.get(configs[0])
+    assert after is not before
+    assert "other" in after.list_compute_packages()
+    assert registry.info().configs == 1
+
+
+def test_changed_base_is_reloaded(tmpdir):
+    base = tmpdir.join("base.yaml")
+    base.write("compute_packages:\n  default:\n    submission_template: t.sub\n")
+    cfg = tmpdir.join("lab.yaml")
+    cfg.write("extends: base.yaml\n")
+    registry = ConfigRegistry()
+    registry.get(cfg.strpath)
+    base.write("compute_packages:\n  default:\n    submission_template: other.sub\n")
+    dcc = registry.get(cfg.strpath)
+    assert dcc.compute.submission_template == tmpdir.join("other.sub")
+
+
+def test_least_recently_used_are_evicted(configs):
+    registry = ConfigRegistry(max_configs=2)
+    for i in (0, 1, 0, 2):
+        registry.get(configs[i])
+    assert configs[0] in registry and configs[2] in registry
+    assert configs[1] not in registry
+    assert registry.info().evictions == 1
+    registry.get(configs[1])
+    assert configs[0] not in registry
+
+
+def test_memory_cap(configs, divvy_caplog):
+    probe = ConfigRegistry()
+    probe.get(configs[0])
+    size = probe.info().size
+    registry = ConfigRegistry(max_size=int(size * 2.5))
+    for path in configs:
+        registry.get(path)
+    info = registry.info()
+    assert info.configs == 2 and info.size <= info.max_size
+    assert info.evictions == 3
+    tiny = ConfigRegistry(max_size=10)
+    with divvy_caplog.at_level(logging.WARNING, logger="divvy"):
+        assert tiny.get(configs[0]) is tiny.get(configs[0])
+    assert "more than the registry's limit" in divvy_caplog.text
+
+
+def test_discard_and_clear(configs):
+    registry = ConfigRegistry()
+    registry.get(configs[0])
+    registry.get(configs[1])
+    registry.discard(configs[0])
+    assert configs[0] not in registry
+    registry.clear()
+    assert len(registry) == 0 and registry.info().size == 0
+    assert len(registry.template_cache) == 0
+
+
+def test_concurrent_first_use_loads_once(configs):
+    registry = ConfigRegistry()
+    barrier = threading.Barrier(8)
+
+    def get(_):
+        barrier.wait()
+        return registry.get(configs[0])
+
+    with ThreadPoolExecutor(8) as pool:
+        loaded = list(pool.map(get, range(8)))
+    assert all(dcc is loaded[0] for dcc in loaded)
+    assert registry.info().misses == 1
+
+
+def test_concurrent_tenants(configs):
+    registry = ConfigRegistry(max_configs=3)
+
+    def render(i):
+        path = configs[i % len(configs)]
+        with registry.checkout(path) as dcc:
+            dcc.activate_package("default")
+            render = dcc._script_renderer()
+        return i, render.template.render(render.variables({"code": i}))
+
+    with ThreadPoolExecutor(8) as pool:
+        for i, content in pool.map(render, range(200)):
+            assert content == "#SBATCH -p lab{}\n{}\n".format(i % len(configs), i)
+    assert len(registry) <= 3
+    assert registry.template_cache.info().currsize == 1
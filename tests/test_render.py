@@ -0,0 +1,86 @@
+""" Tests for rendering without activating compute packages """
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def dcc(make_dcc):
+    return make_dcc(
+        {
+            "default": {"submission_template": "local.sub", "submission_command": "sh"},
+            "slurm": {
+                "submission_template": "slurm.sub",
+                "submission_command": "sbatch",
+                "mem": "4G",
+            },
+        },
+        {
+            "local.sub": "#!/bin/bash\n{CODE}\n",
+            "slurm.sub": "#!/bin/bash\n#SBATCH --mem={MEM}\n"
+            "#SBATCH --job-name={JOBNAME}\n{CODE}\n",
+        },
+        adapters={"JOBNAME": "sample.name"},
+    )
+
+
+def _expected(package, i):
+    if package == "default":
+        return "#!/bin/bash\nrun {}\n".format(i)
+    return "#!/bin/bash\n#SBATCH --mem=4G\n#SBATCH --job-name=s{0}\nrun {0}\n".format(i)
+
+
+def _variables(i):
+    return [{"sample": {"name": "s{}".format(i)}}, {"code": "run {}".format(i)}]
+
+
+def test_render_leaves_active_settings_alone(dcc):
+    assert dcc.get_active_package_name() == "default"
+    active = dcc.get_active_package()
+    assert dcc.render("slurm", _variables(1)) == _expected("slurm", 1)
+    assert dcc.get_active_package_name() == "default"
+    assert dcc.get_active_package() is active
+    assert dcc.compute.submission_command == "sh"
+    assert "mem" not in dcc.compute
+
+
+def test_render_matches_write_script(dcc, tmpdir):
+    dcc.activate_package("slurm")
+    path = dcc.write_script(tmpdir.join("s.sub").strpath, _variables(2))
+    with open(path) as f:
+        assert dcc.render("slurm", _variables(2)) == f.read()
+
+
+def test_render_unknown_package(dcc):
+    with pytest.raises(ValueError, match="nope"):
+        dcc.render("nope")
+    assert dcc.get_active_package_name() == "default"
+
+
+def test_concurrent_rendering(dcc):
+    jobs = [("slurm" if i % 2 else "default", i) for i in range(200)]
+
+    def render(job):
+        package, i = job
+        return dcc.render(package, _variables(i))
+
+    for package in ("default", "slurm"):
+        dcc.render(package)
+    misses = dcc.template_cache_info().misses
+    with ThreadPoolExecutor(8) as pool:
+        scripts = list(pool.map(render, jobs))
+    assert scripts == [_expected(package, i) for package, i in jobs]
+    assert dcc.get_active_package_name() == "default"
+    # the compiled templates are shared by the threads
+    assert dcc.template_cache_info().misses == misses
+
+
+def test_concurrent_first_rendering(dcc):
+    # no snapshots yet: threads race to build them
+    dcc["__internal"].package_snapshots = None
+    with ThreadPoolExecutor(8) as pool:
+        scripts = list(
+            pool.map(lambda i: dcc.render("slurm", _variables(i)), range(50))
+        )
+    assert scripts == [_expected("slurm", i) for i in range(50)]
@@ -0,0 +1,195 @@
+""" Tests for the render server and its client """
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from divvy import DivvyServer, ServerError
+from divvy.const import MANIFEST_FILENAME
+from divvy.server import request
+from tests.conftest import THIS_DIR
+
+
+@pytest.fixture
+def config_file(make_dcc, fake_sbatch):
+    dcc = make_dcc(
+        {
+            "default": {
+                "submission_template": "t.sub",
+                "submission_command": fake_sbatch,
+                "mem": "1G",
+            },
+            "local": {"submission_template": "l.sub", "submission_command": "sh"},
+        },
+        {
+            "t.sub": "#!/bin/bash\n#SBATCH --mem={MEM}\n{CODE}\n",
+            "l.sub": "#!/bin/bash\necho local\n{CODE}\n",
+        },
+    )
+    return dcc.config_file
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to around 100 characters
+    folder = tempfile.mkdtemp(prefix="divvy")
+    yield os.path.join(folder, "s.sock")
+    shutil.rmtree(folder)
+
+
+@pytest.fixture
+def server(socket_path, config_file):
+    srv = DivvyServer(socket_path, [config_file])
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+    thread.join()
+
+
+def test_ping(server):
+    assert request(server.socket_path, {"command": "ping"}) == {"ok": True}
+
+
+def test_write(server, tmpdir):
+    out = tmpdir.join("job.sub").strpath
+    response = request(
+        server.socket_path,
+        {"command": "write", "output": out, "variables": [{"code": "ls"}]},
+    )
+    assert response["script"] == out
+    with open(out) as f:
+        assert f.read() == "#!/bin/bash\n#SBATCH --mem=1G\nls\n"
+
+
+def test_socket_only_for_user(server):
+    assert os.stat(server.socket_path).st_mode & 0o777 == 0o600
+
+
+def test_incremental_writes_share_folder_manifest(socket_path, config_file, tmpdir):
+    srv = DivvyServer(socket_path, [config_file])
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    try:
+
+        def write(i):
+            message = {"command": "write", "incremental": True, "variables": []}
+            message["output"] = tmpdir.join("{}.sub".format(i)).strpath
+            return request(socket_path, message)["skipped"]
+
+        results = {}
+        threads = [
+            threading.Thread(target=lambda i=i: results.update({i: write(i)}))
+            for i in range(20)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == {i: 0 for i in range(20)}
+        assert [write(i) for i in range(20)] == [1] * 20
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        thread.join()
+    with open(tmpdir.join(MANIFEST_FILENAME).strpath) as f:
+        scripts = json.load(f)["scripts"]
+    assert sorted(scripts) == sorted("{}.sub".format(i) for i in range(20))
+
+
+def test_write_without_output_returns_content(server):
+    response = request(
+        server.socket_path,
+        {"command": "write", "package": "local", "variables": [{"code": "ls"}]},
+    )
+    assert response["content"] == "#!/bin/bash\necho local\nls\n"
+
+
+def test_packages_dont_leak_between_requests(server):
+    request(server.socket_path, {"command": "write", "package": "local"})
+    response = request(server.socket_path, {"command": "write"})
+    assert "--mem=1G" in response["content"]
+
+
+def test_submit(server, tmpdir):
+    out = tmpdir.join("42.sub").strpath
+    response = request(
+        server.socket_path,
+        {"command": "submit", "output": out, "variables": [{"code": "ls"}]},
+    )
+    assert response["job_id"] == "42"
+    assert response["returncode"] == 0
+
+
+def test_changed_config_is_reloaded(server, config_file):
+    with open(config_file, "a") as f:
+        f.write("    code: echo changed\n")
+    response = request(server.socket_path, {"command": "write", "package": "local"})
+    assert "echo changed" in response["content"]
+
+
+def test_failed_request(server):
+    with pytest.raises(ServerError, match="Unknown command"):
+        request(server.socket_path, {"command": "explode"})
+
+
+def test_unreachable_server(socket_path):
+    with pytest.raises(ServerError, match="Can't reach"):
+        request(socket_path, {"command": "ping"})
+
+
+def test_stale_socket_is_replaced(socket_path, config_file):
+    stale = DivvyServer(socket_path, [config_file])
+    stale.socket.close()  # the socket file is left behind
+    srv = DivvyServer(socket_path, [config_file])
+    srv.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_second_server_refused(server, config_file):
+    with pytest.raises(ServerError, match="running"):
+        DivvyServer(server.socket_path, [config_file])
+
+
+def _cli_write(config_file, out, socket_path, *args):
+    env = dict(os.environ, DIVVY_SOCKET=socket_path)
+    env["PYTHONPATH"] = os.path.dirname(THIS_DIR)
+    return subprocess.run(
+        [sys.executable, "-m", "divvy", "write", config_file, "-o", out]
+        + ["-p", "local", "-c", "code=hostname"]
+        + list(args),
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def test_cli_client(server, config_file, tmpdir):
+    out = tmpdir.join("cli.sub").strpath
+    assert _cli_write(config_file, out, server.socket_path).returncode == 0
+    with open(out) as f:
+        assert f.read() == "#!/bin/bash\necho local\nhostname\n"
+
+
+def test_cli_stale_socket_in_environment(socket_path, config_file, tmpdir):
+    out = tmpdir.join("cli.sub").strpath
+    proc = _cli_write(config_file, out, socket_path)
+    assert proc.returncode == 0
+    assert "rendering in this process instead" in proc.stderr
+    with open(out) as f:
+        assert f.read() == "#!/bin/bash\necho local\nhostname\n"
+
+
+def test_cli_unreachable_socket_option(socket_path, config_file, tmpdir):
+    out = tmpdir.join("cli.sub").strpath
+    proc = _cli_write(config_file, out, "", "--socket", socket_path)
+    assert proc.returncode == 1
+    assert "Can't reach divvy server" in proc.stderr
+    assert "Traceback" not in proc.stderr
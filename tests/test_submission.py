@@ -0,0 +1,102 @@
+""" Tests for concurrent job submission """
+
+import asyncio
+import pytest
+
+from divvy import parse_job_id, submit_scripts
+from divvy.submission import submission_argv
+
+
+@pytest.fixture
+def fake_slurm_dcc(make_dcc, fake_sbatch):
+    """Configuration with a SLURM package submitting with the fake sbatch"""
+    return make_dcc(
+        {
+            "default": {
+                "submission_template": "t.sub",
+                "submission_command": fake_sbatch,
+            }
+        },
+        {"t.sub": "#!/bin/bash\n{CODE}\n"},
+    )
+
+
+@pytest.mark.parametrize(
+    ["output", "job_id"],
+    [
+        ("Submitted batch job 4242\n", "4242"),
+        ('Your job 17 ("test") has been submitted\n', "17"),
+        ("Job <99> is submitted to default queue <normal>.\n", "99"),
+        ("nothing to see here", None),
+    ],
+)
+def test_parse_job_id(output, job_id):
+    assert parse_job_id(output) == job_id
+
+
+def test_shell_builtin_submission_command_runs_in_new_shell():
+    assert submission_argv(".", "job.sub") == ["sh", "job.sub"]
+    assert submission_argv("sbatch --test-only", "job.sub") == [
+        "sbatch",
+        "--test-only",
+        "job.sub",
+    ]
+
+
+def test_submit_scripts_in_order(tmpdir, fake_sbatch):
+    scripts = [tmpdir.join("{}.sub".format(i)).strpath for i in range(50)]
+    results = submit_scripts(fake_sbatch, scripts, max_in_flight=8)
+    assert [r.script for r in results] == scripts
+    assert [r.job_id for r in results] == [str(i) for i in range(50)]
+    assert all(r.ok for r in results)
+
+
+def test_submit_from_running_event_loop(tmpdir, fake_sbatch):
+    async def submit():
+        return submit_scripts(fake_sbatch, [tmpdir.join("1.sub").strpath])
+
+    loop = asyncio.new_event_loop()
+    try:
+        (result,) = loop.run_until_complete(submit())
+    finally:
+        loop.close()
+    assert result.job_id == "1"
+
+
+def test_local_submission_output_not_captured(tmpdir, capfd):
+    scripts = []
+    for i in range(3):
+        script = tmpdir.join("{}.sh".format(i))
+        # each script sees only its own mark, if they run one at a time
+        script.write(
+            "d={}\nls $d/*.running 2>/dev/null\ntouch $d/{}.running\n"
+            "sleep 0.1\nrm $d/{}.running\necho script {}\n".format(
+                tmpdir.strpath, i, i, i
+            )
+        )
+        scripts.append(script.strpath)
+    results = submit_scripts(".", scripts, max_in_flight=3)
+    assert [r.stdout for r in results] == ["", "", ""]
+    assert all(r.ok and r.job_id is None for r in results)
+    assert capfd.readouterr().out == "script 0\nscript 1\nscript 2\n"
+    (result,) = submit_scripts(".", scripts[:1], capture=True)
+    assert result.stdout == "script 0\n"
+
+
+def test_failed_submission_reported(tmpdir, fake_sbatch):
+    (result,) = submit_scripts(fake_sbatch, [tmpdir.join("bad.sub").strpath])
+    assert result.returncode == 1
+    assert "invalid partition" in result.stderr
+    assert result.job_id is None
+
+
+def test_missing_submission_command_reported(tmpdir):
+    (result,) = submit_scripts(tmpdir.join("nope").strpath, ["x.sub"])
+    assert not result.ok
+
+
+def test_configuration_submit(tmpdir, fake_slurm_dcc):
+    result = fake_slurm_dcc.submit(tmpdir.join("7.sub").strpath, {"code": "ls"})
+    assert result.job_id == "7"
+    with open(result.script) as f:
+        assert f.read() == "#!/bin/bash\nls\n"
@@ -0,0 +1,164 @@
+""" Tests for the compiled submission template """
+
+import glob
+import os
+import pytest
+
+from divvy import (
+    CacheInfo,
+    ComputingConfiguration,
+    SubmissionTemplate,
+    TemplateCache,
+    VariableScope,
+    write_submit_script,
+)
+from tests.conftest import DATA_DIR, THIS_DIR
+
+TEMPLATES = glob.glob(
+    os.path.join(THIS_DIR, "..", "divvy", "default_config", "divvy_templates", "*")
+) + glob.glob(os.path.join(DATA_DIR, "templates", "*.sub"))
+
+
+def _replace_render(content, data):
+    """The original one-replace-per-variable rendering, as a reference"""
+    for k, v in data.items():
+        content = content.replace("{" + str(k).upper() + "}", str(v))
+    return content
+
+
+POOLS = [
+    {},
+    {"code": "echo hi", "jobname": "j1", "mem": 4000, "cores": 2},
+    {"CODE": "a\nb", "mem": "1G", "MEM": "2G", "logfile": "x.log", "time": None},
+    {"partition": "standard", "unused": "nothing", 1: "one"},
+]
+
+
+@pytest.mark.parametrize("template_path", TEMPLATES)
+@pytest.mark.parametrize("data", POOLS)
+def test_render_matches_replace(template_path, data):
+    """Compiled rendering is byte-identical to sequential str.replace"""
+    with open(template_path, "r") as f:
+        content = f.read()
+    assert SubmissionTemplate(content).render(data) == _replace_render(content, data)
+
+
+@pytest.mark.parametrize(
+    ["content", "data", "expected"],
+    [
+        ("{A} and {B}", {"a": 1}, "1 and {B}"),
+        ("{{A}}", {"a": 1}, "{1}"),
+        ("${HOME}/{A}", {"a": "x"}, "${HOME}/x"),
+        ("{a}", {"a": 1}, "{a}"),
+        ("no slots", {"a": 1}, "no slots"),
+        ("{A}{A}", {"a": "z", "A": "y"}, "zz"),
+    ],
+)
+def test_render_edge_cases(content, data, expected):
+    assert SubmissionTemplate(content).render(data) == expected
+
+
+# Values that complete placeholders, which sequential replacement fills if
+# their key comes later in the pool
+PLACEHOLDER_POOLS = [
+    {"jobname": "{MEM}_job", "mem": "2G", "code": "echo {JOBNAME} {CORES}"},
+    {"code": "{", "jobname": "MEM}", "mem": "4G", "cores": "{CODE}"},
+    {"jobname": "MEM", "mem": "8G", "logfile": "{LOGFILE}"},
+]
+
+
+@pytest.mark.parametrize("template_path", TEMPLATES)
+@pytest.mark.parametrize("data", PLACEHOLDER_POOLS)
+def test_render_rescans_like_replace(template_path, data, tmpdir):
+    """Placeholders within substituted values are filled as before"""
+    with open(template_path, "r") as f:
+        content = f.read()
+    expected = _replace_render(content, data)
+    template = SubmissionTemplate(content)
+    assert template.render(data) == expected
+    path = tmpdir.join("out.sub").strpath
+    write_submit_script(path, template, data)
+    with open(path) as f:
+        assert f.read() == expected
+
+
+@pytest.mark.parametrize(
+    "content", ["{{JOBNAME}}", "x {y {JOBNAME} z}", "{{CODE}{JOBNAME}}", "{\n{CODE}\n}"]
+)
+@pytest.mark.parametrize("data", PLACEHOLDER_POOLS + [{"code": "MEM", "mem": "1G"}])
+def test_render_within_braces_like_replace(content, data):
+    assert SubmissionTemplate(content).render(data) == _replace_render(content, data)
+
+
+def test_slot_names_in_order():
+    t = SubmissionTemplate("{B} {A} {B} ${C}")
+    assert t.slot_names == ["B", "A", "C"]
+
+
+def test_iter_parts():
+    assert list(SubmissionTemplate("a {B}{c}").iter_parts()) == [
+        ("a ", None),
+        ("{B}", "B"),
+        ("", None),
+        ("{c}", "c"),
+        ("", None),
+    ]
+
+
+def test_variable_scope_order_matches_successive_updates():
+    layers = [{"mem": "first", "code": "ls"}, {"MEM": "x", "Mem": "y", "cores": 2}]
+    scope = VariableScope(*layers)
+    updated = {}
+    for layer in reversed(layers):
+        updated.update(layer)
+    assert list(scope) == list(updated) == ["MEM", "Mem", "cores", "mem", "code"]
+    assert dict(scope.items()) == updated
+    assert SubmissionTemplate("{MEM}").render(scope) == "x"
+
+
+def test_write_submit_script_accepts_compiled(tmpdir):
+    t = SubmissionTemplate("#!/bin/bash\n{CODE}\n")
+    fp = write_submit_script(tmpdir.join("s.sub").strpath, t, {"code": "ls"})
+    with open(fp, "r") as f:
+        assert f.read() == "#!/bin/bash\nls\n"
+
+
+class TestTemplateCache:
+    def test_hits_and_misses(self, tmpdir):
+        path = tmpdir.join("t.sub")
+        path.write("{CODE}")
+        cache = TemplateCache()
+        t1 = cache.get(path.strpath)
+        t2 = cache.get(path.strpath)
+        assert t1 is t2
+        assert cache.info() == CacheInfo(1, 1, cache.maxsize, 1)
+
+    def test_edited_template_is_reread(self, tmpdir):
+        path = tmpdir.join("t.sub")
+        path.write("{CODE}")
+        cache = TemplateCache()
+        cache.get(path.strpath)
+        path.write("#!/bin/bash\n{CODE}")
+        assert cache.get(path.strpath).content == "#!/bin/bash\n{CODE}"
+        assert cache.info().misses == 2
+
+    def test_least_recently_used_evicted(self, tmpdir):
+        cache = TemplateCache(maxsize=2)
+        paths = []
+        for i in range(3):
+            p = tmpdir.join("{}.sub".format(i))
+            p.write(str(i))
+            paths.append(p.strpath)
+            cache.get(p.strpath)
+        assert len(cache) == 2
+        assert paths[0] not in cache
+        assert paths[2] in cache
+
+    def test_configuration_reads_template_once(self, tmpdir):
+        dcc = ComputingConfiguration()
+        dcc.activate_package("slurm")
+        for i in range(3):
+            dcc.write_script(tmpdir.join("{}.sub".format(i)).strpath, {})
+        info = dcc.template_cache_info()
+        assert info.misses == 1
+        assert info.hits == 2
@@ -0,0 +1,228 @@
+""" Tests for throttled, resumable submission """
+
+import os
+import re
+import subprocess
+import sys
+import time
+
+import pytest
+
+from divvy.submission import SubmissionResult
+from divvy.throttle import (
+    CommandProbe,
+    SubmissionJournal,
+    SubmissionThrottle,
+    TokenBucket,
+    default_probe,
+)
+
+
+def _scripts(folder, names):
+    return [folder.join(n + ".sub").strpath for n in names]
+
+
+def _lines(path):
+    return path.read().split() if path.check() else []
+
+
+def test_token_bucket():
+    now = [0.0]
+    bucket = TokenBucket(2, burst=3, clock=lambda: now[0])
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    now[0] = 1.0
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0.5]
+
+
+def test_token_bucket_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_retry_delay_backs_off_exponentially():
+    throttle = SubmissionThrottle(backoff=1, max_backoff=10)
+    for attempt, delay in enumerate([1, 2, 4, 8, 10, 10]):
+        assert delay / 2 <= throttle.retry_delay(attempt) <= delay
+
+
+@pytest.mark.parametrize(
+    ["stderr", "transient"],
+    [
+        ("sbatch: error: Socket timed out on send/recv operation", True),
+        ("sbatch: error: Slurm temporarily unable to accept job", True),
+        ("sbatch: error: QOSMaxSubmitJobPerUserLimit", True),
+        ("sbatch: error: invalid partition specified", False),
+    ],
+)
+def test_transient_errors(stderr, transient):
+    result = SubmissionResult("a.sub", ["sbatch"], 1, "", stderr, None, 0.1)
+    assert SubmissionThrottle().is_transient(result) is transient
+
+
+def test_transient_failures_are_retried(fake_scheduler):
+    throttle = SubmissionThrottle(backoff=0.01)
+    scripts = _scripts(fake_scheduler, ["flaky1", "2", "bad3"])
+    results = throttle.submit(fake_scheduler.join("sbatch").strpath, scripts)
+    assert [r.ok for r in results] == [True, True, False]
+    assert [r.job_id for r in results] == ["1", "2", None]
+    assert sorted(_lines(fake_scheduler.join("submitted"))) == ["2", "flaky1"]
+
+
+def test_retries_run_out(fake_scheduler):
+    throttle = SubmissionThrottle(retries=0, backoff=0.01)
+    (result,) = throttle.submit(
+        fake_scheduler.join("sbatch").strpath, _scripts(fake_scheduler, ["flaky1"])
+    )
+    assert not result.ok
+    assert "timed out" in result.stderr
+
+
+def test_rate_limit(fake_scheduler):
+    throttle = SubmissionThrottle(rate=20)
+    start = time.monotonic()
+    results = throttle.submit(
+        fake_scheduler.join("sbatch").strpath, _scripts(fake_scheduler, "12345")
+    )
+    assert all(r.ok for r in results)
+    # the first submission goes through at once, the others 1/20 s apart
+    assert time.monotonic() - start >= 0.19
+
+
+def test_queue_depth_limit(fake_scheduler):
+    throttle = SubmissionThrottle(
+        max_queued=3,
+        probe=CommandProbe(fake_scheduler.join("squeue").strpath),
+        probe_interval=0.02,
+    )
+    names = [str(i) for i in range(12)]
+    results = throttle.submit(
+        fake_scheduler.join("sbatch").strpath, _scripts(fake_scheduler, names)
+    )
+    assert all(r.ok for r in results)
+    depths = [int(d) for d in _lines(fake_scheduler.join("depths"))]
+    assert len(depths) == 12
+    assert max(depths) <= 3
+
+
+def test_queue_limit_needs_probe(fake_scheduler):
+    with pytest.raises(ValueError):
+        SubmissionThrottle(max_queued=3).submit(
+            fake_scheduler.join("fake").strpath, _scripts(fake_scheduler, ["1"])
+        )
+
+
+def test_default_probe():
+    assert re.match(
+        r"squeue --noheader --user \S+ --format %i",
+        default_probe("sbatch -p x").command,
+    )
+    assert default_probe("qsub") is None
+
+
+def test_failed_probe():
+    assert CommandProbe("/nonexistent/squeue")() is None
+
+
+def test_journal_skips_submitted_scripts(fake_scheduler):
+    journal = fake_scheduler.join("journal.jsonl").strpath
+    sbatch = fake_scheduler.join("sbatch").strpath
+    scripts = _scripts(fake_scheduler, ["1", "bad2", "3"])
+    first = SubmissionThrottle(journal=journal).submit(sbatch, scripts)
+    assert [r.ok for r in first] == [True, False, True]
+    again = SubmissionThrottle(journal=journal).submit(sbatch, scripts)
+    assert [r.ok for r in again] == [True, False, True]
+    assert [r.job_id for r in again] == ["1", None, "3"]
+    assert again[0].command is None
+    assert sorted(_lines(fake_scheduler.join("submitted"))) == ["1", "3"]
+
+
+def test_resume_interrupted_run(fake_scheduler):
+    path = fake_scheduler.join("journal.jsonl").strpath
+    scripts = _scripts(fake_scheduler, ["1", "2", "3"])
+    journal = SubmissionJournal(path)
+    journal.enqueue(scripts)
+    journal.record(SubmissionResult(scripts[0], ["sbatch"], 0, "", "", "1", 0.1))
+    # the interruption left half a record behind
+    with open(path, "a") as f:
+        f.write('{"script": "')
+    throttle = SubmissionThrottle(journal=path)
+    assert throttle.journal.pending() == scripts[1:]
+    results = throttle.resume(fake_scheduler.join("sbatch").strpath)
+    assert [r.job_id for r in results] == ["2", "3"]
+    assert throttle.journal.pending() == []
+    assert SubmissionJournal(path).pending() == []
+
+
+def test_resume_needs_journal():
+    with pytest.raises(ValueError):
+        SubmissionThrottle().resume("sbatch")
+
+
+def test_configuration_submits_through_throttle(fake_scheduler, make_dcc):
+    dcc = make_dcc(
+        {
+            "default": {
+                "submission_template": "t.sub",
+                "submission_command": fake_scheduler.join("sbatch").strpath,
+            }
+        },
+        {"t.sub": "#!/bin/bash\n{CODE}\n"},
+    )
+    scripts = dcc.write_scripts(
+        [(p, {"code": "ls"}) for p in _scripts(fake_scheduler, ["flaky4", "5"])]
+    )
+    throttle = SubmissionThrottle(rate=100, backoff=0.01)
+    results = dcc.submit_scripts(scripts, throttle=throttle)
+    assert [r.job_id for r in results] == ["4", "5"]
+
+
+def _cli_submit(dcc, *args):
+    return subprocess.run(
+        [sys.executable, "-m", "divvy", "submit", dcc.config_file, "-p", "fake"]
+        + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=dict(os.environ, DIVVY_LEDGER="", DIVVY_SOCKET=""),
+    )
+
+
+@pytest.fixture
+def fake_dcc(fake_scheduler, make_dcc):
+    return make_dcc(
+        {
+            "fake": {
+                "submission_template": "t.sub",
+                "submission_command": fake_scheduler.join("sbatch").strpath,
+            }
+        },
+        {"t.sub": "#!/bin/bash\n{CODE}\n"},
+    )
+
+
+def test_cli_submit_throttled(fake_scheduler, fake_dcc):
+    journal = fake_scheduler.join("journal.jsonl").strpath
+    script = fake_scheduler.join("flaky6.sub").strpath
+    args = ["-o", script, "--journal", journal, "-c", "code=ls"]
+    first = _cli_submit(fake_dcc, *args)
+    assert first.returncode == 0, first.stderr
+    again = _cli_submit(fake_dcc, *args)
+    assert again.returncode == 0, again.stderr
+    assert _lines(fake_scheduler.join("submitted")) == ["flaky6"]
+
+
+def test_cli_array_not_throttled(fake_scheduler, fake_dcc):
+    tasks = fake_scheduler.join("tasks.csv")
+    tasks.write("code\nls\n")
+    proc = _cli_submit(
+        fake_dcc,
+        "-o",
+        fake_scheduler.join("a.sub").strpath,
+        "--array",
+        tasks.strpath,
+        "--rate",
+        "1",
+    )
+    assert proc.returncode == 2
+    assert "don't apply to it" in proc.stderr
@@ -0,0 +1,239 @@
+""" Tests for buffered, atomic and bundled writing of submission scripts """
+
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tarfile
+
+import pytest
+
+from divvy import BundleWriter, ScriptWriter
+
+
+@pytest.fixture
+def dcc(make_dcc):
+    return make_dcc(
+        {
+            "default": {
+                "submission_template": "t.sub",
+                "submission_command": "sh",
+                "mem": "1G",
+            }
+        },
+        {"t.sub": "#!/bin/bash\n#SBATCH --mem={MEM}\n{CODE}\n"},
+    )
+
+
+@pytest.fixture
+def makedirs_calls(monkeypatch):
+    calls = []
+    makedirs = os.makedirs
+
+    def counting(path, *args, **kwargs):
+        calls.append(path)
+        return makedirs(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "makedirs", counting)
+    return calls
+
+
+def _jobs(folder, n=6):
+    return [
+        (
+            os.path.join(folder, "d{}".format(i % 2), "{}.sub".format(i)),
+            {"code": "run {}".format(i)},
+        )
+        for i in range(n)
+    ]
+
+
+def test_folders_are_checked_once(tmpdir, makedirs_calls):
+    tmpdir.mkdir("a")
+    writer = ScriptWriter()
+    for i in range(4):
+        path = tmpdir.join("a", "b", "{}.sub".format(i)).strpath
+        assert writer.write(path, "x{}".format(i)) == path
+        assert tmpdir.join("a", "b", "{}.sub".format(i)).read() == "x{}".format(i)
+    assert makedirs_calls == [tmpdir.join("a", "b").strpath]
+
+
+def test_removed_folder_is_recreated(tmpdir):
+    writer = ScriptWriter()
+    writer.write(tmpdir.join("a", "1.sub").strpath, "1")
+    tmpdir.join("a").remove()
+    writer.write(tmpdir.join("a", "2.sub").strpath, "2")
+    assert tmpdir.join("a", "2.sub").read() == "2"
+
+
+def test_buffered_writes_wait_for_flush(tmpdir):
+    writer = ScriptWriter(buffer=3)
+    paths = [tmpdir.join("d{}".format(i % 2), "{}".format(i)).strpath for i in range(4)]
+    for path in paths[:2]:
+        writer.write(path, "x")
+    assert not any(os.path.exists(p) for p in paths)
+    writer.write(paths[2], "x")
+    assert all(os.path.exists(p) for p in paths[:3])
+    writer.write(paths[3], "x")
+    assert not os.path.exists(paths[3])
+    with writer:
+        pass
+    assert os.path.exists(paths[3])
+
+
+def test_atomic_writes(tmpdir):
+    writer = ScriptWriter(atomic=True)
+    path = tmpdir.join("a.sub").strpath
+    writer.write(path, "old")
+    writer.write(path, "new")
+    assert tmpdir.join("a.sub").read() == "new"
+    with pytest.raises(TypeError):
+        writer.write(path, None)
+    assert tmpdir.join("a.sub").read() == "new"
+    assert tmpdir.listdir() == [tmpdir.join("a.sub")]
+
+
+def test_fsync_syncs_each_folder_once_per_flush(tmpdir, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+    writer = ScriptWriter(buffer=100, atomic=True, fsync=True)
+    for path, _ in _jobs(tmpdir.strpath):
+        writer.write(path, "x")
+    assert synced == []
+    writer.flush()
+    # six scripts in two folders
+    assert len(synced) == 8
+    writer.flush()
+    assert len(synced) == 8
+
+
+def test_pickling(tmpdir):
+    writer = pickle.loads(pickle.dumps(ScriptWriter(atomic=True)))
+    writer.write(tmpdir.join("a.sub").strpath, "x")
+    assert tmpdir.join("a.sub").read() == "x"
+    writer = ScriptWriter(buffer=10)
+    writer.write(tmpdir.join("b.sub").strpath, "x")
+    with pytest.raises(TypeError):
+        pickle.dumps(writer)
+
+
+@pytest.mark.parametrize("ext", [".tar", ".tar.gz", ".tgz", ".tar.xz"])
+def test_tar_bundle(tmpdir, ext):
+    path = tmpdir.join("scripts" + ext).strpath
+    with BundleWriter(path, root=tmpdir.strpath) as writer:
+        assert writer.format == "tar"
+        assert writer.write(tmpdir.join("out", "a.sub").strpath, "A") == "out/a.sub"
+        writer.write(tmpdir.join("b.sub").strpath, "B")
+        assert not os.path.exists(path)
+    assert writer.closed and writer.count == 2
+    with tarfile.open(path) as tar:
+        assert tar.getnames() == ["out/a.sub", "b.sub"]
+        assert tar.extractfile("out/a.sub").read() == b"A"
+    assert sorted(os.listdir(tmpdir.strpath)) == ["scripts" + ext]
+    with pytest.raises(ValueError):
+        writer.write("c.sub", "C")
+
+
+def test_jsonl_shard(tmpdir):
+    path = tmpdir.join("shard.jsonl").strpath
+    with BundleWriter(path) as writer:
+        assert writer.write("/abs/a.sub", "A\n") == "abs/a.sub"
+        writer.write("b.sub", "B")
+    with open(path) as f:
+        assert [json.loads(line) for line in f] == [
+            {"path": "abs/a.sub", "content": "A\n"},
+            {"path": "b.sub", "content": "B"},
+        ]
+
+
+def test_failed_bundle_is_discarded(tmpdir):
+    path = tmpdir.join("scripts.tar")
+    path.write("previous")
+    with pytest.raises(RuntimeError):
+        with BundleWriter(path.strpath) as writer:
+            writer.write("a.sub", "A")
+            raise RuntimeError()
+    assert path.read() == "previous"
+    assert tmpdir.listdir() == [path]
+
+
+def test_unknown_bundle_format(tmpdir):
+    with pytest.raises(ValueError):
+        BundleWriter(tmpdir.join("scripts.zip").strpath)
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_write_scripts_buffered(dcc, tmpdir, workers):
+    jobs = _jobs(tmpdir.strpath, 20)
+    writer = ScriptWriter(buffer=7, atomic=True)
+    paths = dcc.write_scripts(jobs, workers=workers, writer=writer)
+    assert paths == [path for path, _ in jobs]
+    for i, (path, _) in enumerate(jobs):
+        with open(path) as f:
+            assert f.read() == "#!/bin/bash\n#SBATCH --mem=1G\nrun {}\n".format(i)
+
+
+def test_write_scripts_to_bundle(dcc, tmpdir):
+    jobs = _jobs("out", 4)
+    bundle = tmpdir.join("scripts.tar").strpath
+    with BundleWriter(bundle) as writer:
+        names = dcc.write_scripts(jobs, workers=2, writer=writer)
+    assert names == [path for path, _ in jobs]
+    assert not tmpdir.join("out").check()
+    with tarfile.open(bundle) as tar:
+        assert sorted(tar.getnames()) == sorted(names)
+        assert tar.extractfile(names[3]).read().decode().endswith("run 3\n")
+
+
+def test_stream_scripts_to_bundle(dcc, tmpdir):
+    bundle = tmpdir.join("scripts.jsonl").strpath
+    with BundleWriter(bundle) as writer:
+        names = list(
+            dcc.stream_scripts(
+                ({"jobname": "j{}".format(i), "code": i} for i in range(3)),
+                "{JOBNAME}.sub",
+                writer=writer,
+            )
+        )
+    assert names == ["j0.sub", "j1.sub", "j2.sub"]
+    with open(bundle) as f:
+        assert len(f.readlines()) == 3
+
+
+def test_buffered_writer_restrictions(dcc, tmpdir):
+    jobs = _jobs(tmpdir.strpath, 2)
+    with pytest.raises(ValueError):
+        dcc.write_scripts(jobs, incremental=True, writer=ScriptWriter(buffer=5))
+    with BundleWriter(tmpdir.join("s.tar").strpath) as writer:
+        with pytest.raises(ValueError):
+            dcc.write_scripts(jobs, workers=2, backend="process", writer=writer)
+    # writing right away works with either
+    dcc.write_scripts(jobs, incremental=True, writer=ScriptWriter(atomic=True))
+
+
+def test_cli_bundle(dcc, tmpdir):
+    stream = tmpdir.join("jobs.jsonl")
+    stream.write('{"jobname": "a", "code": "x"}\n{"jobname": "b", "code": "y"}\n')
+    bundle = tmpdir.join("scripts.tar.gz").strpath
+    subprocess.check_call(
+        [
+            sys.executable,
+            "-m",
+            "divvy",
+            "write",
+            dcc.config_file,
+            "--stream",
+            stream.strpath,
+            "-o",
+            "sub/{JOBNAME}.sub",
+            "--bundle",
+            bundle,
+        ],
+        cwd=tmpdir.strpath,
+        env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(__file__))),
+    )
+    with tarfile.open(bundle) as tar:
+        assert tar.getnames() == ["sub/a.sub", "sub/b.sub"]
+    assert not tmpdir.join("sub").check()